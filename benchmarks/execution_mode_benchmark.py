@@ -0,0 +1,127 @@
+"""
+Execution mode benchmark for PySync DJ.
+
+Compares the "process" and "thread" worker pool execution modes by running simulated tracks through each. A simulated
+track is sent with the same payload as a real one (a full Spotify track dict and the worker context holding the
+settings, track index, locks and event queue), waits on the network for a fixed time, then logs and updates the track
+index the way a real track does. The difference between the modes is therefore the cost of the execution model
+itself: pickling, proxy round trips and process scheduling.
+
+Run from the repository root:
+
+    python benchmarks/execution_mode_benchmark.py
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pysync_dj"))
+
+from cancellation import CancellationToken  # noqa: E402
+from event_queue import EventQueueLogger  # noqa: E402
+from track_processor import WorkerContext  # noqa: E402
+from worker_pool import WorkerPool  # noqa: E402
+
+SETTINGS = {
+    "dj_library_drive": "E:\\",
+    "tracks_folder": "PySync DJ Tracks",
+    "serato_subcrate_dir": "_Serato_\\Subcrates",
+    "rekordbox_playlist_folder": "Rekordbox Playlist Import Files",
+    "download_workers": {"search": 8, "download": 8, "transcode": 2},
+    "playlists_to_download": {f"Playlist {index}": "2rBDG7m5QcjM3OjHyorkMZ" for index in range(20)},
+}
+
+
+def create_track_data(index: int) -> dict:
+    """Build a track dict the size and shape of a Spotify playlist item."""
+    artist = {"name": f"Artist {index}", "id": f"artist{index:016d}", "type": "artist",
+              "external_urls": {"spotify": f"https://open.spotify.com/artist/artist{index:016d}"}}
+    return {
+        "added_at": "2024-01-01T00:00:00Z",
+        "track": {
+            "id": f"track{index:017d}",
+            "name": f"Track {index}",
+            "popularity": 50,
+            "duration_ms": 215000,
+            "artists": [artist, artist],
+            "album": {"name": f"Album {index}", "artists": [artist],
+                      "images": [{"url": f"https://i.scdn.co/image/{index:040d}", "height": size, "width": size}
+                                 for size in (640, 300, 64)]},
+            "available_markets": ["GB", "US", "DE", "FR", "NL", "ES", "IT", "SE", "NO", "DK"] * 18,
+            "external_ids": {"isrc": f"GB{index:010d}"},
+        },
+    }
+
+
+def simulated_track(track_data: dict, context: WorkerContext, network_wait: float) -> str:
+    """
+    Stand in for process_track which waits instead of searching and downloading.
+
+    :param track_data: Track data from the Spotify API.
+    :param context: State shared by every track in the sync.
+    :param network_wait: Seconds to spend "on the network".
+    :return: The track's simulated file path.
+    """
+    event_logger = EventQueueLogger(context.event_queue)
+    event_logger.info(f"Downloading track: \"{track_data['track']['name']}\"")
+
+    with context.stage_limiters["search"]:
+        time.sleep(network_wait / 2)
+    with context.stage_limiters["download"]:
+        time.sleep(network_wait / 2)
+
+    track_file_path = os.path.join(context.settings["tracks_folder"], f"{track_data['track']['name']}.mp3")
+    with context.lock:
+        context.id_to_video_map[track_data["track"]["id"]] = track_file_path
+    return track_file_path
+
+
+def run_mode(execution_mode: str, tracks: list[dict], workers: int, network_wait: float) -> float:
+    """
+    Run the simulated tracks through a warm worker pool in the given execution mode.
+
+    :return: The wall clock time taken, in seconds.
+    """
+    manager = multiprocessing.Manager()
+    event_queue = manager.Queue()
+    pool = WorkerPool(manager, workers, execution_mode)
+    try:
+        pool.warm_up()
+        context = pool.create_context(SETTINGS, event_queue, pool.create_stage_limiters(SETTINGS["download_workers"]),
+                                      CancellationToken(pool.create_event(), pool.create_event()))
+
+        start = time.perf_counter()
+        futures = [pool.executor.submit(simulated_track, track, context, network_wait) for track in tracks]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+    finally:
+        pool.shutdown()
+        manager.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the process and thread execution modes.")
+    parser.add_argument("--tracks", type=int, default=200, help="Number of simulated tracks.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of track workers.")
+    parser.add_argument("--network-wait", type=float, default=0.05, help="Seconds each track waits on the network.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs to take the median of.")
+    args = parser.parse_args()
+
+    tracks = [create_track_data(index) for index in range(args.tracks)]
+    ideal_time = args.tracks * args.network_wait / args.workers
+    print(f"{args.tracks} tracks, {args.workers} workers, ideal time {ideal_time:.2f}s")
+
+    for execution_mode in ("process", "thread"):
+        elapsed = statistics.median(run_mode(execution_mode, tracks, args.workers, args.network_wait)
+                                    for _ in range(args.repeat))
+        overhead_ms = (elapsed - ideal_time) / args.tracks * args.workers * 1000
+        print(f"{execution_mode:>8}: {elapsed:.2f}s, {args.tracks / elapsed:.1f} tracks/s, "
+              f"~{overhead_ms:.1f} ms overhead per track")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Startup benchmark for PySync DJ.
+
+Measures the import cost of the GUI entry point and of a track-processing worker using ``python -X importtime``,
+the time it takes for the UI window to appear, and the cost of spawning a worker process that imports what track
+processing needs.
+
+Run from the repository root:
+
+    python benchmarks/startup_benchmark.py
+"""
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pysync_dj")
+
+IMPORT_TARGETS = {
+    "GUI entry point": "pysync_dj_main",
+    "UI window": "ui_elements.ui_main",
+    "Track worker": "track_processor",
+}
+
+TIME_TO_WINDOW_SCRIPT = """
+import time
+start = time.perf_counter()
+import queue
+from ui_elements.ui_main import UIMain
+ui = UIMain(queue.Queue())
+ui.app.update()
+print(time.perf_counter() - start)
+ui.app.destroy()
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """
+    Parse the output of ``python -X importtime``.
+
+    :param stderr: The stderr output of the interpreter.
+    :return: A list of (module, self time in us, cumulative time in us) tuples.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative_time, module = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level after the single separating space
+        imports.append((module[1:].rstrip(), int(self_time), int(cumulative_time)))
+    return imports
+
+
+def measure_import_time(module: str) -> tuple[float, list[tuple[str, int, int]]]:
+    """
+    Import a module in a fresh interpreter and measure its cumulative import time.
+
+    :param module: The module to import.
+    :return: The cumulative import time in seconds and the parsed per-module import times.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=SOURCE_DIR, capture_output=True, text=True, check=True)
+    imports = parse_importtime(result.stderr)
+    cumulative_time = next(cumulative for name, _, cumulative in reversed(imports) if name == module)
+    return cumulative_time / 1e6, imports
+
+
+def measure_time_to_window() -> Optional[float]:
+    """
+    Measure the time from interpreter start to the UI window being drawn.
+
+    :return: Time in seconds, or None if no display is available.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", TIME_TO_WINDOW_SCRIPT],
+                            cwd=SOURCE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return time.perf_counter() - start
+
+
+def import_worker_modules() -> float:
+    """Import what a track worker needs, returning how long the imports took."""
+    start = time.perf_counter()
+    import track_processor  # noqa: F401
+    return time.perf_counter() - start
+
+
+def measure_worker_spawn() -> tuple[float, float]:
+    """
+    Spawn a single worker process and run a track-processing import in it.
+
+    :return: Total spawn-to-ready time and the worker-side import time, both in seconds.
+    """
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1,
+                                                mp_context=multiprocessing.get_context("spawn")) as executor:
+        import_time = executor.submit(import_worker_modules).result()
+        return time.perf_counter() - start, import_time
+
+
+def print_top_imports(imports: list[tuple[str, int, int]], module: str, top_n: int) -> None:
+    """List the slowest direct imports of the benchmarked module."""
+    direct_imports = []
+    for name, self_time, cumulative_time in imports:
+        if name == module:
+            break
+        if not name.startswith(" "):
+            direct_imports = []  # Children are listed before their parent, so reset at every top level import
+        elif not name.startswith("   "):
+            direct_imports.append((name.strip(), cumulative_time))
+
+    for name, cumulative_time in sorted(direct_imports, key=lambda item: item[1], reverse=True)[:top_n]:
+        print(f"    {cumulative_time / 1000:8.1f} ms  {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark PySync DJ start up time.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs to take the median of.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest direct imports to list.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, SOURCE_DIR)
+    os.chdir(SOURCE_DIR)
+
+    for label, module in IMPORT_TARGETS.items():
+        runs = [measure_import_time(module) for _ in range(args.repeat)]
+        print(f"{label} ({module}): {statistics.median(total for total, _ in runs) * 1000:.1f} ms import time")
+        print_top_imports(runs[-1][1], module, args.top)
+
+    window_times = [measure_time_to_window() for _ in range(args.repeat)]
+    if None in window_times:
+        print("Time to window: skipped, no display available")
+    else:
+        print(f"Time to window: {statistics.median(window_times) * 1000:.1f} ms")
+
+    spawn_runs = [measure_worker_spawn() for _ in range(args.repeat)]
+    print(f"Worker spawn: {statistics.median(total for total, _ in spawn_runs) * 1000:.1f} ms total, "
+          f"{statistics.median(imports for _, imports in spawn_runs) * 1000:.1f} ms importing track processing")
+
+
+if __name__ == "__main__":
+    main()
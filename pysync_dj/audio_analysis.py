@@ -0,0 +1,332 @@
+import argparse
+import concurrent.futures
+import logging
+import os
+import subprocess
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from utils import LOGGER_NAME, load_hashmap_from_json, VIDEO_INDEX_FILE
+
+SAMPLE_RATE = 44100
+
+# ReplayGain 2.0 plays every track at -18 LUFS
+REPLAY_GAIN_REFERENCE = -18.0
+REPLAY_GAIN_TAGS = ("REPLAYGAIN_TRACK_GAIN", "REPLAYGAIN_TRACK_PEAK")
+
+# BS.1770 gating: 400ms blocks overlapping by 75%, measured as four 100ms sub-blocks each
+SUB_BLOCK_SECONDS = 0.1
+SUB_BLOCKS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Onset envelope frames, about 11.6ms apart, and the tempo range DJ tracks are folded into
+ONSET_FRAME_SIZE = 1024
+ONSET_HOP = 512
+MIN_BPM = 70
+MAX_BPM = 180
+PREFERRED_BPM = 120
+# The least autocorrelation of the onset envelope at the beat period, relative to its energy, for a beat to be found
+MIN_BEAT_STRENGTH = 0.1
+
+# Frames transformed at once, bounding memory use on long tracks
+FFT_BATCH = 2048
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class TrackAnalysis(NamedTuple):
+    """A track's tempo and loudness."""
+    bpm: Optional[float]
+    loudness: float
+    replay_gain: float
+    peak: float
+
+
+def decode_audio(file_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode an audio file once into a buffer, using the ffmpeg binary moviepy already depends on.
+
+    :param file_path: The audio file.
+    :param sample_rate: The sample rate to decode at.
+    :return: The samples as float32, shaped (samples, 2).
+    """
+    import imageio_ffmpeg
+
+    result = subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), "-v", "error", "-i", file_path,
+                             "-f", "f32le", "-ac", "2", "-ar", str(sample_rate), "-"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, 2)
+
+
+def frame_signal(signal: np.ndarray, frame_size: int, hop: int) -> np.ndarray:
+    """
+    View a signal as frames, without copying it.
+
+    :return: The frames, shaped (frames, frame_size). Samples after the last full frame are dropped.
+    """
+    if len(signal) < frame_size:
+        return np.empty((0, frame_size), dtype=signal.dtype)
+    return np.lib.stride_tricks.sliding_window_view(signal, frame_size)[::hop]
+
+
+def biquad_power_response(b: tuple, a: tuple, frequencies: np.ndarray, sample_rate: int) -> np.ndarray:
+    """The squared magnitude response of a biquad filter at the given frequencies."""
+    z = np.exp(-1j * 2 * np.pi * frequencies / sample_rate)
+    numerator = b[0] + b[1] * z + b[2] * z ** 2
+    denominator = a[0] + a[1] * z + a[2] * z ** 2
+    return np.abs(numerator / denominator) ** 2
+
+
+def k_weighting(frequencies: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    The BS.1770 K-weighting power response, a high shelf modelling the head followed by a high pass, designed for the
+    sample rate rather than using the 48kHz coefficients.
+    """
+    # High shelf, +4dB above about 1.7kHz
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    gain = 10 ** (3.999843853973347 / 20)
+    q = 0.7071752369554196
+    vb = gain ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = ((gain + vb * k / q + k * k) / a0, 2 * (k * k - gain) / a0, (gain - vb * k / q + k * k) / a0)
+    shelf_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    # High pass at about 38Hz
+    k = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass_b = (1.0, -2.0, 1.0)
+    high_pass_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    return (biquad_power_response(shelf_b, shelf_a, frequencies, sample_rate)
+            * biquad_power_response(high_pass_b, high_pass_a, frequencies, sample_rate))
+
+
+def integrated_loudness(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> float:
+    """
+    Measure the integrated loudness of audio, as in ITU-R BS.1770. Each 100ms sub-block is K-weighted in the frequency
+    domain, where its weighted mean square is the sum of its power spectrum times the filter's power response, so the
+    whole track is filtered with batched FFTs instead of sample by sample.
+
+    :param samples: The samples, shaped (samples, channels).
+    :param sample_rate: The sample rate.
+    :return: The loudness in LUFS, or -inf for silence.
+    """
+    sub_block_size = int(sample_rate * SUB_BLOCK_SECONDS)
+    frequencies = np.fft.rfftfreq(sub_block_size, 1 / sample_rate)
+    # Parseval's weights for a real FFT, counting every bin but DC and Nyquist twice
+    bin_weights = np.full(len(frequencies), 2.0)
+    bin_weights[0] = 1
+    if sub_block_size % 2 == 0:
+        bin_weights[-1] = 1
+    weights = k_weighting(frequencies, sample_rate) * bin_weights / (sub_block_size * sub_block_size)
+
+    sub_block_count = len(samples) // sub_block_size
+    sub_block_power = np.zeros(sub_block_count)
+    for channel in range(samples.shape[1]):
+        sub_blocks = samples[:sub_block_count * sub_block_size, channel].reshape(sub_block_count, sub_block_size)
+        for start in range(0, sub_block_count, FFT_BATCH):
+            spectrum = np.fft.rfft(sub_blocks[start:start + FFT_BATCH], axis=1)
+            sub_block_power[start:start + FFT_BATCH] += (np.abs(spectrum) ** 2) @ weights
+
+    if sub_block_count < SUB_BLOCKS_PER_BLOCK:
+        return float("-inf")
+    # Each 400ms block is the mean of four consecutive sub-blocks
+    block_power = np.convolve(sub_block_power, np.full(SUB_BLOCKS_PER_BLOCK, 1 / SUB_BLOCKS_PER_BLOCK), "valid")
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+
+    gated = block_power[block_loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = block_power[(block_loudness > ABSOLUTE_GATE) & (block_loudness > relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def onset_envelope(signal: np.ndarray) -> np.ndarray:
+    """
+    The onset strength of each frame: the rise in log magnitude across every frequency since the frame before.
+
+    :param signal: Mono samples.
+    :return: One value per frame, ONSET_HOP samples apart.
+    """
+    frames = frame_signal(signal, ONSET_FRAME_SIZE, ONSET_HOP)
+    window = np.hanning(ONSET_FRAME_SIZE).astype(np.float32)
+    log_magnitude = np.empty((len(frames), ONSET_FRAME_SIZE // 2 + 1), dtype=np.float32)
+    for start in range(0, len(frames), FFT_BATCH):
+        log_magnitude[start:start + FFT_BATCH] = np.log1p(
+            100 * np.abs(np.fft.rfft(frames[start:start + FFT_BATCH] * window, axis=1)))
+
+    flux = np.maximum(np.diff(log_magnitude, axis=0), 0).sum(axis=1)
+    return flux - flux.mean() if len(flux) else flux
+
+
+def estimate_tempo(signal: np.ndarray, sample_rate: int = SAMPLE_RATE) -> Optional[float]:
+    """
+    Estimate a track's tempo from the autocorrelation of its onset envelope, taking the strongest period within
+    MIN_BPM to MAX_BPM, weighted towards PREFERRED_BPM so a beat isn't mistaken for a half or double time one.
+
+    :param signal: Mono samples.
+    :param sample_rate: The sample rate.
+    :return: The tempo in beats per minute, or None if there is too little audio or no beat.
+    """
+    envelope = onset_envelope(signal)
+    frame_rate = sample_rate / ONSET_HOP
+    min_lag = int(frame_rate * 60 / MAX_BPM)
+    max_lag = int(np.ceil(frame_rate * 60 / MIN_BPM)) + 1
+    if len(envelope) < 2 * max_lag or not envelope.any():
+        return None
+
+    # Autocorrelation through the FFT, padded so it doesn't wrap around
+    fft_size = 1 << int(np.ceil(np.log2(2 * len(envelope))))
+    spectrum = np.fft.rfft(envelope, fft_size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), fft_size)[:max_lag + 1]
+    if autocorrelation[0] <= 0:
+        return None
+
+    lags = np.arange(min_lag, max_lag)
+    bpms = 60 * frame_rate / lags
+    prior = np.exp(-0.5 * (np.log2(bpms / PREFERRED_BPM)) ** 2)
+    scores = autocorrelation[min_lag:max_lag] / autocorrelation[0] * prior
+    best = int(np.argmax(scores))
+    if autocorrelation[lags[best]] / autocorrelation[0] < MIN_BEAT_STRENGTH:
+        return None
+
+    # Parabolic interpolation between lags for a tempo finer than one frame
+    lag = float(lags[best])
+    if 0 < best < len(scores) - 1:
+        left, centre, right = autocorrelation[lags[best] - 1:lags[best] + 2]
+        curvature = left - 2 * centre + right
+        if curvature < 0:
+            lag += 0.5 * (left - right) / curvature
+    return float(60 * frame_rate / lag)
+
+
+def analyse_samples(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> TrackAnalysis:
+    """
+    Analyse decoded audio.
+
+    :param samples: The samples, shaped (samples, channels).
+    :param sample_rate: The sample rate.
+    :return: The analysis.
+    """
+    loudness = integrated_loudness(samples, sample_rate)
+    replay_gain = REPLAY_GAIN_REFERENCE - loudness if np.isfinite(loudness) else 0.0
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+    bpm = estimate_tempo(samples.mean(axis=1), sample_rate)
+    return TrackAnalysis(round(bpm, 2) if bpm else None, round(loudness, 2), round(replay_gain, 2), round(peak, 6))
+
+
+def analyse_file(file_path: str) -> TrackAnalysis:
+    """
+    Decode an audio file and analyse it. Module level so it can be sent to a process pool.
+
+    :param file_path: The audio file.
+    :return: The analysis.
+    """
+    return analyse_samples(decode_audio(file_path))
+
+
+def add_analysis_frames(tags, analysis: TrackAnalysis) -> None:
+    """
+    Add a track's analysis to its ID3 tags: the tempo as TBPM, which Serato and Rekordbox read, and the loudness as
+    ReplayGain TXXX frames.
+
+    :param tags: The track's mutagen ID3 tags.
+    :param analysis: The track's analysis.
+    """
+    from mutagen.id3 import TBPM, TXXX
+
+    if analysis.bpm:
+        tags['TBPM'] = TBPM(encoding=3, text=str(round(analysis.bpm)))
+    gain_tag, peak_tag = REPLAY_GAIN_TAGS
+    tags[f'TXXX:{gain_tag}'] = TXXX(encoding=3, desc=gain_tag, text=f"{analysis.replay_gain:+.2f} dB")
+    tags[f'TXXX:{peak_tag}'] = TXXX(encoding=3, desc=peak_tag, text=f"{analysis.peak:.6f}")
+
+
+def has_analysis(file_path: str) -> bool:
+    """Check whether a track has already been analysed, from its tags."""
+    from mutagen.id3 import ID3, ID3NoHeaderError
+
+    try:
+        tags = ID3(file_path)
+    except (ID3NoHeaderError, OSError):
+        return False
+    return f"TXXX:{REPLAY_GAIN_TAGS[0]}" in tags
+
+
+def analyse_and_tag(file_path: str) -> TrackAnalysis:
+    """
+    Analyse a track and write the results to its tags, in one tag write.
+
+    :param file_path: The track's MP3 file.
+    :return: The analysis.
+    """
+    from mutagen.id3 import ID3, ID3NoHeaderError
+
+    analysis = analyse_file(file_path)
+    try:
+        tags = ID3(file_path)
+    except ID3NoHeaderError:
+        tags = ID3()
+    add_analysis_frames(tags, analysis)
+    tags.save(file_path)
+    return analysis
+
+
+def analyse_library(drive: str, workers: int = 2, force: bool = False) -> int:
+    """
+    Analyse every track in a drive's track index that hasn't been analysed yet, in a process pool.
+
+    :param drive: The DJ library drive.
+    :param workers: The number of processes to analyse tracks in.
+    :param force: Analyse tracks again even if they already have been.
+    :return: The number of tracks analysed.
+    """
+    index_paths = dict.fromkeys(index_path for index in (load_hashmap_from_json(drive),
+                                                         load_hashmap_from_json(drive, VIDEO_INDEX_FILE))
+                                for index_path in index.values() if "youtube.com/" not in index_path)
+    file_paths = [file_path for file_path in (os.path.join(drive, index_path) for index_path in index_paths)
+                  if file_path.endswith(".mp3") and os.path.isfile(file_path)
+                  and (force or not has_analysis(file_path))]
+    logger.info(f"Analysing {len(file_paths)} tracks")
+
+    analysed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(analyse_and_tag, file_path): file_path for file_path in file_paths}
+        for future in concurrent.futures.as_completed(futures):
+            file_name = os.path.basename(futures[future])
+            try:
+                analysis = future.result()
+            except Exception as e:
+                logger.error(f"Couldn't analyse {file_name}: {e}")
+                continue
+            analysed += 1
+            logger.info(f"[{analysed}/{len(file_paths)}] {file_name}: {analysis.bpm or '?'} BPM, "
+                        f"{analysis.loudness} LUFS")
+    return analysed
+
+
+def main() -> None:
+    from settings import SettingsSingleton
+
+    parser = argparse.ArgumentParser(description="Analyse the tempo and loudness of the tracks on the DJ library "
+                                                 "drive, writing them to the tracks' tags.")
+    parser.add_argument("--drive", help="The DJ library drive to analyse, defaults to the drive in settings.yaml.")
+    parser.add_argument("--workers", type=int,
+                        help="The number of processes to analyse tracks in, defaults to the transcode workers.")
+    parser.add_argument("--force", action="store_true", help="Analyse tracks that have already been analysed.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    settings = SettingsSingleton()
+    analyse_library(args.drive or settings.dj_library_drive,
+                    args.workers or settings.download_workers["transcode"],
+                    args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import multiprocessing
+import os
+import signal
+from typing import Optional
+
+from cancellation import CancellationToken, create_manager
+from event_queue import EventQueueHandler, EventQueueLogger
+from logging_pipeline import start_logging
+from pysync_dj_download import PySyncDJDownload
+from settings import Settings
+from worker_pool import WorkerPool
+
+LINK_MODES = ("copy", "hardlink")
+
+
+class BatchSync:
+    """
+    Syncs several settings profiles, such as the libraries of different DJs or of different gigs, each to its own DJ
+    library drive, while downloading every track only once.
+
+    Tracks are downloaded and converted into a shared download cache, a drive or folder holding the track index for
+    every profile, and then copied or hardlinked to each profile's drive as a mirror drive, which gets its own crates,
+    playlists, XML library and track index. A track on several profiles' playlists is only downloaded for the first
+    profile that has it, and every later profile finds it in the cache. The profiles are synced one after another
+    through one worker pool.
+
+    Every profile's tracks are stored in the first profile's tracks folder and track layout, as a track's place in the
+    cache is its place on each profile's drive.
+    """
+
+    def __init__(self, profiles: dict[str, Settings], cache_drive: str, event_queue,
+                 link_mode: Optional[str] = None, cancel_token: Optional[CancellationToken] = None,
+                 log_queue=None) -> None:
+        """
+        Initialize the BatchSync.
+
+        :param profiles: Each profile's name and settings.
+        :param cache_drive: The drive or folder tracks are downloaded into once for every profile.
+        :param event_queue: The events queue that handles logging and ui updates.
+        :param link_mode: "copy" or "hardlink" to put tracks on the profiles' drives, defaults to each profile's
+            mirror_link_mode.
+        :param cancel_token: Cancels the batch, finishing the DJ libraries of the profile being synced and skipping
+            the rest.
+        :param log_queue: The log queue for the worker processes to send their log records to.
+        """
+        if not profiles:
+            raise ValueError("No profiles to sync")
+        if link_mode is not None and link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode {link_mode}, expected one of {LINK_MODES}")
+
+        self.profiles = profiles
+        self.cache_drive = cache_drive
+        self.event_queue = event_queue
+        self.event_logger = EventQueueLogger(event_queue)
+        self.link_mode = link_mode
+        self.log_queue = log_queue
+        self.cancel_token = cancel_token
+        first_settings = next(iter(profiles.values()))
+        self.tracks_folder = first_settings.tracks_folder
+        self.track_layout = first_settings.track_layout
+        # The cache's index paths of the tracks synced for each profile
+        self.profile_tracks: dict[str, set[str]] = {}
+
+    def profile_settings(self, name: str, settings: Settings) -> Settings:
+        """
+        :param name: The profile's name.
+        :param settings: The profile's settings.
+        :return: Settings that download the profile's tracks into the cache, with the profile's drive as the only
+            mirror drive.
+        """
+        profile_drive = settings.dj_library_drive
+        if not profile_drive or os.path.abspath(profile_drive) == os.path.abspath(self.cache_drive):
+            raise ValueError(f"Profile {name} needs a dj_library_drive other than the download cache")
+        if (settings.tracks_folder, settings.track_layout) != (self.tracks_folder, self.track_layout):
+            self.event_logger.info(f"Profile {name} uses the first profile's tracks folder {self.tracks_folder} and "
+                                   f"{self.track_layout} track layout, as every profile shares the download cache")
+
+        settings = settings.copy()
+        settings.update_setting("dj_library_drive", self.cache_drive)
+        settings.update_setting("mirror_drives", [profile_drive])
+        settings.update_setting("tracks_folder", self.tracks_folder)
+        settings.update_setting("track_layout", self.track_layout)
+        # Tracks are written straight to the cache, which is already the local copy a staging directory would be
+        settings.update_setting("staging_directory", None)
+        if self.link_mode:
+            settings.update_setting("mirror_link_mode", self.link_mode)
+        # Each profile can read a different Spotify account's liked songs
+        if not settings.spotify_token_cache:
+            settings.update_setting("spotify_token_cache", f".cache-{name}")
+        return settings
+
+    def run(self) -> None:
+        """
+        Sync every profile in turn, stopping once cancelled, then log how many downloads the shared cache saved.
+        """
+        profile_settings = {name: self.profile_settings(name, settings) for name, settings in self.profiles.items()}
+        os.makedirs(self.cache_drive, exist_ok=True)
+        first_settings = next(iter(profile_settings.values()))
+        worker_pool = WorkerPool(create_manager(),
+                                 first_settings.max_pool_workers,
+                                 first_settings.execution_mode,
+                                 first_settings.download_workers["transcode"],
+                                 self.log_queue)
+        if self.cancel_token is None:
+            self.cancel_token = CancellationToken(worker_pool.create_event(), worker_pool.create_event())
+        try:
+            for name, settings in profile_settings.items():
+                if self.cancel_token.cancelled:
+                    break
+                self.event_logger.info(f"Syncing profile {name} to {settings.mirror_drives[0]}")
+                download = PySyncDJDownload(None, self.event_queue, worker_pool, self.cancel_token,
+                                            settings=settings, save_main_libraries=False)
+                self.profile_tracks[name] = {track for _, track_list in download.synced_playlists
+                                             for track in track_list}
+        finally:
+            worker_pool.shutdown()
+        self.event_logger.info(self.report())
+
+    def report(self) -> str:
+        """:return: A one line summary of the tracks synced for the profiles and downloaded into the cache."""
+        total_tracks = sum(len(tracks) for tracks in self.profile_tracks.values())
+        unique_tracks = len(set().union(*self.profile_tracks.values()))
+        return (f"Synced {total_tracks} tracks to {len(self.profile_tracks)} profiles from {unique_tracks} tracks in "
+                f"the download cache, {total_tracks - unique_tracks} shared between profiles")
+
+
+def load_profiles(file_paths: list[str]) -> dict[str, Settings]:
+    """
+    :param file_paths: The profiles' settings files.
+    :return: Each profile's settings, named after its settings file.
+    """
+    profiles = {}
+    for file_path in file_paths:
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        if name in profiles:
+            raise ValueError(f"Two profiles are named {name}, rename one of their settings files")
+        profiles[name] = Settings.from_file(file_path)
+    return profiles
+
+
+def main() -> None:
+    """
+    Run a batch sync from the command line. The first Ctrl+C cancels the batch gracefully, finishing the DJ library
+    files of the profile being synced, and a second Ctrl+C stops immediately.
+    """
+    parser = argparse.ArgumentParser(description="Sync several settings profiles, downloading each track once into a "
+                                                 "shared cache and copying or hardlinking it to each profile's drive.")
+    parser.add_argument("profiles", nargs="+", help="The settings.yaml of each profile to sync.")
+    parser.add_argument("--cache-drive", required=True,
+                        help="The drive or folder to download tracks into once for every profile.")
+    parser.add_argument("--link-mode", choices=LINK_MODES,
+                        help="Copy or hardlink tracks to the profiles' drives, replacing each profile's "
+                             "mirror_link_mode. Hardlinks need the drive to be the same as the download cache's.")
+    args = parser.parse_args()
+
+    event_queue_handler = EventQueueHandler()
+    log_listener = start_logging(event_queue_handler.log_queue)
+    cancel_token = CancellationToken(event_queue_handler.manager.Event(), event_queue_handler.manager.Event())
+
+    def handle_interrupt(signum, frame):
+        if cancel_token.cancelled:
+            raise KeyboardInterrupt
+        print("Cancelling batch sync, press Ctrl+C again to stop immediately")
+        cancel_token.cancel()
+
+    signal.signal(signal.SIGINT, handle_interrupt)
+    try:
+        BatchSync(load_profiles(args.profiles), args.cache_drive, event_queue_handler.event_queue,
+                  link_mode=args.link_mode, cancel_token=cancel_token,
+                  log_queue=event_queue_handler.log_queue).run()
+    finally:
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,83 @@
+import signal
+import time
+from multiprocessing.managers import SyncManager
+
+
+class SyncCancelled(Exception):
+    """Raised inside a pipeline stage when the sync it belongs to has been cancelled."""
+
+
+class CancellationToken:
+    """
+    Cooperative pause and cancel signal for a sync, passed from the ui or command line through PySyncDJDownload into
+    every pipeline stage. Stages call check between steps, and long running steps such as downloads call it as they
+    go, so a cancelled sync stops promptly without leaving half written files behind.
+
+    Wraps a pause and cancel event, which can be manager events shared with worker processes or threading events.
+    """
+
+    def __init__(self, pause_event, cancel_event) -> None:
+        """
+        Initialize the CancellationToken.
+
+        :param pause_event: Set while the sync is paused.
+        :param cancel_event: Set once the sync is cancelled.
+        """
+        self.pause_event = pause_event
+        self.cancel_event = cancel_event
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return self.pause_event.is_set()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+        self.pause_event.clear()
+
+    def pause(self) -> None:
+        self.pause_event.set()
+
+    def resume(self) -> None:
+        self.pause_event.clear()
+
+    def reset(self) -> None:
+        """Clear the pause and cancel signals ready for the next sync."""
+        self.pause_event.clear()
+        self.cancel_event.clear()
+
+    def check(self) -> None:
+        """
+        :raises SyncCancelled: If the sync has been cancelled.
+        """
+        if self.cancel_event.is_set():
+            raise SyncCancelled()
+
+    def wait_if_paused(self, poll_interval: float = 0.5) -> None:
+        """
+        Block while the sync is paused.
+
+        :param poll_interval: Seconds between checks of the pause event.
+        :raises SyncCancelled: If the sync is cancelled, including while waiting.
+        """
+        while self.pause_event.is_set() and not self.cancel_event.is_set():
+            time.sleep(poll_interval)
+        self.check()
+
+
+def ignore_keyboard_interrupt() -> None:
+    """
+    Ignore Ctrl+C in a helper process. Ctrl+C is sent to every process in the terminal's process group, so without
+    this, pool workers and managers would die mid-sync instead of letting the main process cancel gracefully.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def create_manager() -> SyncManager:
+    """Start a multiprocessing manager that survives Ctrl+C, so shared state stays usable while a sync cancels."""
+    manager = SyncManager()
+    manager.start(ignore_keyboard_interrupt)
+    return manager
@@ -0,0 +1,171 @@
+import difflib
+import re
+import unicodedata
+from typing import NamedTuple, Optional
+
+# Words that mark a video as a different version of the track, unless the Spotify track name has them too
+# "mix" and "edit" aren't included, as "Original Mix" and "Radio Edit" titles are usually the right track
+NEGATIVE_KEYWORDS = ("live", "cover", "remix", "lyrics", "lyric", "karaoke", "instrumental", "acoustic", "sped up",
+                     "slowed", "nightcore", "reverb", "8d", "reaction", "tutorial", "full album", "hour", "hours",
+                     "bass boosted", "concert")
+VERIFIED_BADGE_STYLES = {"BADGE_STYLE_TYPE_VERIFIED_ARTIST", "BADGE_STYLE_TYPE_VERIFIED"}
+
+DURATION_WEIGHT = 0.35
+TITLE_WEIGHT = 0.4
+CHANNEL_WEIGHT = 0.15
+POSITION_WEIGHT = 0.1
+NEGATIVE_KEYWORD_PENALTY = 0.25
+# Videos this much longer than the track are mixes, full albums or hour long loops, never the track itself
+MAX_DURATION_RATIO = 2.5
+
+_non_word_pattern = re.compile(r"[^\w\s]")
+_space_pattern = re.compile(r"\s+")
+_keyword_patterns = {keyword: re.compile(rf"\b{re.escape(keyword)}\b") for keyword in NEGATIVE_KEYWORDS}
+
+
+class VideoCandidate(NamedTuple):
+    """A YouTube search result, read from the raw search response without loading the video itself."""
+    video_id: str
+    title: str
+    channel: str
+    duration_seconds: Optional[int]
+    position: int
+    verified_channel: bool = False
+
+
+class TrackQuery(NamedTuple):
+    """The parts of a Spotify track used to search for it and rank the results, normalized once up front."""
+    search_query: str
+    artist: str
+    name: str
+    duration_seconds: Optional[float]
+
+    @classmethod
+    def from_track(cls, track: dict) -> 'TrackQuery':
+        """
+        Build the query from Spotify track data.
+
+        :param track: Track data from the Spotify API.
+        """
+        track_data = track["track"]
+        artist = track_data["artists"][0]["name"]
+        duration_ms = track_data.get("duration_ms")
+        return cls(f"{artist} - {track_data['name']}",
+                   normalize_text(artist),
+                   normalize_text(track_data["name"]),
+                   duration_ms / 1000 if duration_ms else None)
+
+
+def normalize_text(text: str) -> str:
+    """Lower case, strip accents and punctuation and collapse whitespace, so titles can be compared."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn").lower()
+    return _space_pattern.sub(" ", _non_word_pattern.sub(" ", text)).strip()
+
+
+def parse_duration(length_text: str) -> Optional[int]:
+    """
+    Parse a YouTube length such as "3:45" or "1:02:03" into seconds.
+
+    :return: The duration in seconds, or None if it can't be parsed.
+    """
+    try:
+        seconds = 0
+        for part in length_text.split(":"):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+def parse_search_results(raw_results: dict, limit: int) -> list[VideoCandidate]:
+    """
+    Read video candidates from a raw innertube search response.
+
+    :param raw_results: The raw search response.
+    :param limit: The most candidates to return.
+    :return: The video results, in the order YouTube returned them.
+    """
+    sections = raw_results["contents"]["twoColumnSearchResultsRenderer"]["primaryContents"][
+        "sectionListRenderer"]["contents"]
+
+    candidates = []
+    for section in sections:
+        for item in section.get("itemSectionRenderer", {}).get("contents", []):
+            video = item.get("videoRenderer")
+            if not video or "videoId" not in video:
+                continue
+
+            title_runs = video.get("title", {}).get("runs", [{}])
+            owner_runs = (video.get("ownerText") or video.get("longBylineText") or {}).get("runs", [{}])
+            length_text = video.get("lengthText", {}).get("simpleText")
+            badge_styles = {badge.get("metadataBadgeRenderer", {}).get("style")
+                            for badge in video.get("ownerBadges", [])}
+
+            candidates.append(VideoCandidate(video["videoId"],
+                                             "".join(run.get("text", "") for run in title_runs),
+                                             owner_runs[0].get("text", ""),
+                                             parse_duration(length_text) if length_text else None,
+                                             len(candidates),
+                                             bool(badge_styles & VERIFIED_BADGE_STYLES)))
+            if len(candidates) >= limit:
+                return candidates
+    return candidates
+
+
+def score_candidate(query: TrackQuery, candidate: VideoCandidate, candidate_count: int) -> float:
+    """
+    Score how likely a search result is to be the Spotify track, from 1 for a perfect match down. Scores can go
+    negative for results with several negative keywords.
+
+    :param query: The track being searched for.
+    :param candidate: The search result.
+    :param candidate_count: The number of results being ranked, used to weight the result's position.
+    """
+    title = normalize_text(candidate.title)
+    channel = normalize_text(candidate.channel)
+
+    # Duration proximity, full marks within a few seconds and nothing beyond a quarter of the track's length
+    if query.duration_seconds and candidate.duration_seconds:
+        if candidate.duration_seconds > query.duration_seconds * MAX_DURATION_RATIO:
+            return -1.0
+        difference = max(abs(candidate.duration_seconds - query.duration_seconds) - 3, 0)
+        duration_score = max(0.0, 1 - difference / max(query.duration_seconds * 0.25, 15))
+    else:
+        duration_score = 0.5
+
+    # Title similarity. How many of the track name's words are in the title matters most, as the right artist's
+    # other tracks are often in the results. "- Topic" channels only have the artist in the channel name.
+    name_words = set(query.name.split())
+    name_coverage = len(name_words & set(title.split())) / len(name_words) if name_words else 0
+    artist_present = bool(query.artist) and (query.artist in title or query.artist in channel)
+    title_similarity = difflib.SequenceMatcher(None, f"{query.artist} {query.name}", title).ratio()
+    title_score = 0.4 * title_similarity + 0.4 * name_coverage + 0.2 * artist_present
+
+    channel_score = 0.0
+    if channel.endswith(" topic") or candidate.verified_channel:
+        channel_score = 1.0
+    elif query.artist and query.artist.replace(" ", "") in channel.replace(" ", ""):
+        channel_score = 0.8
+    elif "vevo" in channel or "official" in channel:
+        channel_score = 0.6
+
+    position_score = 1 - candidate.position / max(candidate_count, 1)
+
+    penalty = sum(NEGATIVE_KEYWORD_PENALTY for keyword, pattern in _keyword_patterns.items()
+                  if pattern.search(title) and not pattern.search(query.name))
+
+    return (DURATION_WEIGHT * duration_score + TITLE_WEIGHT * title_score + CHANNEL_WEIGHT * channel_score +
+            POSITION_WEIGHT * position_score - penalty)
+
+
+def rank_candidates(query: TrackQuery, candidates: list[VideoCandidate]) -> list[tuple[float, VideoCandidate]]:
+    """
+    Score every search result for a track in one pass.
+
+    :param query: The track being searched for.
+    :param candidates: The search results.
+    :return: Pairs of score and candidate, best first.
+    """
+    scored = [(score_candidate(query, candidate, len(candidates)), candidate) for candidate in candidates]
+    return sorted(scored, key=lambda scored_candidate: (-scored_candidate[0], scored_candidate[1].position))
@@ -0,0 +1,194 @@
+import threading
+import time
+from multiprocessing.managers import SyncManager
+from typing import Optional
+
+from event_queue import EventQueueLogger
+
+PIPELINE_STAGES = ("search", "download", "transcode")
+
+# Errors YouTube gives when it is rate limiting or blocking us, matched by name so pytube and pytubefix errors (and
+# errors re-raised from worker processes) are all recognised
+THROTTLE_ERROR_NAMES = {"BotDetection", "PoTokenRequired", "MaxRetriesExceeded", "TooManyRedirects"}
+THROTTLE_ERROR_MESSAGES = ("429", "Too Many Requests", "rate limit")
+
+
+class LocalValue:
+    """In-process stand in for a manager Value, used when every worker is a thread."""
+
+    def __init__(self, value: int) -> None:
+        self.value = value
+
+
+class StageLimiter:
+    """
+    Limits how many workers can be in a pipeline stage (search, download, transcode) at once. Used as a context
+    manager around the stage's work. Can be backed by manager proxies so it can be shared with worker processes,
+    and its limit can be changed while workers are running.
+    """
+
+    def __init__(self, condition, limit, active) -> None:
+        """
+        Initialize the StageLimiter. Use StageLimiter.create to build one shared through a manager, or
+        StageLimiter.create_local for one shared between threads.
+
+        :param condition: Condition guarding the limit and active count.
+        :param limit: Shared value holding the maximum number of workers allowed in the stage.
+        :param active: Shared value holding the number of workers currently in the stage.
+        """
+        self.condition = condition
+        self._limit = limit
+        self._active = active
+
+    @classmethod
+    def create(cls, manager: SyncManager, limit: int) -> 'StageLimiter':
+        return cls(manager.Condition(), manager.Value('i', limit), manager.Value('i', 0))
+
+    @classmethod
+    def create_local(cls, limit: int) -> 'StageLimiter':
+        return cls(threading.Condition(), LocalValue(limit), LocalValue(0))
+
+    @property
+    def limit(self) -> int:
+        return self._limit.value
+
+    def set_limit(self, limit: int) -> None:
+        with self.condition:
+            self._limit.value = limit
+            self.condition.notify_all()
+
+    def __enter__(self) -> 'StageLimiter':
+        with self.condition:
+            while self._active.value >= self._limit.value:
+                self.condition.wait()
+            self._active.value += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        with self.condition:
+            self._active.value -= 1
+            self.condition.notify_all()
+
+
+def create_stage_limiters(stage_workers: dict[str, int],
+                          manager: Optional[SyncManager] = None) -> dict[str, StageLimiter]:
+    """
+    Create a limiter for each pipeline stage.
+
+    :param stage_workers: The number of workers allowed in each stage.
+    :param manager: The multiprocessing manager used to share the limiters with worker processes. If None the
+        limiters only work between threads of this process.
+    :return: Dictionary of stage name to its limiter.
+    """
+    if manager is None:
+        return {stage: StageLimiter.create_local(stage_workers[stage]) for stage in PIPELINE_STAGES}
+    return {stage: StageLimiter.create(manager, stage_workers[stage]) for stage in PIPELINE_STAGES}
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """
+    Check whether an error looks like YouTube throttling or blocking us rather than a problem with one track.
+
+    :param error: The error raised while processing a track.
+    """
+    if type(error).__name__ in THROTTLE_ERROR_NAMES:
+        return True
+    message = str(error)
+    return any(throttle_message in message for throttle_message in THROTTLE_ERROR_MESSAGES)
+
+
+class AdaptiveConcurrency:
+    """
+    Scales the number of concurrent searches and downloads with additive-increase/multiplicative-decrease (AIMD)
+    control. After each window of successful tracks the limit goes up by one, as long as throughput didn't drop.
+    When YouTube starts throttling, or most of a window fails, the limit is halved.
+    """
+
+    def __init__(self,
+                 limiters: list[StageLimiter],
+                 event_logger: EventQueueLogger,
+                 min_workers: int = 1,
+                 max_workers: int = 8,
+                 decrease_cooldown: float = 30) -> None:
+        """
+        Initialize the AdaptiveConcurrency controller.
+
+        :param limiters: The stage limiters to control, all set to the same limit.
+        :param event_logger: Logger used to report changes in concurrency.
+        :param min_workers: The lowest the limit will go.
+        :param max_workers: The highest the limit will go.
+        :param decrease_cooldown: Seconds to wait after a decrease before decreasing again, so one burst of
+            throttling errors from tracks already in flight only halves the limit once.
+        """
+        self.limiters = limiters
+        self.event_logger = event_logger
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.decrease_cooldown = decrease_cooldown
+
+        self.limit = max(min_workers, min(max_workers, limiters[0].limit))
+        self.last_decrease: Optional[float] = None
+        self.last_throughput: Optional[float] = None
+        self._start_window()
+        self._apply_limit()
+
+    def _start_window(self) -> None:
+        self.window_start = time.monotonic()
+        self.window_successes = 0
+        self.window_failures = 0
+
+    def _apply_limit(self) -> None:
+        for limiter in self.limiters:
+            limiter.set_limit(self.limit)
+
+    def record_success(self) -> None:
+        """Record a track that finished successfully."""
+        self.window_successes += 1
+        self._end_window_if_full()
+
+    def record_failure(self, error: BaseException) -> None:
+        """
+        Record a track that failed. Throttling errors immediately halve the limit.
+
+        :param error: The error the track failed with.
+        """
+        if is_throttle_error(error):
+            self._decrease(f"YouTube throttling detected ({type(error).__name__})")
+            return
+
+        self.window_failures += 1
+        self._end_window_if_full()
+
+    def _end_window_if_full(self) -> None:
+        completed = self.window_successes + self.window_failures
+        if completed < self.limit:
+            return
+
+        if self.window_failures > self.window_successes:
+            self._decrease(f"{self.window_failures} of the last {completed} tracks failed")
+            return
+
+        throughput = completed / max(time.monotonic() - self.window_start, 1e-6)
+        if self.last_throughput is None or throughput >= self.last_throughput * 0.9:
+            self._increase(throughput)
+        self.last_throughput = throughput
+        self._start_window()
+
+    def _increase(self, throughput: float) -> None:
+        if self.limit >= self.max_workers:
+            return
+        self.limit += 1
+        self._apply_limit()
+        self.event_logger.debug(f"Increased download concurrency to {self.limit} ({throughput * 60:.1f} tracks/min)")
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if self.last_decrease is not None and now - self.last_decrease < self.decrease_cooldown:
+            return
+
+        self.last_decrease = now
+        self.last_throughput = None
+        self.limit = max(self.min_workers, self.limit // 2)
+        self._apply_limit()
+        self._start_window()
+        self.event_logger.info(f"{reason}, reducing download concurrency to {self.limit}")
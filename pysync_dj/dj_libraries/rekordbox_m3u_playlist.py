@@ -1,5 +1,8 @@
 import os
-from settings import SettingsSingleton
+from typing import Optional
+
+from settings import Settings, SettingsSingleton
+from utils import write_file_if_changed
 
 
 class RekordboxM3UPlaylist:
@@ -7,31 +10,33 @@ class RekordboxM3UPlaylist:
     Helper class for creating M3U playlist files compatible with Rekordbox.
     """
 
-    def __init__(self, playlist_name, downloaded_track_list, file_drive) -> None:
+    def __init__(self, playlist_name, downloaded_track_list, file_drive, settings: Optional[Settings] = None) -> None:
         """
         Initialize the RekordboxLibrary class.
+
+        :param settings: The settings to save the playlist with, defaults to the app's settings.
         """
         self.tracks = downloaded_track_list
         self.file_drive = file_drive
         self.playlist_name = playlist_name
+        self.settings = settings or SettingsSingleton()
 
-    def create_m3u_file(self) -> None:
+    def create_m3u_file(self) -> bool:
         """
-        Create an M3U file with the currently added tracks. The file is saved in the directory specified in the
-        SettingsSingleton.
+        Create an M3U file with the currently added tracks. The file is saved on the file drive, in the directory
+        specified in the settings, and is only rewritten if its contents have changed.
 
-        :param output_file_name: The name of the output M3U file.
+        :return: True if the M3U file was written, False if it was unchanged and skipped.
         """
 
         output_file_name = f"{self.playlist_name}.m3u"
 
-        output_file = os.path.join(SettingsSingleton().dj_library_drive,
-                                   SettingsSingleton().rekordbox_playlist_folder,
+        output_file = os.path.join(self.file_drive,
+                                   self.settings.rekordbox_playlist_folder,
                                    output_file_name)
 
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        lines = ['#EXTM3U']  # Header for an extended M3U file
+        lines.extend(os.path.join(self.file_drive, file_location) for file_location in self.tracks)
+        playlist_data = "".join(line + os.linesep for line in lines).encode()
 
-        with open(output_file, 'w') as playlist:
-            playlist.write('#EXTM3U\n')  # Header for an extended M3U file
-            for file_location in self.tracks:
-                playlist.write(os.path.join(self.file_drive, file_location) + '\n')
+        return write_file_if_changed(output_file, playlist_data)
@@ -4,10 +4,8 @@ import xml.etree.ElementTree as ET
 from typing import Optional, Dict, Union, Any
 from xml.dom import minidom
 
-from mutagen.easyid3 import EasyID3
-from mutagen.mp3 import MP3
-
-from settings import SettingsSingleton
+from settings import Settings, SettingsSingleton
+from utils import write_file_if_changed
 
 
 class RekordboxXMLLibrary:
@@ -16,9 +14,14 @@ class RekordboxXMLLibrary:
     so that users can import there whole PySync DJ library using the import iTunes library feature in RekordBox.
     """
 
-    def __init__(self, event_logger: 'EventQueueLogger') -> None:
+    def __init__(self, event_logger: 'EventQueueLogger', drive: Optional[str] = None,
+                 settings: Optional[Settings] = None) -> None:
         """
         Initialize the ItunesLibrary class.
+
+        :param event_logger: Logger used to log errors.
+        :param drive: The drive the library and its tracks are on, defaults to the DJ library drive in settings.
+        :param settings: The settings to save the library with, defaults to the app's settings.
         """
         self.unique_track_id_counter = -1
         self.unique_playlist_id_counter = 1
@@ -28,7 +31,8 @@ class RekordboxXMLLibrary:
         self.plist: Optional[ET.SubElement] = None
 
         self.event_logger = event_logger
-        self.settings = SettingsSingleton()
+        self.settings = settings or SettingsSingleton()
+        self.drive = drive or self.settings.dj_library_drive
         self.create_empty_library_xml()
 
     def gen_track_id(self) -> int:
@@ -62,7 +66,7 @@ class RekordboxXMLLibrary:
 
         self.add_root_playlist()
 
-    def save_xml(self, file_name: str = "PySyncLibrary.xml") -> None:
+    def save_xml(self, file_name: str = "PySyncLibrary.xml") -> bool:
         # Convert to a pretty XML string
         rough_string = ET.tostring(self.plist, "utf-8")
         reparsed = minidom.parseString(rough_string)
@@ -73,12 +77,10 @@ class RekordboxXMLLibrary:
         final_xml_content = doctype + '\n' + pretty_xml_str.decode('utf-8')
 
         # Save to file
-        file_location = os.path.join(self.settings.dj_library_drive,
+        file_location = os.path.join(self.drive,
                                      self.settings.rekordbox_playlist_folder,
                                      file_name)
-        os.makedirs(os.path.dirname(file_location), exist_ok=True)
-        with open(file_location, "w", encoding="UTF-8") as f:
-            f.write(final_xml_content)
+        return write_file_if_changed(file_location, final_xml_content.encode("UTF-8"))
 
     def add_playlist(self, playlist_name: str, file_locations: list[str]) -> None:
         """
@@ -146,10 +148,13 @@ class RekordboxXMLLibrary:
         """
         Formats the track dictionary ready to be saved in the xml tree
         """
+        from mutagen.easyid3 import EasyID3
+        from mutagen.mp3 import MP3
+
         formatted_track_dict = {}
 
         for track_id, file_location in downloaded_tracks_dict:
-            file_location = os.path.join(self.settings.dj_library_drive, file_location)
+            file_location = os.path.join(self.drive, file_location)
             try:
                 audio = MP3(file_location, ID3=EasyID3)
                 name = audio['title'][0] if 'title' in audio else 'Unknown'
@@ -1,8 +1,8 @@
 import os
-from pathlib import Path
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 import parse_serato_crates as parse_serato_crates
-from settings import SettingsSingleton
+from settings import Settings, SettingsSingleton
+from utils import write_file_if_changed
 
 class SeratoCrate:
     def __init__(self, crate_name: str, downloaded_track_list, version: str = '1.0/Serato ScratchLive Crate') -> None:
@@ -18,7 +18,6 @@ class SeratoCrate:
         self.extra_crate_data = []
 
         self.add_tracks(downloaded_track_list)
-        self.save_crate()
 
     def add_crate_data(self, tag_name: str, data: str) -> None:
         """
@@ -58,15 +57,18 @@ class SeratoCrate:
         crate_data.extend(self.tracks)
         return crate_data
 
-    def save_crate(self) -> None:
+    def save_crate(self, drive: Optional[str] = None, settings: Optional[Settings] = None) -> bool:
         """
-        Save the crate to the _Serato_/Subcrates crate folder.
+        Save the crate to the _Serato_/Subcrates crate folder. The crate is only rewritten if its contents have
+        changed, so Serato doesn't rescan unchanged crates.
+
+        :param drive: The drive to save the crate to, defaults to the DJ library drive in settings.
+        :param settings: The settings to save the crate with, defaults to the app's settings.
+        :return: True if the crate file was written, False if it was unchanged and skipped.
         """
-        settings = SettingsSingleton()
+        settings = settings or SettingsSingleton()
 
         crate_formatted_name = f"PySync DJ%%{self.crate_name}.crate"
-        file_path = os.path.join(settings.dj_library_drive, settings.serato_subcrate_dir, crate_formatted_name)
-        Path(os.path.dirname(file_path)).mkdir(parents=True, exist_ok=True)
-        with open(file_path, 'wb+') as f:
-            encoded_data = parse_serato_crates.encode_struct(self.get_crate_data())
-            f.write(encoded_data)
+        file_path = os.path.join(drive or settings.dj_library_drive, settings.serato_subcrate_dir, crate_formatted_name)
+        encoded_data = parse_serato_crates.encode_struct(self.get_crate_data())
+        return write_file_if_changed(file_path, encoded_data)
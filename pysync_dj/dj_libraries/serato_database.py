@@ -0,0 +1,139 @@
+import os
+import shutil
+import time
+from typing import Iterable, Optional
+
+import parse_serato_crates as parse_serato_crates
+from utils import write_file_if_changed
+
+DATABASE_FILE_NAME = "database V2"
+DATABASE_VERSION = "2.0/Serato Scratch LIVE Database"
+BACKUP_SUFFIX = ".pysync.bak"
+
+
+def path_key(serato_path: str) -> str:
+    """A track's path in the database normalised for matching, as paths differ in case and separators by platform."""
+    return serato_path.replace("\\", "/").lstrip("/").casefold()
+
+
+def format_length(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes):02d}:{seconds:05.2f}"
+
+
+def read_track_fields(file_path: str) -> list[tuple[str, object]]:
+    """
+    Read the fields of a track's database entry from its MP3 file and tags.
+
+    :param file_path: The track's MP3 file.
+    :return: The entry's fields, without its path.
+    """
+    from mutagen.mp3 import MP3
+
+    audio = MP3(file_path)
+    tags = audio.tags or {}
+
+    def text(frame_id: str) -> Optional[str]:
+        frame = tags.get(frame_id)
+        return str(frame.text[0]) if frame and frame.text else None
+
+    fields = [("ttyp", "mp3")]
+    for tag, frame_id in (("tsng", "TIT2"), ("tart", "TPE1"), ("talb", "TALB")):
+        if value := text(frame_id):
+            fields.append((tag, value))
+    fields.append(("tlen", format_length(audio.info.length)))
+    fields.append(("tbit", f"{audio.info.bitrate / 1000:.1f}kbps"))
+    fields.append(("tsmp", f"{audio.info.sample_rate / 1000:g}k"))
+    if bpm := text("TBPM"):
+        try:
+            fields.append(("tbpm", f"{float(bpm):.2f}"))
+        except ValueError:
+            pass
+    fields.append(("tsiz", f"{os.path.getsize(file_path) / (1024 * 1024):.1f}MB"))
+    return fields
+
+
+class SeratoDatabase:
+    """
+    Serato's track database, _Serato_/database V2 on the drive. Adding PySync DJ's tracks to it up front means Serato
+    doesn't have to find, open and read every new file itself when it starts, which is a long wait on a large USB
+    drive.
+
+    The database is read and written with the same encoder and decoder as crates. Every entry already in it, the user's
+    own tracks and everything Serato has added to PySync DJ's tracks such as cue points and analysis, is kept as it is,
+    and all the new tracks are merged in with one rewrite of the file.
+    """
+
+    def __init__(self, drive: str, serato_subcrate_dir: str) -> None:
+        """
+        Initialize the SeratoDatabase, loading the database if the drive has one.
+
+        :param drive: The drive the database and tracks are on.
+        :param serato_subcrate_dir: The Serato subcrates folder on the drive, the database is in the folder above it.
+        """
+        self.drive = drive
+        # The setting is written with Windows separators
+        subcrate_dir = os.path.normpath(os.path.join(drive, serato_subcrate_dir.replace("\\", os.sep)))
+        serato_dir = os.path.dirname(subcrate_dir)
+        self.file_path = os.path.join(serato_dir, DATABASE_FILE_NAME)
+
+        self.entries: list[tuple[str, object]] = [("vrsn", DATABASE_VERSION)]
+        if os.path.isfile(self.file_path):
+            with open(self.file_path, "rb") as file:
+                self.entries = parse_serato_crates.decode_struct(file.read())
+
+        # Normalised track path to the index of its entry
+        self.track_positions: dict[str, int] = {}
+        for position, (tag, value) in enumerate(self.entries):
+            if tag == "otrk":
+                file_path = next((field_value for field_tag, field_value in value if field_tag == "pfil"), None)
+                if file_path:
+                    self.track_positions[path_key(file_path)] = position
+
+    def serato_path(self, file_path: str) -> str:
+        """
+        A track's path as Serato writes it in the database, relative to the root of the drive with forward slashes.
+
+        :param file_path: The track's file path on the drive.
+        :return: The track's path in the database.
+        """
+        return os.path.relpath(file_path, self.drive).replace(os.sep, "/")
+
+    def add_tracks(self, file_paths: Iterable[str]) -> int:
+        """
+        Add tracks the database doesn't have yet. Only the new tracks' files are read. Tracks that can't be read are
+        left for Serato to find.
+
+        :param file_paths: The tracks' file paths.
+        :return: The number of tracks added.
+        """
+        added = 0
+        date_added = int(time.time())
+        for file_path in file_paths:
+            file_path = os.path.join(self.drive, file_path)
+            serato_path = self.serato_path(file_path)
+            key = path_key(serato_path)
+            if key in self.track_positions:
+                continue
+            try:
+                fields = read_track_fields(file_path)
+            except Exception:
+                continue
+
+            fields.insert(1, ("pfil", serato_path))
+            fields += [("tadd", str(date_added)), ("uadd", date_added)]
+            self.track_positions[key] = len(self.entries)
+            self.entries.append(("otrk", fields))
+            added += 1
+        return added
+
+    def save(self) -> bool:
+        """
+        Write the database, if it has changed. A copy of the database as it was is kept alongside it the first time it
+        is rewritten.
+
+        :return: True if the database was written, False if it was unchanged and skipped.
+        """
+        if os.path.isfile(self.file_path) and not os.path.isfile(self.file_path + BACKUP_SUFFIX):
+            shutil.copyfile(self.file_path, self.file_path + BACKUP_SUFFIX)
+        return write_file_if_changed(self.file_path, parse_serato_crates.encode_struct(self.entries))
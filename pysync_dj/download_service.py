@@ -0,0 +1,115 @@
+import multiprocessing
+import traceback
+from multiprocessing.managers import SyncManager
+from queue import Queue
+
+from cancellation import CancellationToken, create_manager, ignore_keyboard_interrupt
+from event_queue import EventQueueLogger
+from logging_pipeline import configure_process_logging
+
+
+def run_download_service(command_queue: Queue, event_queue: Queue, cancel_token: CancellationToken,
+                         log_queue=None) -> None:
+    """
+    Entry point of the download service process. Builds a warm worker pool once and then runs sync jobs from the
+    command queue until told to shut down.
+
+    :param command_queue: Queue of (command, data) tuples sent by DownloadService.
+    :param event_queue: The events queue that handles logging and ui updates.
+    :param cancel_token: Pauses and cancels the current sync.
+    :param log_queue: The log queue the service and its workers send their log records to.
+    """
+    # The ui process decides when to stop, shutting the service down gracefully
+    ignore_keyboard_interrupt()
+    configure_process_logging(log_queue)
+
+    # Imported here so the ui process, which only needs DownloadService, doesn't load the download stack
+    from pysync_dj_download import PySyncDJDownload
+    from worker_pool import WorkerPool
+
+    event_logger = EventQueueLogger(event_queue)
+    manager = create_manager()
+    # Settings are only read when a sync starts, which resizes the pool if the configured worker counts need it
+    worker_pool = WorkerPool(manager, log_queue=log_queue)
+    worker_pool.warm_up()
+    event_logger.debug("Download service ready")
+
+    try:
+        while True:
+            command, data = command_queue.get()
+            if command == "shutdown":
+                break
+
+            if command == "sync":
+                try:
+                    PySyncDJDownload(data, event_queue, worker_pool, cancel_token)
+                except Exception:
+                    event_logger.error("Download failed")
+                    event_logger.error(traceback.format_exc())
+                    event_logger.enable_download_button()
+            else:
+                event_logger.error(f"Unknown download service command: {command}")
+    finally:
+        worker_pool.shutdown()
+        manager.shutdown()
+
+
+class DownloadService:
+    """
+    Handle, used by the ui, for a long-lived download process. The process is started once when the app starts and
+    keeps a warm worker pool and the loaded track index between syncs, so later syncs start instantly.
+    """
+
+    def __init__(self, manager: SyncManager, event_queue: Queue, log_queue=None) -> None:
+        """
+        Start the download service process.
+
+        :param manager: The multiprocessing manager used to create the queues and events shared with the service.
+        :param event_queue: The events queue that handles logging and ui updates.
+        :param log_queue: The log queue the service and its workers send their log records to.
+        """
+        self.command_queue: Queue = manager.Queue()
+        self.cancel_token = CancellationToken(manager.Event(), manager.Event())
+
+        self.process = multiprocessing.Process(target=run_download_service,
+                                               args=(self.command_queue, event_queue, self.cancel_token,
+                                                     log_queue))
+        self.process.start()
+
+    def sync(self, selected_drive: str) -> None:
+        """
+        Queue a sync to the selected drive.
+
+        :param selected_drive: The DJ library drive to sync to.
+        """
+        self.cancel_token.reset()
+        self.command_queue.put(("sync", selected_drive))
+
+    def pause(self) -> None:
+        """Stop starting new tracks until resumed."""
+        self.cancel_token.pause()
+
+    def resume(self) -> None:
+        self.cancel_token.resume()
+
+    def is_paused(self) -> bool:
+        return self.cancel_token.paused
+
+    def cancel(self) -> None:
+        """
+        Cancel the running sync. Tracks not yet started are skipped and in-flight downloads stop at their next chunk.
+        """
+        self.cancel_token.cancel()
+
+    def shutdown(self, timeout: float = 30) -> None:
+        """
+        Cancel any running sync and stop the service process. The running sync stops its downloads and writes the
+        index and DJ library files for the tracks it completed before the service exits.
+
+        :param timeout: Seconds to wait for the process to exit before terminating it.
+        """
+        self.cancel()
+        self.command_queue.put(("shutdown", None))
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,345 @@
+import concurrent.futures
+import errno
+import os
+import shutil
+import threading
+from typing import Optional
+
+from event_queue import EventQueueLogger
+
+# Tracks still being copied to the DJ drive are written under this suffix, so a copy cut short is never taken for a
+# finished track
+COPY_TEMP_SUFFIX = ".copying"
+
+
+class DriveSpace:
+    """
+    Keeps track of the space the tracks in flight will need on the DJ drive, so no more tracks are scheduled once the
+    drive is about to fill, instead of the sync failing part way through writing a file.
+
+    Tracks reserve their estimated size before they are submitted, and release it once their file is on the drive.
+    """
+
+    def __init__(self, drive: str, min_free_space_mb: float) -> None:
+        """
+        Initialize the DriveSpace.
+
+        :param drive: The DJ library drive.
+        :param min_free_space_mb: The space to always leave free on the drive.
+        """
+        self.drive = drive
+        self.min_free_space = min_free_space_mb * 1024 * 1024
+        self.reserved = 0.0
+        self.full = False
+        self.lock = threading.Lock()
+
+    def free_space(self) -> int:
+        """The free space on the drive in bytes, not counting the space reserved for tracks in flight."""
+        return shutil.disk_usage(self.drive).free
+
+    def reserve(self, size: float) -> bool:
+        """
+        Reserve space on the drive for a track about to be submitted.
+
+        :param size: The track's estimated file size in bytes.
+        :return: True if there is room for the track, False if the drive is about to fill, after which it is marked
+            as full. Tracks already on the drive need no space, so always have room, even once the drive is full.
+        """
+        if size <= 0:
+            return True
+
+        with self.lock:
+            if self.full or self.free_space() - self.reserved - size < self.min_free_space:
+                self.full = True
+                return False
+            self.reserved += size
+            return True
+
+    def release(self, size: float) -> None:
+        """
+        Release a track's reservation, once its file is on the drive or it has failed.
+
+        :param size: The size that was reserved for the track.
+        """
+        if size <= 0:
+            return
+        with self.lock:
+            self.reserved = max(self.reserved - size, 0)
+
+    def mark_full(self) -> None:
+        self.full = True
+
+    def report(self) -> str:
+        return (f"Stopped downloading as the DJ drive is nearly full, {self.free_space() / (1024 * 1024):.0f}MB free "
+                f"and {self.min_free_space / (1024 * 1024):.0f}MB kept free. Free up space or raise "
+                f"min_free_space_mb and sync again to download the remaining tracks.")
+
+
+class DriveWriter:
+    """
+    Moves tracks downloaded and converted in the staging directory onto the DJ drive, one at a time in a single
+    background thread. Slow USB drives handle one sequential write far better than many workers writing at once, and
+    the workers aren't held up waiting on the drive.
+
+    Staged tracks mirror their place on the drive, so staging_directory/tracks_folder/track.mp3 is moved to
+    dj_library_drive/tracks_folder/track.mp3. A track that can't be moved is left in the staging directory, where the
+    next sync finds it instead of downloading it again.
+
+    A writer can also copy tracks to a mirror drive, an extra DJ library drive kept in sync with the same tracks, in
+    which case tracks are copied rather than moved, from the staging directory or else the library drive. Copies can be
+    hardlinks instead, taking no extra space, when the mirror is another folder on the same drive.
+    """
+
+    def __init__(self, staging_dir: str, drive: str, drive_space: DriveSpace, event_logger: EventQueueLogger,
+                 library_drive: Optional[str] = None, keep_source: bool = False, link: bool = False) -> None:
+        """
+        Initialize the DriveWriter.
+
+        :param staging_dir: The local directory tracks are downloaded and converted in.
+        :param drive: The DJ library drive tracks are moved to.
+        :param drive_space: Space reservations on the drive, released as each track is moved.
+        :param event_logger: Logger used to log failed moves and the writer's report.
+        :param library_drive: The drive the track paths passed to submit are on, if not the drive written to, such as
+            when writing to a mirror drive.
+        :param keep_source: Copy tracks rather than moving them, leaving the source file in place. Tracks already on
+            the drive with the same size are skipped.
+        :param link: Hardlink tracks to the drive instead of copying them, falling back to a copy where the source is
+            on another drive or the drive can't hold hardlinks.
+        """
+        self.staging_dir = staging_dir
+        self.drive = drive
+        self.library_drive = library_drive or drive
+        self.drive_space = drive_space
+        self.event_logger = event_logger
+        self.keep_source = keep_source
+        self.link = link
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="drive_writer")
+        self.moved_tracks = 0
+        self.moved_bytes = 0
+        self.linked_tracks = 0
+        self.failed_moves = 0
+        self.skipped_tracks = 0
+        self.is_shut_down = False
+
+    def relative_path(self, file_path: str) -> str:
+        """
+        :param file_path: A track's path on the library drive, with or without the drive, as in the track index.
+        :return: The track's path relative to the drive.
+        """
+        return os.path.relpath(os.path.join(self.library_drive, file_path), self.library_drive)
+
+    def staged_path(self, file_path: str) -> str:
+        """
+        :param file_path: A track's path on the DJ drive.
+        :return: Where the track is staged before being moved there.
+        """
+        return os.path.join(self.staging_dir, self.relative_path(file_path))
+
+    def target_path(self, file_path: str) -> str:
+        """
+        :param file_path: A track's path on the library drive.
+        :return: Where the track is written to on this writer's drive.
+        """
+        return os.path.join(self.drive, self.relative_path(file_path))
+
+    def source_path(self, file_path: str) -> Optional[str]:
+        """
+        :param file_path: A track's path on the library drive.
+        :return: The file to write the track from, its staged copy or else, for a mirror drive, the track on the
+            library drive. None if there is nothing to write.
+        """
+        staged_path = self.staged_path(file_path)
+        if os.path.isfile(staged_path):
+            return staged_path
+        library_path = os.path.join(self.library_drive, self.relative_path(file_path))
+        if self.library_drive != self.drive and os.path.isfile(library_path):
+            return library_path
+        return None
+
+    def submit(self, file_path: str, reserved_size: float = 0) -> Optional[concurrent.futures.Future]:
+        """
+        Queue a track to be moved onto the drive, if it was downloaded into the staging directory. Tracks that were
+        already on the drive are left alone.
+
+        :param file_path: The track's path on the DJ drive.
+        :param reserved_size: The space reserved for the track, released once it has been moved.
+        :return: A future for the move, or None if there was nothing to move.
+        """
+        source_path = self.source_path(file_path)
+        target_path = self.target_path(file_path)
+        if source_path is None or (self.keep_source and self.is_written(source_path, target_path)):
+            self.drive_space.release(reserved_size)
+            return None
+        return self.executor.submit(self.move, source_path, target_path, reserved_size)
+
+    def submit_copy(self, file_path: str) -> Optional[concurrent.futures.Future]:
+        """
+        Queue a track to be copied to a mirror drive, reserving its size on the drive first. Once the drive is about
+        to fill no more tracks are copied to it.
+
+        :param file_path: The track's path on the library drive.
+        :return: A future for the copy, or None if there was nothing to copy or no room for it.
+        """
+        source_path = self.source_path(file_path)
+        if source_path is None or self.is_written(source_path, self.target_path(file_path)):
+            return None
+
+        was_full = self.drive_space.full
+        size = os.path.getsize(source_path)
+        if not self.drive_space.reserve(size):
+            self.skipped_tracks += 1
+            if not was_full:
+                self.event_logger.error(f"{self.drive} is nearly full, not copying any more tracks to it")
+            return None
+        return self.submit(file_path, size)
+
+    @staticmethod
+    def is_written(source_path: str, target_path: str) -> bool:
+        """Check whether a track is already on the drive, by comparing sizes."""
+        try:
+            return os.path.getsize(target_path) == os.path.getsize(source_path)
+        except OSError:
+            return False
+
+    def move(self, staged_path: str, file_path: str, reserved_size: float = 0) -> bool:
+        """
+        Copy a staged track to the drive under a temporary name, rename it into place once complete, and then remove
+        the staged copy, unless keeping it.
+
+        :param staged_path: The track's path in the staging directory, or the file it is copied from.
+        :param file_path: The track's path on the DJ drive.
+        :param reserved_size: The space reserved for the track.
+        :return: True if the track was moved.
+        """
+        temp_path = file_path + COPY_TEMP_SUFFIX
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            if self.link and self.link_file(staged_path, temp_path):
+                self.linked_tracks += 1
+            else:
+                shutil.copyfile(staged_path, temp_path)
+                self.moved_bytes += os.path.getsize(temp_path)
+            os.replace(temp_path, file_path)
+            if not self.keep_source:
+                os.remove(staged_path)
+            self.moved_tracks += 1
+            return True
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                self.drive_space.mark_full()
+            self.failed_moves += 1
+            self.event_logger.error(f"Couldn't move \"{os.path.basename(file_path)}\" to {self.drive}, it will be "
+                                    f"moved on the next sync: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        finally:
+            self.drive_space.release(reserved_size)
+
+    @staticmethod
+    def link_file(source_path: str, link_path: str) -> bool:
+        """
+        Hardlink a track, replacing anything left at the link's path.
+
+        :return: True if the track was linked, False if it has to be copied instead.
+        """
+        try:
+            if os.path.exists(link_path):
+                os.remove(link_path)
+            os.link(source_path, link_path)
+            return True
+        except OSError:
+            return False
+
+    def report(self) -> str:
+        """:return: A one line summary of the tracks written to the drive and its free space."""
+        report = f"{self.drive}: {self.moved_tracks} tracks written ({self.moved_bytes / (1024 * 1024):.0f}MB"
+        if self.linked_tracks:
+            report += f", {self.linked_tracks} hardlinked"
+        report += f"), {self.drive_space.free_space() / (1024 * 1024):.0f}MB free"
+        if self.failed_moves:
+            report += f", {self.failed_moves} failed"
+        if self.skipped_tracks:
+            report += f", {self.skipped_tracks} skipped as the drive is full"
+        return report
+
+    def shutdown(self, always_report: bool = False) -> None:
+        """
+        Wait for every queued track to be moved, then log the writer's report.
+
+        :param always_report: Log the report even if no tracks were written.
+        """
+        if self.is_shut_down:
+            return
+        self.is_shut_down = True
+        self.executor.shutdown(wait=True)
+        if always_report or self.moved_tracks or self.failed_moves or self.skipped_tracks:
+            self.event_logger.info(self.report())
+
+
+class DriveFanOut:
+    """
+    Writes each finished track to every DJ library drive being synced, with one DriveWriter per drive so each drive
+    gets its own sequential writes, and the drives are written in parallel. Tracks are downloaded and converted once,
+    and copied from the staging directory, or the main DJ drive without one, to each mirror drive. A staged track is
+    removed once every drive has it.
+    """
+
+    def __init__(self, drive_writer: Optional[DriveWriter], mirror_writers: list[DriveWriter],
+                 drive_space: DriveSpace) -> None:
+        """
+        Initialize the DriveFanOut.
+
+        :param drive_writer: The main DJ drive's writer, keeping its source files, or None if tracks are written
+            straight to the main drive.
+        :param mirror_writers: A writer, keeping its source files, for each mirror drive.
+        :param drive_space: Space reservations on the main DJ drive.
+        """
+        self.drive_writer = drive_writer
+        self.mirror_writers = mirror_writers
+        self.drive_space = drive_space
+
+    @property
+    def writers(self) -> list[DriveWriter]:
+        return ([self.drive_writer] if self.drive_writer else []) + self.mirror_writers
+
+    def submit(self, file_path: str, reserved_size: float = 0) -> list[concurrent.futures.Future]:
+        """
+        Queue a track to be written to every drive that doesn't have it yet.
+
+        :param file_path: The track's path on the main DJ drive.
+        :param reserved_size: The space reserved for the track on the main DJ drive.
+        :return: The futures of the writes.
+        """
+        if self.drive_writer:
+            futures = [self.drive_writer.submit(file_path, reserved_size)]
+        else:
+            self.drive_space.release(reserved_size)
+            futures = []
+        futures = [future for future in futures + [writer.submit_copy(file_path) for writer in self.mirror_writers]
+                   if future]
+
+        if self.drive_writer and futures:
+            staged_path = self.drive_writer.staged_path(file_path)
+            remaining = [len(futures)]
+            lock = threading.Lock()
+
+            def remove_when_written(_: concurrent.futures.Future) -> None:
+                with lock:
+                    remaining[0] -= 1
+                    if remaining[0]:
+                        return
+                if all(not future.exception() and future.result() for future in futures):
+                    try:
+                        os.remove(staged_path)
+                    except OSError:
+                        pass
+
+            for future in futures:
+                future.add_done_callback(remove_when_written)
+        return futures
+
+    def shutdown(self) -> None:
+        """Wait for every queued track to be written, logging each drive's report."""
+        for writer in self.writers:
+            writer.shutdown(always_report=True)
@@ -0,0 +1,326 @@
+import argparse
+import concurrent.futures
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from track_layout import LayoutMigration, TrackLayout
+from utils import LOGGER_NAME, VIDEO_ID_TAG, VIDEO_INDEX_FILE, load_hashmap_from_json, save_hashmap_to_json
+
+SCAN_METHODS = ("isrc", "video_id", "audio_hash")
+ID3V1_SIZE = 128
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class DuplicateGroup(NamedTuple):
+    """A set of files holding the same recording, and the one file that will be kept."""
+    keep: str
+    duplicates: list[str]
+    matched_by: set[str]
+
+
+def audio_data_range(file_path: str) -> tuple[int, int]:
+    """
+    Find the audio frames of an MP3 file, excluding the ID3v2 header and ID3v1 footer. Files holding the same audio
+    with different tags then compare equal.
+
+    :param file_path: Path to the MP3 file.
+    :return: The start and end byte offsets of the audio data.
+    """
+    end = os.path.getsize(file_path)
+    with open(file_path, "rb") as file:
+        header = file.read(10)
+        start = 0
+        if len(header) == 10 and header[:3] == b"ID3":
+            # The tag size is a 28 bit "syncsafe" integer, 7 bits per byte
+            start = 10 + ((header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9])
+            if header[5] & 0x10:
+                start += 10  # Footer present
+
+        if end - start >= ID3V1_SIZE:
+            file.seek(end - ID3V1_SIZE)
+            if file.read(3) == b"TAG":
+                end -= ID3V1_SIZE
+
+    return min(start, end), end
+
+
+def audio_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Hash the audio data of an MP3 file, ignoring its tags.
+
+    :param file_path: Path to the MP3 file.
+    :param chunk_size: The number of bytes to read at a time.
+    :return: Hex digest of the audio data.
+    """
+    start, end = audio_data_range(file_path)
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def read_track_tags(file_path: str) -> tuple[Optional[str], Optional[str]]:
+    """
+    Read the ISRC and source YouTube video ID tags written by set_track_metadata.
+
+    :param file_path: Path to the MP3 file.
+    :return: The ISRC and video ID, either of which is None if the file doesn't have it.
+    """
+    from mutagen.id3 import ID3, ID3NoHeaderError
+
+    try:
+        tags = ID3(file_path)
+    except (ID3NoHeaderError, OSError):
+        return None, None
+
+    isrc = tags.get("TSRC")
+    video_id = tags.get(f"TXXX:{VIDEO_ID_TAG}")
+    return (str(isrc.text[0]) if isrc else None), (str(video_id.text[0]) if video_id else None)
+
+
+class DuplicateScanner:
+    """
+    Finds files on the DJ library drive that hold the same recording, by ISRC, YouTube video ID or audio hash, and
+    reclaims the space by pointing every Spotify track at one copy and deleting the others.
+
+    Duplicates come from the same recording being released under several Spotify track IDs (single, album,
+    compilation) before the video index existed, or from different videos of the same recording.
+    """
+
+    def __init__(self, drive: str, tracks_folder: str, serato_subcrate_dir: Optional[str] = None,
+                 rekordbox_playlist_folder: Optional[str] = None) -> None:
+        """
+        Initialize the DuplicateScanner, loading the drive's track and video indexes.
+
+        :param drive: The DJ library drive to scan.
+        :param tracks_folder: The folder on the drive the tracks are downloaded to.
+        :param serato_subcrate_dir: The Serato subcrates folder on the drive, to point the crates and database at the
+            kept files. None to leave them for the next sync.
+        :param rekordbox_playlist_folder: The Rekordbox playlists folder on the drive, to point the playlists and XML
+            library at the kept files. None to leave them for the next sync.
+        """
+        self.drive = drive
+        self.tracks_folder = tracks_folder
+        self.track_dir = os.path.join(drive, tracks_folder)
+        self.serato_subcrate_dir = serato_subcrate_dir
+        self.rekordbox_playlist_folder = rekordbox_playlist_folder
+        self.id_to_video_map = load_hashmap_from_json(drive)
+        self.video_to_file_map = load_hashmap_from_json(drive, VIDEO_INDEX_FILE)
+
+    def _full_path(self, index_path: str) -> str:
+        return os.path.normcase(os.path.normpath(os.path.join(self.drive, index_path)))
+
+    def _index_path(self, file_path: str) -> str:
+        return os.path.splitdrive(file_path)[1]
+
+    def list_tracks(self) -> list[str]:
+        """:return: Every MP3 file in the tracks folder and its subfolders, such as the shards of a sharded layout."""
+        # Imported here as the integrity scanner imports this module
+        from integrity_scanner import scan_tree
+        from yt_download_helper import TRANSCODE_TEMP_SUFFIX
+
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            files = scan_tree(executor, self.track_dir)
+        return sorted(file_path for file_path in files
+                      if file_path.lower().endswith(".mp3") and not file_path.endswith(TRANSCODE_TEMP_SUFFIX))
+
+    def scan(self, methods: tuple[str, ...] = SCAN_METHODS) -> list[DuplicateGroup]:
+        """
+        Find groups of duplicate files.
+
+        :param methods: Which of "isrc", "video_id" and "audio_hash" to match files by.
+        :return: The groups of duplicate files, each with the file chosen to keep.
+        """
+        unknown_methods = set(methods) - set(SCAN_METHODS)
+        if unknown_methods:
+            raise ValueError(f"Unknown scan methods {unknown_methods}, expected some of {SCAN_METHODS}")
+
+        files = self.list_tracks()
+        keys: dict[str, list[tuple[str, str]]] = defaultdict(list)
+
+        if "isrc" in methods or "video_id" in methods:
+            file_to_video_id = {self._full_path(path): video_id for video_id, path in self.video_to_file_map.items()}
+            for file_path in files:
+                isrc, video_id = read_track_tags(file_path)
+                video_id = video_id or file_to_video_id.get(file_path)
+                if "isrc" in methods and isrc:
+                    keys[file_path].append(("isrc", isrc))
+                if "video_id" in methods and video_id:
+                    keys[file_path].append(("video_id", video_id))
+
+        if "audio_hash" in methods:
+            # Only hash files whose audio is the same length as another file's, as no other file can match
+            files_by_audio_size = defaultdict(list)
+            for file_path in files:
+                start, end = audio_data_range(file_path)
+                files_by_audio_size[end - start].append(file_path)
+            for same_size_files in files_by_audio_size.values():
+                if len(same_size_files) > 1:
+                    for file_path in same_size_files:
+                        keys[file_path].append(("audio_hash", audio_hash(file_path)))
+
+        return self._group(files, keys)
+
+    def _group(self, files: list[str], keys: dict[str, list[tuple[str, str]]]) -> list[DuplicateGroup]:
+        """
+        Join files sharing any key into groups, so a file matching one file by ISRC and another by audio hash puts
+        all three in the same group.
+        """
+        parent = {file_path: file_path for file_path in files}
+
+        def find(file_path):
+            while parent[file_path] != file_path:
+                parent[file_path] = parent[parent[file_path]]
+                file_path = parent[file_path]
+            return file_path
+
+        first_file_with_key = {}
+        matched_by = defaultdict(set)
+        for file_path in files:
+            for key in keys.get(file_path, []):
+                if key in first_file_with_key:
+                    root, other_root = find(file_path), find(first_file_with_key[key])
+                    parent[root] = other_root
+                    matched_by[file_path].add(key[0])
+                    matched_by[first_file_with_key[key]].add(key[0])
+                else:
+                    first_file_with_key[key] = file_path
+
+        members = defaultdict(list)
+        for file_path in files:
+            members[find(file_path)].append(file_path)
+
+        references = defaultdict(int)
+        for index_path in self.id_to_video_map.values():
+            references[self._full_path(index_path)] += 1
+
+        groups = []
+        for group_files in members.values():
+            if len(group_files) < 2:
+                continue
+            # Keep the copy most tracks already point at, then the oldest
+            group_files.sort(key=lambda file_path: (-references[file_path], os.path.getmtime(file_path), file_path))
+            groups.append(DuplicateGroup(group_files[0], group_files[1:],
+                                         set().union(*(matched_by[file_path] for file_path in group_files))))
+        return groups
+
+    def reclaim(self, groups: list[DuplicateGroup], dry_run: bool = True) -> int:
+        """
+        Point every track and video that uses a duplicate file at the kept file, along with the playlist membership,
+        Serato crates and database, and Rekordbox playlists and XML library, then delete the duplicates.
+
+        :param groups: The duplicate groups found by scan.
+        :param dry_run: Only report what would be done, without changing anything.
+        :return: The number of bytes reclaimed, or that would be reclaimed on a dry run.
+        """
+        replacements = {duplicate: group.keep for group in groups for duplicate in group.duplicates}
+        reclaimed_bytes = sum(os.path.getsize(duplicate) for duplicate in replacements)
+
+        for duplicate, keep in replacements.items():
+            logger.info(f"{'Would remove' if dry_run else 'Removing'} duplicate {duplicate}, keeping {keep}")
+        if dry_run:
+            return reclaimed_bytes
+
+        for index in (self.id_to_video_map, self.video_to_file_map):
+            for key, index_path in index.items():
+                keep = replacements.get(self._full_path(index_path))
+                if keep:
+                    index[key] = self._index_path(keep)
+        save_hashmap_to_json(self.id_to_video_map, self.drive)
+        save_hashmap_to_json(self.video_to_file_map, self.drive, VIDEO_INDEX_FILE)
+        self.rewrite_library_files(replacements)
+
+        # Only delete files once nothing in the index points at them
+        for duplicate in replacements:
+            os.remove(duplicate)
+        return reclaimed_bytes
+
+    def rewrite_library_files(self, replacements: dict[str, str]) -> None:
+        """
+        Point the playlist membership and the DJ library files on the drive at the kept files, so no crate or playlist
+        is left with a deleted file.
+
+        :param replacements: Each duplicate file's path, to the path of the file kept in its place.
+        """
+        moves = {self._index_path(duplicate): self._index_path(keep) for duplicate, keep in replacements.items()}
+        migration = LayoutMigration(self.drive, self.tracks_folder, TrackLayout(), self.serato_subcrate_dir or "",
+                                    self.rekordbox_playlist_folder or "")
+        migration.rewrite_indexes(moves)
+
+        if self.serato_subcrate_dir is None:
+            logger.warning("Sync again to point the Serato crates and database at the kept files")
+        else:
+            migration.rewrite_crates(moves)
+            self.rewrite_serato_database(replacements)
+
+        if self.rekordbox_playlist_folder is None:
+            logger.warning("Sync again to point the Rekordbox playlists and XML library at the kept files")
+        else:
+            migration.rewrite_rekordbox_files(moves)
+
+    def rewrite_serato_database(self, replacements: dict[str, str]) -> None:
+        """
+        Point the Serato database's entries for duplicate files at the kept files. A duplicate's entry is dropped
+        instead if the kept file has its own, so Serato doesn't list the track twice.
+
+        :param replacements: Each duplicate file's path, to the path of the file kept in its place.
+        """
+        from dj_libraries.serato_database import SeratoDatabase, path_key
+
+        serato_database = SeratoDatabase(self.drive, self.serato_subcrate_dir)
+        if not os.path.isfile(serato_database.file_path):
+            return
+
+        database_replacements = {path_key(serato_database.serato_path(duplicate)): serato_database.serato_path(keep)
+                                 for duplicate, keep in replacements.items()}
+        entries = []
+        for tag, fields in serato_database.entries:
+            if tag == "otrk":
+                file_path = next((value for field_tag, value in fields if field_tag == "pfil"), None)
+                keep = database_replacements.get(path_key(file_path)) if file_path else None
+                if keep:
+                    if path_key(keep) in serato_database.track_positions:
+                        continue
+                    fields = [(field_tag, keep if field_tag == "pfil" else value) for field_tag, value in fields]
+            entries.append((tag, fields))
+        serato_database.entries = entries
+        serato_database.save()
+
+
+def main() -> None:
+    from settings import SettingsSingleton
+
+    parser = argparse.ArgumentParser(description="Find duplicate tracks on the DJ library drive and reclaim the space.")
+    parser.add_argument("--drive", help="The DJ library drive to scan, defaults to the drive in settings.yaml.")
+    parser.add_argument("--by", nargs="+", choices=SCAN_METHODS, default=list(SCAN_METHODS),
+                        help="How to match duplicate files.")
+    parser.add_argument("--delete", action="store_true",
+                        help="Remove the duplicates. Without this, only report what would be removed.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    settings = SettingsSingleton()
+    scanner = DuplicateScanner(args.drive or settings.dj_library_drive, settings.tracks_folder,
+                               settings.serato_subcrate_dir, settings.rekordbox_playlist_folder)
+    groups = scanner.scan(tuple(args.by))
+    reclaimed_bytes = scanner.reclaim(groups, dry_run=not args.delete)
+
+    duplicate_count = sum(len(group.duplicates) for group in groups)
+    action = "Reclaimed" if args.delete else "Would reclaim"
+    logger.info(f"Found {duplicate_count} duplicate files in {len(groups)} groups. "
+                f"{action} {reclaimed_bytes / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 import logging
 import multiprocessing
+import queue
+import threading
+from multiprocessing.managers import SyncManager
 from queue import Queue
 from typing import Optional
-import customtkinter as ctk
 
+from cancellation import create_manager
+from logging_pipeline import create_log_queue
 from utils import LOGGER_NAME
 
 
@@ -11,14 +15,20 @@ class EventQueueHandler:
     """
     This handles the events queue allowing custom logging and progress bar update across
     multiple progresses and sub processes.
+
+    Only the messages shown in the ui go through the events queue. Every log record, including debug, goes through
+    the separate log queue to the log writer thread, so nothing is written to the log on the ui thread.
     """
 
     def __init__(self):
-        self.manager: multiprocessing.Manager = multiprocessing.Manager()
+        self.manager: SyncManager = create_manager()
         self.event_queue: Queue = self.manager.Queue(-1)
+        self.log_queue: multiprocessing.Queue = create_log_queue()
 
         self.ui: Optional['UI'] = None
         self.logger = logging.getLogger(LOGGER_NAME)
+        self.metrics: Optional['SyncMetrics'] = None
+        self.metrics_server: Optional['MetricsServer'] = None
 
     def __exit__(self):
         if self.manager:
@@ -27,6 +37,36 @@ class EventQueueHandler:
     def set_ui(self, ui: 'UI') -> None:
         self.ui = ui
 
+    def start_metrics(self, port: int) -> None:
+        """
+        Collect the metric events from the queue and serve them on a local port.
+
+        :param port: The port to serve the metrics on.
+        """
+        from metrics import MetricsServer, SyncMetrics
+
+        self.metrics = SyncMetrics(self.event_queue.qsize)
+        self.metrics_server = MetricsServer(self.metrics, port)
+        self.logger.info(f"Serving sync metrics on http://127.0.0.1:{self.metrics_server.port}/metrics and /status")
+
+    def process_queue_headless(self, stop_event: threading.Event) -> None:
+        """
+        Take events off the queue when there is no ui, such as a sync run from the command line, until stopped. Only
+        metric events are used, the messages are already logged by the EventQueueLogger that sent them.
+
+        :param stop_event: Set to stop taking events.
+        """
+        while not stop_event.is_set():
+            try:
+                event_type, data = self.event_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                # The manager has shut down
+                return
+            if event_type == "metric" and self.metrics:
+                self.metrics.record(*data)
+
     def process_queue(self) -> None:
         """
         Run periodically by the UI, this function will check the queue until empty and runs the relevant
@@ -34,10 +74,12 @@ class EventQueueHandler:
         """
         handled_queue_events = {
             "update_progress": self.update_progress,
+            "update_status": self.update_status,
             "log_debug": self.log_debug,
             "log_info": self.log_info,
             "log_error": self.log_error,
-            "enable_download_button": self.enable_download_button
+            "enable_download_button": self.enable_download_button,
+            "metric": self.record_metric
         }
 
         # Process all available messages in the queue
@@ -60,50 +102,75 @@ class EventQueueHandler:
         if self.ui:
             self.ui.app.after(100, self.process_queue)
 
+    def record_metric(self, data: tuple) -> None:
+        if self.metrics:
+            self.metrics.record(*data)
+
     def enable_download_button(self, data) -> None:
-        self.ui.download_button.configure(state=ctk.NORMAL)
+        self.ui.enable_download_button()
 
     def update_progress(self, progress: float) -> None:
         self.ui.progress_bar.set_progress(progress)
 
+    def update_status(self, status: str) -> None:
+        self.ui.progress_bar.set_status(status)
+
     def log_debug(self, message: str) -> None:
-        print(message)
         self.logger.debug(message)
 
     def log_info(self, message: str) -> None:
-        print(message)
-        self.logger.info(message)
         self.ui.ui_output_log.info(message)
 
     def log_error(self, message: str) -> None:
-        print(message)
-        self.logger.error(message)
         self.ui.ui_output_log.error(message)
 
 
 class EventQueueLogger:
     """
-    Act as a logger class for adding to the events queue
+    Act as a logger class for adding to the events queue. Info and error messages are shown in the ui through the
+    events queue, and every message is also logged, through the log queue if the process's logging has been set up
+    with logging_pipeline.configure_process_logging.
     """
 
-    def __init__(self, queue):
+    def __init__(self, queue, metrics: bool = False):
+        """
+        :param queue: The events queue.
+        :param metrics: Send metric events, only when something is collecting them, as each is a trip to the queue.
+        """
         self.queue = queue
+        self.metrics = metrics
+        self.logger = logging.getLogger(LOGGER_NAME)
 
     def debug(self, message: str) -> None:
-        self.queue.put(("log_debug", message))
+        self.logger.debug(message)
 
     def info(self, message: str) -> None:
+        self.logger.info(message)
         self.queue.put(("log_info", message))
 
     def error(self, message: str) -> None:
+        self.logger.error(message)
         self.queue.put(("log_error", message))
 
     def update_progress(self, progress: float) -> None:
         self.queue.put(("update_progress", progress))
 
+    def update_status(self, status: str) -> None:
+        self.queue.put(("update_status", status))
+
     def enable_download_button(self) -> None:
         self.queue.put(("enable_download_button", None))
 
+    def metric(self, kind: str, *values) -> None:
+        """
+        Send a metric event for the metrics endpoint, see metrics.SyncMetrics for the kinds of event.
+
+        :param kind: The kind of event.
+        :param values: The event's values.
+        """
+        if self.metrics:
+            self.queue.put(("metric", (kind, *values)))
+
 
 def update_progress_bar(queue, progress: float) -> None:
     """
@@ -0,0 +1,139 @@
+import json
+import os
+import time
+from typing import Optional
+
+from utils import write_file_if_changed
+
+# Errors that won't go away by retrying the same video, matched by name so pytube and pytubefix errors (and errors
+# re-raised from worker processes) are all recognised. These are parked until the user supplies a custom URL.
+PERMANENT_ERROR_NAMES = {
+    "AgeRestrictedError",
+    "AgeCheckRequiredError",
+    "AgeCheckRequiredAccountError",
+    "MembersOnly",
+    "VideoPrivate",
+    "VideoRegionBlocked",
+    "RecordingUnavailable",
+    "LiveStreamError",
+    "NoAudioStreamError",
+}
+
+
+def is_permanent_error(error: BaseException) -> bool:
+    return type(error).__name__ in PERMANENT_ERROR_NAMES
+
+
+class FailureLedger:
+    """
+    Persistent record of tracks that failed to download, keyed by Spotify track ID and saved on the DJ library
+    drive. Lets re-syncs skip known-bad tracks instead of repeating the same search and failing download every run.
+
+    Failed tracks are retried with exponential backoff. Tracks that failed with a permanent error, such as an age
+    restricted video, are parked until the user gives the track a custom URL in id_to_video_map.json.
+    """
+
+    def __init__(self,
+                 file_drive: str,
+                 file_path: str = "failure_ledger.json",
+                 base_retry_delay: float = 60 * 60,
+                 max_retry_delay: float = 30 * 24 * 60 * 60) -> None:
+        """
+        Initialize the FailureLedger, loading any existing ledger from the drive.
+
+        :param file_drive: The drive to save the ledger to.
+        :param file_path: The ledger's file name.
+        :param base_retry_delay: Seconds to wait before retrying a track after its first failure. Doubles with each
+            further failure.
+        :param max_retry_delay: The longest time, in seconds, to wait between retries.
+        """
+        self.file_location = os.path.join(file_drive, file_path)
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.entries: dict[str, dict] = {}
+
+        if os.path.isfile(self.file_location):
+            with open(self.file_location, 'r') as file:
+                self.entries = json.load(file)
+
+    def save(self) -> None:
+        write_file_if_changed(self.file_location, json.dumps(self.entries, indent=4).encode())
+
+    def retry_delay(self, attempts: int) -> float:
+        """The time to wait before retrying a track that has failed `attempts` times in a row."""
+        return min(self.base_retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+
+    def should_skip(self, track_id: str, custom_url: Optional[str] = None, now: Optional[float] = None) -> bool:
+        """
+        Check whether a track should be skipped this run because of earlier failures.
+
+        :param track_id: The Spotify track ID.
+        :param custom_url: The custom YouTube URL set for the track in id_to_video_map, if any.
+        :param now: The current time, defaults to time.time().
+        :return: True if the track is parked or still backing off.
+        """
+        entry = self.entries.get(track_id)
+        if not entry:
+            return False
+
+        if entry["permanent"]:
+            # Only a new custom URL, different to any that already failed, can fix a permanent failure
+            return not custom_url or custom_url == entry.get("custom_url")
+
+        now = time.time() if now is None else now
+        return now < entry["last_attempt"] + self.retry_delay(entry["attempts"])
+
+    def record_failure(self, track_id: str, track_identifier: str, error: BaseException,
+                       custom_url: Optional[str] = None, now: Optional[float] = None) -> None:
+        """
+        Record a failed download attempt.
+
+        :param track_id: The Spotify track ID.
+        :param track_identifier: Human readable "Artist - Track" name, for the report.
+        :param error: The error the track failed with.
+        :param custom_url: The custom YouTube URL the attempt used, if any.
+        :param now: The current time, defaults to time.time().
+        """
+        entry = self.entries.get(track_id, {"attempts": 0})
+        self.entries[track_id] = {
+            "track": track_identifier,
+            "error": type(error).__name__,
+            "message": str(error)[:500],
+            "attempts": entry["attempts"] + 1,
+            "last_attempt": time.time() if now is None else now,
+            "permanent": is_permanent_error(error),
+            "custom_url": custom_url,
+        }
+
+    def record_success(self, track_id: str) -> None:
+        self.entries.pop(track_id, None)
+
+    def outstanding_failures(self) -> list[dict]:
+        """
+        :return: The ledger entries, with their track IDs, parked tracks first and then by most attempts.
+        """
+        failures = [{"track_id": track_id, **entry} for track_id, entry in self.entries.items()]
+        return sorted(failures, key=lambda failure: (not failure["permanent"], -failure["attempts"]))
+
+    def report(self) -> list[str]:
+        """
+        Build a human readable report of outstanding failures.
+
+        :return: Report lines, starting with a summary line. Empty if there are no failures.
+        """
+        failures = self.outstanding_failures()
+        if not failures:
+            return []
+
+        parked = sum(failure["permanent"] for failure in failures)
+        lines = [f"{len(failures)} tracks have outstanding download failures, {parked} need a custom URL in "
+                 f"id_to_video_map.json"]
+        for failure in failures:
+            if failure["permanent"]:
+                retry = "needs custom URL"
+            else:
+                retry_time = failure["last_attempt"] + self.retry_delay(failure["attempts"])
+                retry = f"retry after {time.strftime('%Y-%m-%d %H:%M', time.localtime(retry_time))}"
+            lines.append(f"  {failure['track']} ({failure['track_id']}): {failure['error']}, "
+                         f"{failure['attempts']} attempts, {retry}")
+        return lines
@@ -0,0 +1,295 @@
+import argparse
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+
+from utils import LOGGER_NAME, VIDEO_INDEX_FILE, load_hashmap_from_json, save_hashmap_to_json, write_file_if_changed
+
+MEMBERSHIP_FILE = "playlist_membership.json"
+QUARANTINE_INDEX_FILE = "quarantine.json"
+DAY_SECONDS = 24 * 60 * 60
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class PlaylistMembership:
+    """
+    Record, saved on the DJ library drive, of the track files in each playlist at its last complete sync, and the last
+    time each track file was in any synced playlist. The garbage collector works out which files are still needed
+    from it.
+    """
+
+    def __init__(self, file_drive: str, file_path: str = MEMBERSHIP_FILE) -> None:
+        """
+        Initialize the PlaylistMembership, loading any existing record from the drive.
+
+        :param file_drive: The drive to save the record to.
+        :param file_path: The record's file name.
+        """
+        self.file_location = os.path.join(file_drive, file_path)
+        self.playlists: dict[str, list[str]] = {}
+        self.last_seen: dict[str, float] = {}
+
+        if os.path.isfile(self.file_location):
+            with open(self.file_location, "r") as file:
+                membership = json.load(file)
+            self.playlists = membership.get("playlists", {})
+            self.last_seen = membership.get("last_seen", {})
+
+    def save(self) -> None:
+        write_file_if_changed(self.file_location,
+                              json.dumps({"playlists": self.playlists, "last_seen": self.last_seen}, indent=1).encode())
+
+    def record_playlist(self, playlist_name: str, file_paths: list[str], now: Optional[float] = None) -> None:
+        """
+        Record a playlist's track files after it has been synced in full.
+
+        :param playlist_name: The playlist's name.
+        :param file_paths: The playlist's track file paths.
+        :param now: The current time, defaults to time.time().
+        """
+        now = time.time() if now is None else now
+        # Stored without the drive, the same as the track index, so the record still matches if the drive letter changes
+        self.playlists[playlist_name] = [os.path.splitdrive(file_path)[1] for file_path in file_paths]
+        for file_path in self.playlists[playlist_name]:
+            self.last_seen[file_path] = now
+
+
+class CollectableFile(NamedTuple):
+    """A track file no current playlist references."""
+    index_path: str
+    size: int
+    last_seen: float
+
+
+class GarbageCollectionPlan(NamedTuple):
+    """What a garbage collection pass would do."""
+    collectable: list[CollectableFile]
+    expired: list[str]
+    stale_playlists: list[str]
+    unsynced_playlists: list[str]
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        return sum(collectable.size for collectable in self.collectable)
+
+
+class GarbageCollector:
+    """
+    Removes track files that are no longer in any synced playlist. The live set is every file in a current
+    playlist's last complete sync, plus every file that was in a synced playlist within the retention window, so a
+    track briefly removed from a playlist isn't downloaded again. Everything else the track index points at is moved to
+    the quarantine folder on the same drive, which is a rename rather than a copy, and removed from the indexes.
+    Quarantined files are deleted once they have been there for the quarantine period.
+
+    Each pass reads the indexes and the membership record once and stats each candidate file once, so it runs in time
+    linear in the size of the library.
+    """
+
+    def __init__(self, drive: str, playlist_names: list[str], serato_subcrate_dir: str,
+                 rekordbox_playlist_folder: str, quarantine_folder: str = "PySync DJ Quarantine",
+                 retention_days: float = 30, quarantine_days: float = 30) -> None:
+        """
+        Initialize the GarbageCollector, loading the drive's indexes and playlist membership.
+
+        :param drive: The DJ library drive to collect.
+        :param playlist_names: The names of the playlists currently synced, including "Liked Songs" if liked songs are
+            downloaded.
+        :param serato_subcrate_dir: The Serato crates folder on the drive.
+        :param rekordbox_playlist_folder: The Rekordbox playlists folder on the drive.
+        :param quarantine_folder: The folder on the drive to move unreferenced files to.
+        :param retention_days: How long a file stays live after it was last in a synced playlist.
+        :param quarantine_days: How long quarantined files are kept before they are deleted. 0 deletes unreferenced
+            files straight away.
+        """
+        self.drive = drive
+        self.playlist_names = list(playlist_names)
+        self.serato_subcrate_dir = serato_subcrate_dir
+        self.rekordbox_playlist_folder = rekordbox_playlist_folder
+        self.quarantine_dir = os.path.join(drive, quarantine_folder)
+        self.retention_days = retention_days
+        self.quarantine_days = quarantine_days
+
+        self.membership = PlaylistMembership(drive)
+        self.id_to_video_map = load_hashmap_from_json(drive)
+        self.video_to_file_map = load_hashmap_from_json(drive, VIDEO_INDEX_FILE)
+        self.quarantine_index = self.load_quarantine_index()
+
+    def load_quarantine_index(self) -> dict[str, dict]:
+        """:return: Quarantined file paths, relative to the quarantine folder, to their original path and when."""
+        quarantine_index_path = os.path.join(self.quarantine_dir, QUARANTINE_INDEX_FILE)
+        if not os.path.isfile(quarantine_index_path):
+            return {}
+        with open(quarantine_index_path, "r") as file:
+            return json.load(file)
+
+    def save_quarantine_index(self) -> None:
+        write_file_if_changed(os.path.join(self.quarantine_dir, QUARANTINE_INDEX_FILE),
+                              json.dumps(self.quarantine_index, indent=1).encode())
+
+    def plan(self, now: Optional[float] = None) -> GarbageCollectionPlan:
+        """
+        Work out which files can be collected. Nothing is collected while any current playlist has never been synced
+        in full, as the live set can't be known without it.
+
+        :param now: The current time, defaults to time.time().
+        :return: The plan.
+        """
+        now = time.time() if now is None else now
+        unsynced_playlists = [name for name in self.playlist_names if name not in self.membership.playlists]
+        stale_playlists = [name for name in self.membership.playlists if name not in self.playlist_names]
+        expired = [quarantined_path for quarantined_path, entry in self.quarantine_index.items()
+                   if now - entry["quarantined_at"] >= self.quarantine_days * DAY_SECONDS]
+        if unsynced_playlists:
+            return GarbageCollectionPlan([], expired, stale_playlists, unsynced_playlists)
+
+        live = {os.path.normpath(file_path)
+                for name in self.playlist_names for file_path in self.membership.playlists[name]}
+        index_paths = dict.fromkeys(index_path for index in (self.id_to_video_map, self.video_to_file_map)
+                                    for index_path in index.values() if "youtube.com/" not in index_path)
+
+        retention_cutoff = now - self.retention_days * DAY_SECONDS
+        collectable = []
+        for index_path in index_paths:
+            if os.path.normpath(index_path) in live:
+                continue
+            last_seen = self.membership.last_seen.get(index_path)
+            if last_seen is not None and last_seen >= retention_cutoff:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.drive, index_path))
+            except OSError:
+                # Missing files are for the integrity scanner to deal with
+                continue
+            # Files downloaded before playlists were recorded count as last seen when they were written
+            last_seen = stat.st_mtime if last_seen is None else last_seen
+            if last_seen < retention_cutoff:
+                collectable.append(CollectableFile(index_path, stat.st_size, last_seen))
+
+        return GarbageCollectionPlan(collectable, expired, stale_playlists, unsynced_playlists)
+
+    def apply(self, plan: GarbageCollectionPlan, dry_run: bool = True, now: Optional[float] = None) -> None:
+        """
+        Carry out a garbage collection plan: quarantine or delete the unreferenced files, remove them from the
+        indexes, delete expired quarantined files, and remove the crates and playlists of playlists no longer synced.
+
+        :param plan: The plan from plan.
+        :param dry_run: Only report what would be done, without changing anything.
+        :param now: The current time, defaults to time.time().
+        """
+        now = time.time() if now is None else now
+        prefix = "Would " if dry_run else ""
+        action = "quarantine" if self.quarantine_days else "delete"
+        for collectable in plan.collectable:
+            days_unused = int((now - collectable.last_seen) // DAY_SECONDS)
+            logger.info(f"{prefix}{action} {collectable.index_path}: not in a playlist for {days_unused} days")
+        for quarantined_path in plan.expired:
+            logger.info(f"{prefix}delete quarantined {quarantined_path}")
+        for playlist_name in plan.stale_playlists:
+            logger.info(f"{prefix}remove the crate and playlist of {playlist_name}, which is no longer synced")
+        if dry_run:
+            return
+
+        collected = set()
+        for collectable in plan.collectable:
+            file_path = os.path.join(self.drive, collectable.index_path)
+            try:
+                if self.quarantine_days:
+                    quarantined_path = os.path.relpath(file_path, self.drive)
+                    os.makedirs(os.path.dirname(os.path.join(self.quarantine_dir, quarantined_path)), exist_ok=True)
+                    os.replace(file_path, os.path.join(self.quarantine_dir, quarantined_path))
+                    self.quarantine_index[quarantined_path] = {"original": collectable.index_path,
+                                                               "quarantined_at": now}
+                else:
+                    os.remove(file_path)
+            except OSError as e:
+                logger.error(f"Couldn't {action} {collectable.index_path}: {e}")
+                continue
+            collected.add(collectable.index_path)
+
+        for index in (self.id_to_video_map, self.video_to_file_map):
+            for key in [key for key, index_path in index.items() if index_path in collected]:
+                del index[key]
+        for index_path in collected:
+            self.membership.last_seen.pop(index_path, None)
+        save_hashmap_to_json(self.id_to_video_map, self.drive)
+        save_hashmap_to_json(self.video_to_file_map, self.drive, VIDEO_INDEX_FILE)
+
+        for quarantined_path in plan.expired:
+            try:
+                os.remove(os.path.join(self.quarantine_dir, quarantined_path))
+            except FileNotFoundError:
+                pass
+            del self.quarantine_index[quarantined_path]
+        if self.quarantine_index or plan.expired:
+            self.save_quarantine_index()
+
+        for playlist_name in plan.stale_playlists:
+            self.remove_playlist_files(playlist_name)
+            del self.membership.playlists[playlist_name]
+        self.membership.save()
+
+    def remove_playlist_files(self, playlist_name: str) -> None:
+        """Delete a playlist's Serato crate and Rekordbox M3U playlist."""
+        for file_path in (os.path.join(self.drive, self.serato_subcrate_dir, f"PySync DJ%%{playlist_name}.crate"),
+                          os.path.join(self.drive, self.rekordbox_playlist_folder, f"{playlist_name}.m3u")):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def rebuild_xml(self, event_logger) -> bool:
+        """
+        Write the Rekordbox XML library again from the current playlists' last complete syncs, dropping playlists that
+        are no longer synced. Uses the drive and folders in settings.
+
+        :param event_logger: Logger for the XML library.
+        :return: True if the XML library was written, False if it was unchanged.
+        """
+        from dj_libraries.rekordbox_xml_library import RekordboxXMLLibrary
+
+        itunes_library = RekordboxXMLLibrary(event_logger)
+        for playlist_name in self.playlist_names:
+            itunes_library.add_playlist(playlist_name, self.membership.playlists.get(playlist_name, []))
+        return itunes_library.save_xml()
+
+
+def main() -> None:
+    import queue
+    from event_queue import EventQueueLogger
+    from settings import SettingsSingleton
+
+    parser = argparse.ArgumentParser(description="Remove tracks that are no longer in any synced playlist from the DJ "
+                                                 "library drive.")
+    parser.add_argument("--drive", help="The DJ library drive to collect, defaults to the drive in settings.yaml.")
+    parser.add_argument("--apply", action="store_true",
+                        help="Carry out the plan. Without this, only report what would be done.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    settings = SettingsSingleton()
+    if args.drive:
+        settings.update_setting("dj_library_drive", args.drive)
+
+    playlist_names = list(settings.playlists_to_download or {})
+    if settings.download_liked_songs:
+        playlist_names.insert(0, "Liked Songs")
+    collector = GarbageCollector(settings.dj_library_drive, playlist_names, settings.serato_subcrate_dir,
+                                 settings.rekordbox_playlist_folder, settings.gc_quarantine_folder,
+                                 settings.gc_retention_days, settings.gc_quarantine_days)
+    plan = collector.plan()
+    if plan.unsynced_playlists:
+        logger.error(f"Not collecting anything, sync these playlists first: {', '.join(plan.unsynced_playlists)}")
+
+    collector.apply(plan, dry_run=not args.apply)
+    if args.apply and plan.stale_playlists:
+        collector.rebuild_xml(EventQueueLogger(queue.Queue()))
+
+    logger.info(f"{len(plan.collectable)} unreferenced tracks, {plan.reclaimable_bytes / 1024 / 1024:.1f}MB "
+                f"reclaimable, and {len(plan.expired)} expired quarantined tracks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+
+from duplicate_scanner import audio_data_range
+from drive_writer import COPY_TEMP_SUFFIX
+from resumable_download import PART_FILE_SUFFIX
+from utils import LOGGER_NAME, VIDEO_INDEX_FILE, load_hashmap_from_json, save_hashmap_to_json, write_file_if_changed
+from yt_download_helper import TRANSCODE_TEMP_SUFFIX
+
+SCAN_STATE_FILE = "integrity_scan.json"
+
+# Files left behind by a download, conversion or move that was cut short
+LEFTOVER_SUFFIXES = (".mp4", ".m4a", ".webm", PART_FILE_SUFFIX, TRANSCODE_TEMP_SUFFIX, COPY_TEMP_SUFFIX, ".tmp")
+# Leftovers a sync may still be writing, or will pick up again, such as a partial download the next sync resumes. These
+# are only removed once they haven't been touched for a while.
+IN_PROGRESS_SUFFIXES = (PART_FILE_SUFFIX, TRANSCODE_TEMP_SUFFIX, COPY_TEMP_SUFFIX)
+DEFAULT_STALE_AFTER_DAYS = 7
+
+REDOWNLOAD = "redownload"
+RETAG = "retag"
+REMOVE_ORPHAN = "remove_orphan"
+
+# MPEG audio frame header tables, indexed by the header's version bits
+MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+LAYER3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+MAX_FRAME_SIZE = 2881
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class FileInfo(NamedTuple):
+    size: int
+    mtime_ns: int
+
+
+class PlanAction(NamedTuple):
+    """One step of the reconciliation plan."""
+    action: str
+    file_path: str
+    reason: str
+    track_ids: tuple[str, ...] = ()
+
+
+class FrameHeader(NamedTuple):
+    version: float
+    bitrate: int
+    sample_rate: int
+    mono: bool
+    frame_length: int
+
+
+def parse_frame_header(header: bytes) -> Optional[FrameHeader]:
+    """
+    Parse an MPEG-1/2/2.5 Layer III frame header.
+
+    :param header: The header's 4 bytes.
+    :return: The parsed header, or None if the bytes aren't a valid Layer III frame header.
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+
+    version = MPEG_VERSIONS.get((header[1] >> 3) & 0x03)
+    layer3 = (header[1] >> 1) & 0x03 == 1
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version is None or not layer3 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = LAYER3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    frame_length = (144 if version == 1 else 72) * bitrate // sample_rate + padding
+    return FrameHeader(version, bitrate, sample_rate, header[3] >> 6 == 3, frame_length)
+
+
+def validate_mp3(file_path: str) -> Optional[str]:
+    """
+    Check an MP3 file is intact, reading only its headers. The first two frame headers must be valid and follow on
+    from each other, and if the encoder wrote a Xing/Info header, as LAME does, the audio must be as long as it says.
+
+    :param file_path: Path to the MP3 file.
+    :return: What is wrong with the file, or None if it looks intact.
+    """
+    try:
+        start, end = audio_data_range(file_path)
+        if end - start <= 0:
+            return "no audio data"
+
+        with open(file_path, "rb") as file:
+            file.seek(start)
+            first_frame = file.read(min(MAX_FRAME_SIZE, end - start))
+            header = parse_frame_header(first_frame[:4])
+            if header is None:
+                return "no MP3 frame at the start of the audio"
+
+            if end - start > header.frame_length:
+                file.seek(start + header.frame_length)
+                if parse_frame_header(file.read(4)) is None:
+                    return "second MP3 frame is corrupt"
+    except OSError as e:
+        return f"unreadable: {e}"
+
+    # The Xing/Info header sits in the first frame, after the side information
+    side_info_size = (17 if header.mono else 32) if header.version == 1 else (9 if header.mono else 17)
+    xing_offset = 4 + side_info_size
+    if first_frame[xing_offset:xing_offset + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(first_frame[xing_offset + 4:xing_offset + 8], "big")
+        bytes_offset = xing_offset + 8 + (4 if flags & 0x01 else 0)
+        if flags & 0x02 and len(first_frame) >= bytes_offset + 4:
+            expected_size = int.from_bytes(first_frame[bytes_offset:bytes_offset + 4], "big")
+            if end - start < expected_size:
+                return f"truncated, {end - start} of {expected_size} bytes of audio"
+    return None
+
+
+def has_id3_tag(file_path: str) -> bool:
+    """Check a file starts with an ID3v2 tag, reading only its first bytes."""
+    try:
+        with open(file_path, "rb") as file:
+            return file.read(3) == b"ID3"
+    except OSError:
+        return False
+
+
+def scan_directory(directory: str) -> tuple[dict[str, FileInfo], list[str]]:
+    """
+    List one directory, without descending into it.
+
+    :param directory: The directory to list.
+    :return: Its files with their size and modification time, and its subdirectories.
+    """
+    files = {}
+    directories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat()
+                files[os.path.normcase(os.path.normpath(entry.path))] = FileInfo(stat.st_size, stat.st_mtime_ns)
+    return files, directories
+
+
+def scan_tree(executor: concurrent.futures.Executor, root: str) -> dict[str, FileInfo]:
+    """
+    List every file under a directory, listing subdirectories in parallel.
+
+    :param executor: The executor to list directories in.
+    :param root: The directory to list.
+    :return: Every file with its size and modification time.
+    """
+    if not os.path.isdir(root):
+        return {}
+
+    files = {}
+    pending = {executor.submit(scan_directory, root)}
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            directory_files, directories = future.result()
+            files.update(directory_files)
+            pending.update(executor.submit(scan_directory, directory) for directory in directories)
+    return files
+
+
+class IntegrityScanner:
+    """
+    Reconciles the track index with the files in the tracks folder, finding:
+     - tracks whose file is missing or corrupt, such as truncated by a drive unplugged mid-write, to re-download.
+     - tracks whose file has lost its tags, to re-tag.
+     - files nothing in the index points at, and leftovers of downloads and conversions cut short, to remove. Partial
+       downloads and copies are kept until they go stale, as a sync can still carry on with them.
+
+    Files are only checked by reading their headers. The size and modification time of every file and the result of
+    checking it are saved on the drive, so an incremental scan only checks files that have changed since.
+    """
+
+    def __init__(self, drive: str, tracks_folder: str, workers: int = 8,
+                 stale_after_days: float = DEFAULT_STALE_AFTER_DAYS) -> None:
+        """
+        Initialize the IntegrityScanner, loading the drive's track and video indexes.
+
+        :param drive: The DJ library drive to scan.
+        :param tracks_folder: The folder on the drive the tracks are downloaded to.
+        :param workers: The number of threads to list directories and check files with.
+        :param stale_after_days: Only remove partial downloads and copies that haven't been written to for this many
+            days, so a sync running at the same time or the next sync can carry on with them.
+        """
+        self.drive = drive
+        self.track_dir = os.path.join(drive, tracks_folder)
+        self.workers = workers
+        self.stale_after_days = stale_after_days
+        self.id_to_video_map = load_hashmap_from_json(drive)
+        self.video_to_file_map = load_hashmap_from_json(drive, VIDEO_INDEX_FILE)
+
+    def _full_path(self, index_path: str) -> str:
+        return os.path.normcase(os.path.normpath(os.path.join(self.drive, index_path)))
+
+    def load_scan_state(self) -> dict[str, list]:
+        """:return: The previous scan's file path to [size, mtime_ns, problem], or empty if there wasn't one."""
+        scan_state_path = os.path.join(self.drive, SCAN_STATE_FILE)
+        if not os.path.isfile(scan_state_path):
+            return {}
+        try:
+            with open(scan_state_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_scan_state(self, scan_state: dict[str, list]) -> None:
+        write_file_if_changed(os.path.join(self.drive, SCAN_STATE_FILE), json.dumps(scan_state, indent=1).encode())
+
+    def check_file(self, file_path: str) -> Optional[str]:
+        """
+        :return: What is wrong with a track's file, "untagged" if it is intact but has no tags, or None.
+        """
+        problem = validate_mp3(file_path)
+        if problem is None and not has_id3_tag(file_path):
+            return "untagged"
+        return problem
+
+    def scan(self, incremental: bool = False) -> list[PlanAction]:
+        """
+        Scan the tracks folder and build the reconciliation plan.
+
+        :param incremental: Only check files that are new or whose size or modification time has changed since the
+            last scan, reusing the last scan's results for the rest.
+        :return: The plan.
+        """
+        previous_state = self.load_scan_state() if incremental else {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            files = scan_tree(executor, self.track_dir)
+
+            mp3_files = [file_path for file_path in files if file_path.endswith(".mp3")
+                         and not file_path.endswith(TRANSCODE_TEMP_SUFFIX)]
+            problems = {}
+            to_check = []
+            for file_path in mp3_files:
+                previous = previous_state.get(file_path)
+                if previous and tuple(previous[:2]) == files[file_path]:
+                    problems[file_path] = previous[2]
+                else:
+                    to_check.append(file_path)
+            problems.update(zip(to_check, executor.map(self.check_file, to_check)))
+
+        self.save_scan_state({file_path: [*files[file_path], problems[file_path]] for file_path in mp3_files})
+        logger.info(f"Checked {len(to_check)} of {len(mp3_files)} tracks")
+
+        tracks_by_file: dict[str, list[str]] = {}
+        for track_id, index_path in self.id_to_video_map.items():
+            if "youtube.com/" not in index_path:
+                tracks_by_file.setdefault(self._full_path(index_path), []).append(track_id)
+        video_files = {self._full_path(index_path) for index_path in self.video_to_file_map.values()}
+
+        stale_before_ns = time.time_ns() - self.stale_after_days * 24 * 60 * 60 * 10 ** 9
+        plan = []
+        for file_path, track_ids in sorted(tracks_by_file.items()):
+            problem = problems.get(file_path) if file_path in files else "missing"
+            if problem == "untagged":
+                plan.append(PlanAction(RETAG, file_path, problem, tuple(track_ids)))
+            elif problem:
+                plan.append(PlanAction(REDOWNLOAD, file_path, problem, tuple(track_ids)))
+
+        for file_path in sorted(files):
+            if file_path.endswith(IN_PROGRESS_SUFFIXES) and files[file_path].mtime_ns >= stale_before_ns:
+                continue
+            if file_path.endswith(LEFTOVER_SUFFIXES):
+                plan.append(PlanAction(REMOVE_ORPHAN, file_path, "left over from an interrupted download"))
+            elif file_path in problems and file_path not in tracks_by_file and file_path not in video_files:
+                plan.append(PlanAction(REMOVE_ORPHAN, file_path, "not in the track index"))
+        return plan
+
+    def apply(self, plan: list[PlanAction], spotify_helper=None, dry_run: bool = True) -> None:
+        """
+        Carry out a reconciliation plan. Tracks to re-download are removed from the indexes, along with their files,
+        so the next sync downloads them again. Tracks to re-tag are tagged again from Spotify, if a SpotifyHelper is
+        given.
+
+        :param plan: The plan from scan.
+        :param spotify_helper: Used to get the Spotify data of tracks to re-tag.
+        :param dry_run: Only report what would be done, without changing anything.
+        """
+        for step in plan:
+            logger.info(f"{'Would ' if dry_run else ''}{step.action.replace('_', ' ')} {step.file_path}: {step.reason}")
+        if dry_run:
+            return
+
+        redownload_files = {step.file_path for step in plan if step.action == REDOWNLOAD}
+        for index in (self.id_to_video_map, self.video_to_file_map):
+            for key in [key for key, index_path in index.items()
+                        if "youtube.com/" not in index_path and self._full_path(index_path) in redownload_files]:
+                del index[key]
+        save_hashmap_to_json(self.id_to_video_map, self.drive)
+        save_hashmap_to_json(self.video_to_file_map, self.drive, VIDEO_INDEX_FILE)
+
+        for step in plan:
+            if step.action in (REDOWNLOAD, REMOVE_ORPHAN) and os.path.exists(step.file_path):
+                os.remove(step.file_path)
+
+        retag_steps = [step for step in plan if step.action == RETAG]
+        if retag_steps and spotify_helper:
+            self.retag(retag_steps, spotify_helper)
+
+    def retag(self, steps: list[PlanAction], spotify_helper) -> None:
+        """Tag files again from their tracks' Spotify data, fetched 50 tracks at a time."""
+        from spotify_helper import compact_track
+        from utils import set_track_metadata
+
+        file_to_video_id = {self._full_path(index_path): video_id
+                            for video_id, index_path in self.video_to_file_map.items()}
+        track_files = {step.track_ids[0]: step.file_path for step in steps}
+        track_ids = list(track_files)
+        for batch_start in range(0, len(track_ids), 50):
+            response = spotify_helper.sp.tracks(track_ids[batch_start:batch_start + 50])
+            for track in response["tracks"]:
+                if track_data := compact_track({"track": track}):
+                    file_path = track_files[track_data["track"]["id"]]
+                    set_track_metadata(track_data, file_path, file_to_video_id.get(file_path))
+
+
+def main() -> None:
+    from event_queue import EventQueueLogger
+    from settings import SettingsSingleton
+
+    parser = argparse.ArgumentParser(description="Check the tracks on the DJ library drive against the track index.")
+    parser.add_argument("--drive", help="The DJ library drive to scan, defaults to the drive in settings.yaml.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only check files that have changed since the last scan.")
+    parser.add_argument("--stale-after-days", type=float, default=DEFAULT_STALE_AFTER_DAYS,
+                        help="Only remove partial downloads and copies untouched for this many days.")
+    parser.add_argument("--apply", action="store_true",
+                        help="Carry out the plan. Without this, only report what would be done.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    settings = SettingsSingleton()
+    scanner = IntegrityScanner(args.drive or settings.dj_library_drive, settings.tracks_folder,
+                               stale_after_days=args.stale_after_days)
+    plan = scanner.scan(incremental=args.incremental)
+
+    spotify_helper = None
+    if args.apply and any(step.action == RETAG for step in plan):
+        import queue
+        from spotify_helper import SpotifyHelper
+        spotify_helper = SpotifyHelper(EventQueueLogger(queue.Queue()))
+    scanner.apply(plan, spotify_helper, dry_run=not args.apply)
+
+    counts = {action: sum(step.action == action for step in plan) for action in (REDOWNLOAD, RETAG, REMOVE_ORPHAN)}
+    logger.info(f"{counts[REDOWNLOAD]} tracks to re-download, {counts[RETAG]} to re-tag and "
+                f"{counts[REMOVE_ORPHAN]} orphan files to remove")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Iterator, Optional
+
+from utils import LOGGER_NAME
+
+LOG_DIRECTORY = "../logs"
+LOG_FILE_PREFIX = "pysync_dj_log_"
+LOG_FILE_SUFFIXES = (".jsonl", ".log")
+LOGS_KEPT = 3
+
+# Above this many debug records a second from one process, only one in DEBUG_SAMPLE_EVERY debug records is kept
+DEBUG_MAX_PER_SECOND = 50
+DEBUG_SAMPLE_EVERY = 10
+
+# The Spotify track the current thread is working on, added to every record it logs
+current_track_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_track_id", default=None)
+
+
+@contextlib.contextmanager
+def log_context(track_id: Optional[str]) -> Iterator[None]:
+    """
+    Tag everything logged by the current thread inside the block with a Spotify track ID.
+
+    :param track_id: The Spotify track ID.
+    """
+    token = current_track_id.set(track_id)
+    try:
+        yield
+    finally:
+        current_track_id.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the worker (process and thread) and track a record was logged from."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.worker = f"{record.processName}:{record.process}/{record.threadName}"
+        record.track_id = current_track_id.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Samples debug records when a process is logging more than max_per_second of them, so debug chatter from a busy
+    sync doesn't flood the log queue. Info and above are always kept. The first record kept after some were dropped
+    says how many were dropped.
+    """
+
+    def __init__(self, max_per_second: int = DEBUG_MAX_PER_SECOND, sample_every: int = DEBUG_SAMPLE_EVERY) -> None:
+        """
+        Initialize the DebugSamplingFilter.
+
+        :param max_per_second: The number of debug records a second kept before sampling.
+        :param sample_every: Under load, keep one in this many debug records.
+        """
+        super().__init__()
+        self.max_per_second = max_per_second
+        self.sample_every = sample_every
+        self.window_start = 0.0
+        self.window_count = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+
+            if self.window_count > self.max_per_second and self.window_count % self.sample_every:
+                self.dropped += 1
+                return False
+
+            if self.dropped:
+                record.sampled_out = self.dropped
+                self.dropped = 0
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one line of JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "worker": getattr(record, "worker", f"{record.processName}:{record.process}/{record.threadName}"),
+            "track_id": getattr(record, "track_id", None),
+            "message": record.getMessage(),
+        }
+        if getattr(record, "sampled_out", None):
+            entry["sampled_out"] = record.sampled_out
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def create_log_queue() -> multiprocessing.Queue:
+    """Create the queue every process sends its log records to. Must be passed to child processes as they start."""
+    return multiprocessing.Queue(-1)
+
+
+def configure_process_logging(log_queue: Optional[multiprocessing.Queue]) -> None:
+    """
+    Send the calling process's log records to the log queue. Putting a record on the queue doesn't wait for it to be
+    written, so logging never holds up a worker or the ui. Run once in every process, including pool workers.
+
+    :param log_queue: The log queue, or None to leave logging as it is.
+    """
+    if log_queue is None:
+        return
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(DebugSamplingFilter())
+    logger.addHandler(queue_handler)
+    # Records are written by the listener, which has its own handlers
+    logger.propagate = False
+
+
+def remove_old_logs(log_directory: str, keep: int = LOGS_KEPT) -> None:
+    """
+    Delete all but the latest log files, making room for a new one.
+
+    :param log_directory: The logs directory.
+    :param keep: The number of log files to keep, including the new one.
+    """
+    log_files = sorted((file_name for file_name in os.listdir(log_directory)
+                        if file_name.startswith(LOG_FILE_PREFIX) and file_name.endswith(LOG_FILE_SUFFIXES)),
+                       reverse=True)
+    for old_log in log_files[keep - 1:]:
+        os.remove(os.path.join(log_directory, old_log))
+
+
+def start_logging(log_queue: multiprocessing.Queue, log_directory: str = LOG_DIRECTORY) -> QueueListener:
+    """
+    Start the log writer thread, which takes records from every process off the log queue and writes the full debug
+    stream to a JSON lines file, and info and above to the console. Messages shown in the ui are sent separately,
+    through the event queue.
+
+    :param log_queue: The log queue.
+    :param log_directory: The directory to write log files to.
+    :return: The running listener. Stop it on exit to write any records still queued.
+    """
+    os.makedirs(log_directory, exist_ok=True)
+    remove_old_logs(log_directory)
+
+    datetime_suffix = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    log_filename = os.path.join(log_directory, f"{LOG_FILE_PREFIX}{datetime_suffix}.jsonl")
+    file_handler = RotatingFileHandler(log_filename, maxBytes=5 * 1024 * 1024, backupCount=2, encoding="utf-8")
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    configure_process_logging(log_queue)
+    return listener
@@ -0,0 +1,213 @@
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+# The stages a track goes through, "track" covering the whole of processing a track in a worker
+METRIC_STAGES = ("track", "search", "download", "transcode")
+STAGE_OUTCOMES = ("completed", "skipped", "failed", "cancelled")
+# Bytes per second are measured over this many recent seconds, so throttling shows up quickly
+RATE_WINDOW_SECONDS = 60
+
+
+class SyncMetrics:
+    """
+    Live counts of what a sync is doing, built from the metric events that EventQueueLogger.metric puts on the events
+    queue from the sync and its workers. Updated by the thread reading the events queue and read by the metrics server,
+    so every access holds a lock.
+
+    Metric events are a kind and its values:
+     - ("stage", stage, state): A track was queued for, started, or finished a stage, finishing as one of
+       STAGE_OUTCOMES. "dropped" is a queued track that was cancelled before it started.
+     - ("bytes", stage, size): A stage wrote a number of bytes, such as a finished download.
+     - ("cache", cache, hits, misses): Lookups in a cache.
+     - ("limits", {stage: limit}): The number of tracks allowed in each stage at once.
+     - ("throttle",): A track failed because YouTube is throttling.
+    """
+
+    def __init__(self, event_queue_depth: Optional[Callable[[], int]] = None) -> None:
+        """
+        Initialize the SyncMetrics.
+
+        :param event_queue_depth: Returns the number of events waiting in the events queue.
+        """
+        self.event_queue_depth = event_queue_depth
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+
+        self.waiting: dict[str, int] = collections.Counter()
+        self.active: dict[str, int] = collections.Counter()
+        self.outcomes: dict[tuple[str, str], int] = collections.Counter()
+        self.limits: dict[str, int] = {}
+        self.bytes: dict[str, int] = collections.Counter()
+        # Recent (time, stage, size) byte events, for the current rate
+        self.recent_bytes: collections.deque = collections.deque()
+        self.cache_lookups: dict[str, list[int]] = collections.defaultdict(lambda: [0, 0])
+        self.throttle_errors = 0
+
+    def record(self, kind: str, *values) -> None:
+        """
+        Apply a metric event.
+
+        :param kind: The kind of event.
+        :param values: The event's values, see the class docstring.
+        """
+        with self.lock:
+            if kind == "stage":
+                self._record_stage(*values)
+            elif kind == "bytes":
+                stage, size = values
+                self.bytes[stage] += size
+                self.recent_bytes.append((time.monotonic(), stage, size))
+            elif kind == "cache":
+                cache, hits, misses = values
+                self.cache_lookups[cache][0] += hits
+                self.cache_lookups[cache][1] += misses
+            elif kind == "limits":
+                self.limits.update(values[0])
+            elif kind == "throttle":
+                self.throttle_errors += 1
+
+    def _record_stage(self, stage: str, state: str) -> None:
+        if state == "queued":
+            self.waiting[stage] += 1
+        elif state == "started":
+            self.waiting[stage] = max(self.waiting[stage] - 1, 0)
+            self.active[stage] += 1
+        elif state == "dropped":
+            self.waiting[stage] = max(self.waiting[stage] - 1, 0)
+        else:
+            self.active[stage] = max(self.active[stage] - 1, 0)
+            self.outcomes[stage, state] += 1
+
+    def _bytes_per_second(self, stage: str) -> float:
+        """The stage's bytes per second over the last RATE_WINDOW_SECONDS, or since the start if sooner."""
+        now = time.monotonic()
+        while self.recent_bytes and self.recent_bytes[0][0] < now - RATE_WINDOW_SECONDS:
+            self.recent_bytes.popleft()
+        window = min(RATE_WINDOW_SECONDS, time.time() - self.start_time)
+        return sum(size for _, event_stage, size in self.recent_bytes if event_stage == stage) / max(window, 1)
+
+    def status(self) -> dict:
+        """
+        :return: A snapshot of every metric, as served on the JSON status page.
+        """
+        with self.lock:
+            stages = {}
+            for stage in METRIC_STAGES:
+                limit = self.limits.get(stage)
+                stages[stage] = {
+                    "queued": self.waiting[stage],
+                    "in_flight": self.active[stage],
+                    "limit": limit,
+                    "utilisation": self.active[stage] / limit if limit else None,
+                    **{outcome: self.outcomes[stage, outcome] for outcome in STAGE_OUTCOMES},
+                }
+            caches = {cache: {"hits": hits, "misses": misses,
+                              "hit_ratio": hits / (hits + misses) if hits + misses else None}
+                      for cache, (hits, misses) in self.cache_lookups.items()}
+            transferred = {stage: {"total": total, "per_second": self._bytes_per_second(stage)}
+                           for stage, total in self.bytes.items()}
+            throttle_errors = self.throttle_errors
+
+        return {
+            "uptime_seconds": time.time() - self.start_time,
+            "stages": stages,
+            "bytes": transferred,
+            "caches": caches,
+            "throttle_errors": throttle_errors,
+            "event_queue_depth": self.event_queue_depth() if self.event_queue_depth else None,
+        }
+
+    def prometheus(self) -> str:
+        """
+        :return: Every metric in the Prometheus text exposition format.
+        """
+        status = self.status()
+        lines = []
+
+        def add(name: str, metric_type: str, help_text: str, samples: list[tuple[dict, Optional[float]]]) -> None:
+            lines.append(f"# HELP pysync_dj_{name} {help_text}")
+            lines.append(f"# TYPE pysync_dj_{name} {metric_type}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                # Counts are written in full, as "g" formatting would round large byte counts
+                value_text = str(value) if isinstance(value, int) else repr(float(value))
+                lines.append(f"pysync_dj_{name}{{{label_text}}} {value_text}" if label_text
+                             else f"pysync_dj_{name} {value_text}")
+
+        stages = status["stages"]
+        add("stage_queued", "gauge", "Tracks waiting to start a stage.",
+            [({"stage": stage}, values["queued"]) for stage, values in stages.items()])
+        add("stage_in_flight", "gauge", "Tracks in a stage.",
+            [({"stage": stage}, values["in_flight"]) for stage, values in stages.items()])
+        add("stage_limit", "gauge", "The most tracks allowed in a stage at once.",
+            [({"stage": stage}, values["limit"]) for stage, values in stages.items()])
+        add("stage_utilisation", "gauge", "Tracks in a stage out of the most allowed.",
+            [({"stage": stage}, values["utilisation"]) for stage, values in stages.items()])
+        add("stage_tracks_total", "counter", "Tracks that finished a stage, by outcome.",
+            [({"stage": stage, "outcome": outcome}, values[outcome])
+             for stage, values in stages.items() for outcome in STAGE_OUTCOMES])
+        add("bytes_total", "counter", "Bytes written by a stage.",
+            [({"stage": stage}, values["total"]) for stage, values in status["bytes"].items()])
+        add("bytes_per_second", "gauge", f"Bytes written by a stage per second, over the last {RATE_WINDOW_SECONDS}s.",
+            [({"stage": stage}, values["per_second"]) for stage, values in status["bytes"].items()])
+        add("cache_lookups_total", "counter", "Cache lookups, by result.",
+            [({"cache": cache, "result": result}, values[key])
+             for cache, values in status["caches"].items() for result, key in (("hit", "hits"), ("miss", "misses"))])
+        add("cache_hit_ratio", "gauge", "Cache lookups that were hits.",
+            [({"cache": cache}, values["hit_ratio"]) for cache, values in status["caches"].items()])
+        add("throttle_errors_total", "counter", "Tracks that failed because YouTube was throttling.",
+            [({}, status["throttle_errors"])])
+        add("event_queue_depth", "gauge", "Events waiting in the events queue.", [({}, status["event_queue_depth"])])
+        add("uptime_seconds", "gauge", "Seconds since the metrics started.", [({}, status["uptime_seconds"])])
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves a sync's metrics on a local port, in the Prometheus text format on /metrics and as JSON on /status, from a
+    background thread.
+    """
+
+    def __init__(self, metrics: SyncMetrics, port: int, host: str = "127.0.0.1") -> None:
+        """
+        Initialize the MetricsServer and start serving.
+
+        :param metrics: The metrics to serve.
+        :param port: The port to serve on, 0 for any free port.
+        :param host: The address to serve on, only this computer by default.
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body, content_type = metrics.prometheus().encode(), "text/plain; version=0.0.4; charset=utf-8"
+                elif path in ("/", "/status"):
+                    body, content_type = json.dumps(metrics.status(), indent=1).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                # Scrapes every few seconds would fill the console
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    def shutdown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
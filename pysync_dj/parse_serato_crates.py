@@ -50,7 +50,8 @@ def decode(data, tag=None):
     if tag in DECODE_FUNC_FULL:
         decode_func = DECODE_FUNC_FULL[tag]
     else:
-        decode_func = DECODE_FUNC_FIRST[tag[0]]
+        # Fields of unknown types, such as those added by newer Serato versions, are kept as raw bytes
+        decode_func = DECODE_FUNC_FIRST.get(tag[0], noop)
 
     return decode_func(data)
 
@@ -66,10 +67,8 @@ Thanks again to kerrickstaley
 
 
 def encode_struct(data):
-    ret = b''
-    for tag, value in data:
-        ret += encode(value, tag=tag)
-    return ret
+    # Joined once at the end, as appending to bytes copies everything before it, which is slow for a large database
+    return b''.join(encode(value, tag=tag) for tag, value in data)
 
 
 def encode_unicode(text):
@@ -102,7 +101,7 @@ def encode(data, tag=None):
     if tag in ENCODE_FUNC_FULL:
         encode_func = ENCODE_FUNC_FULL[tag]
     else:
-        encode_func = ENCODE_FUNC_FIRST[tag[0]]
+        encode_func = ENCODE_FUNC_FIRST.get(tag[0], noop)
 
     encoded_data = encode_func(data)
     length = len(encoded_data)
@@ -0,0 +1,151 @@
+import cProfile
+import datetime
+import glob
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from typing import Any, Callable, Optional
+
+PROFILE_DIRECTORY = "../logs"
+PROFILE_SUFFIX = ".prof"
+MEMORY_SUFFIX = ".memory.txt"
+MERGED_PROFILE_NAME = "merged" + PROFILE_SUFFIX
+
+# Each worker thread keeps its own profiler, as cProfile only sees the thread that enabled it
+_worker_profiles = threading.local()
+
+
+def create_profile_directory(log_directory: str = PROFILE_DIRECTORY) -> str:
+    """
+    Create the directory for a sync's profiles, named after when the sync started.
+
+    :param log_directory: The directory to create it in.
+    :return: The profile directory's path.
+    """
+    datetime_suffix = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    profile_directory = os.path.join(log_directory, f"pysync_dj_profile_{datetime_suffix}")
+    os.makedirs(profile_directory, exist_ok=True)
+    return profile_directory
+
+
+class Profiler:
+    """
+    Profiles the code run inside it with cProfile, and optionally tracemalloc, and writes the results to the profile
+    directory. Can be entered repeatedly, such as once per track, with the results accumulating, and every exit
+    rewrites the files, so a worker's profile is complete without the worker having to be shut down.
+    """
+
+    def __init__(self, profile_directory: str, name: str, trace_memory: bool = False) -> None:
+        """
+        Initialize the Profiler.
+
+        :param profile_directory: The directory to write the profile to.
+        :param name: Name of the profile's file, unique to the worker or stage being profiled.
+        :param trace_memory: Also trace memory allocations with tracemalloc, which slows everything down noticeably.
+        """
+        self.profile_directory = profile_directory
+        self.name = name
+        self.trace_memory = trace_memory
+        self.profile = cProfile.Profile()
+
+    @property
+    def profile_path(self) -> str:
+        return os.path.join(self.profile_directory, self.name + PROFILE_SUFFIX)
+
+    def __enter__(self) -> 'Profiler':
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.profile.disable()
+        self.save()
+
+    def save(self, top_n: int = 25) -> None:
+        """
+        Write the profile, and the top memory allocations if tracing memory.
+
+        :param top_n: The number of memory allocation sites to write.
+        """
+        self.profile.dump_stats(self.profile_path)
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            with open(os.path.join(self.profile_directory, self.name + MEMORY_SUFFIX), "w") as f:
+                current, peak = tracemalloc.get_traced_memory()
+                f.write(f"Current {current / 1024 / 1024:.1f}MB, peak {peak / 1024 / 1024:.1f}MB\n")
+                for stat in snapshot.statistics("lineno")[:top_n]:
+                    f.write(f"{stat}\n")
+
+
+def worker_profiler(profile_directory: str, stage: str, trace_memory: bool = False) -> Profiler:
+    """
+    Get the calling worker thread's profiler for a stage, creating it the first time, or when a new sync has started
+    with a new profile directory.
+
+    :param profile_directory: The sync's profile directory.
+    :param stage: The stage being profiled, such as "track" or "transcode".
+    :param trace_memory: Also trace memory allocations.
+    """
+    profilers = getattr(_worker_profiles, "profilers", None)
+    if profilers is None or getattr(_worker_profiles, "profile_directory", None) != profile_directory:
+        profilers = _worker_profiles.profilers = {}
+        _worker_profiles.profile_directory = profile_directory
+
+    if stage not in profilers:
+        name = f"{stage}_{os.getpid()}_{threading.current_thread().name}"
+        profilers[stage] = Profiler(profile_directory, name, trace_memory)
+    return profilers[stage]
+
+
+def run_profiled(profile_directory: Optional[str], stage: str, trace_memory: bool, function: Callable,
+                 *args) -> Any:
+    """
+    Run a function in the calling worker's profiler for a stage. Module level so it can be sent to a process pool.
+
+    :param profile_directory: The sync's profile directory, or None to run the function without profiling.
+    :param stage: The stage being profiled.
+    :param trace_memory: Also trace memory allocations.
+    :param function: The function to run.
+    :return: The function's result.
+    """
+    if not profile_directory:
+        return function(*args)
+    with worker_profiler(profile_directory, stage, trace_memory):
+        return function(*args)
+
+
+def merge_profiles(profile_directory: str) -> Optional[pstats.Stats]:
+    """
+    Merge every worker's and stage's profile in the directory into one pstats file.
+
+    :param profile_directory: The sync's profile directory.
+    :return: The merged stats, or None if there were no profiles.
+    """
+    merged_path = os.path.join(profile_directory, MERGED_PROFILE_NAME)
+    profile_paths = [path for path in sorted(glob.glob(os.path.join(profile_directory, "*" + PROFILE_SUFFIX)))
+                     if path != merged_path]
+    if not profile_paths:
+        return None
+
+    stats = pstats.Stats(*profile_paths, stream=io.StringIO())
+    stats.dump_stats(merged_path)
+    return stats
+
+
+def summarize_profile(stats: pstats.Stats, top_n: int = 25) -> list[str]:
+    """
+    Summarize a profile as the functions with the most cumulative time.
+
+    :param stats: The profile's stats.
+    :param top_n: The number of functions to include.
+    :return: The summary's lines.
+    """
+    output = io.StringIO()
+    stats.stream = output
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+    # Drop pstats' header listing the merged files, and blank lines, keeping the totals line and the table
+    profile_files = {str(file_name) for file_name in stats.files}
+    return [line for line in output.getvalue().splitlines() if line.strip() and line.strip() not in profile_files]
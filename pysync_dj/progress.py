@@ -0,0 +1,165 @@
+import time
+from array import array
+from typing import Optional
+
+from event_queue import EventQueueLogger
+
+# Work is measured in estimated bytes. A download costs the size of its audio at YouTube's 128kbps, and a transcode
+# costs half as much again for the same length of audio. Tracks that are already downloaded cost nothing.
+DOWNLOAD_BYTES_PER_SECOND = 16000
+TRANSCODE_WORK_PER_SECOND = 8000
+DEFAULT_TRACK_SECONDS = 210
+
+
+def estimate_playlist_work(playlist_data: list[dict], id_to_video_map: dict) -> array:
+    """
+    Estimate the work of every track in a playlist.
+
+    :param playlist_data: List of dictionaries containing playlist track data.
+    :param id_to_video_map: The track index. Tracks with a downloaded file in it cost nothing.
+    :return: The estimated work of each track, by playlist position.
+    """
+    track_work = array("d", bytes(8 * len(playlist_data)))
+    for position, track_data in enumerate(playlist_data):
+        track_file_path = id_to_video_map.get(track_data["track"]["id"])
+        if track_file_path and "youtube.com/" not in track_file_path:
+            continue
+        duration_seconds = (track_data["track"].get("duration_ms") or DEFAULT_TRACK_SECONDS * 1000) / 1000
+        track_work[position] = duration_seconds * (DOWNLOAD_BYTES_PER_SECOND + TRANSCODE_WORK_PER_SECOND)
+    return track_work
+
+
+def estimate_file_size(track_work: float) -> float:
+    """
+    Estimate the size of a track's MP3 from its estimated work. Both come from the track's duration, and an MP3 at
+    YouTube's 128kbps is the same size as the download.
+
+    :param track_work: The track's estimated work, from estimate_playlist_work.
+    :return: The estimated file size in bytes.
+    """
+    return track_work * DOWNLOAD_BYTES_PER_SECOND / (DOWNLOAD_BYTES_PER_SECOND + TRANSCODE_WORK_PER_SECOND)
+
+
+def format_duration(seconds: float) -> str:
+    """Format a number of seconds as a short duration, such as "1h 05m" or "3m 20s"."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class ProgressTracker:
+    """
+    Tracks the progress of a whole sync by estimated work rather than by track count, so each playlist counts in
+    proportion to its size, and a track that is already downloaded doesn't count the same as a ten minute download.
+
+    Playlists are first added as an estimate from their track count, which is replaced by the estimated work of their
+    actual tracks once they are fetched. The progress sent to the event queue never goes backwards, and updates are
+    rate limited, each with a status line giving the tracks done, throughput and estimated time left.
+    """
+
+    def __init__(self, event_logger: EventQueueLogger, min_update_interval: float = 0.25) -> None:
+        """
+        Initialize the ProgressTracker.
+
+        :param event_logger: Logger used to send progress updates.
+        :param min_update_interval: The least time, in seconds, between progress updates.
+        """
+        self.event_logger = event_logger
+        self.min_update_interval = min_update_interval
+
+        self.total_work = 0.0
+        self.completed_work = 0.0
+        self.total_tracks = 0
+        self.completed_tracks = 0
+        # Playlist name to its (work, track count) estimate, until its tracks are fetched
+        self.playlist_estimates: dict[str, tuple[float, int]] = {}
+
+        self.start_time: Optional[float] = None
+        self.last_update_time: Optional[float] = None
+        self.reported_progress = 0.0
+
+    def add_playlist_estimate(self, playlist_name: str, track_count: int) -> None:
+        """
+        Add a playlist to the totals before its tracks are fetched, assuming every track needs downloading.
+
+        :param playlist_name: The playlist's name.
+        :param track_count: The number of tracks in the playlist.
+        """
+        work = track_count * DEFAULT_TRACK_SECONDS * (DOWNLOAD_BYTES_PER_SECOND + TRANSCODE_WORK_PER_SECOND)
+        self.playlist_estimates[playlist_name] = (work, track_count)
+        self.total_work += work
+        self.total_tracks += track_count
+
+    def start_playlist(self, playlist_name: str, track_work: array) -> None:
+        """
+        Replace a playlist's estimate with the estimated work of the tracks that will be processed.
+
+        :param playlist_name: The playlist's name.
+        :param track_work: The estimated work of each track, from estimate_playlist_work.
+        """
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+
+        estimated_work, estimated_tracks = self.playlist_estimates.pop(playlist_name, (0, 0))
+        self.total_work += sum(track_work) - estimated_work
+        self.total_tracks += len(track_work) - estimated_tracks
+
+    def complete_track(self, work: float) -> None:
+        """
+        Record a processed track, whether it was downloaded, already downloaded, failed or cancelled.
+
+        :param work: The track's estimated work.
+        """
+        self.completed_work += work
+        self.completed_tracks += 1
+        self.update()
+
+    @property
+    def progress(self) -> float:
+        if self.total_tracks and self.completed_tracks >= self.total_tracks:
+            return 1.0
+        if self.total_work <= 0:
+            return 0.0
+        return min(self.completed_work / self.total_work, 1.0)
+
+    def status(self) -> str:
+        """
+        :return: A one line summary of the tracks done, throughput and estimated time left.
+        """
+        status = f"{self.completed_tracks}/{self.total_tracks} tracks"
+        elapsed = time.monotonic() - self.start_time if self.start_time is not None else 0
+        if elapsed <= 0 or not self.completed_tracks:
+            return status
+
+        status += f" | {self.completed_tracks / elapsed * 60:.1f} tracks/min"
+        if self.completed_work:
+            work_rate = self.completed_work / elapsed
+            remaining_work = max(self.total_work - self.completed_work, 0)
+            status += f" | {work_rate / 1000:.0f} KB/s | {format_duration(remaining_work / work_rate)} left"
+        return status
+
+    def update(self, force: bool = False) -> None:
+        """
+        Send the progress and status to the event queue, unless the last update was too recent.
+
+        :param force: Send the update however recent the last one was.
+        """
+        now = time.monotonic()
+        if not force and self.last_update_time is not None and now - self.last_update_time < self.min_update_interval:
+            return
+        self.last_update_time = now
+
+        # Replacing a playlist's estimate can lower the true progress, so the bar holds still rather than going back
+        self.reported_progress = max(self.reported_progress, self.progress)
+        self.event_logger.update_progress(self.reported_progress)
+        self.event_logger.update_status(self.status())
+
+    def finish(self) -> None:
+        """Fill the bar at the end of the sync, including when it was cancelled part way."""
+        self.reported_progress = 1.0
+        self.last_update_time = time.monotonic()
+        self.event_logger.update_progress(1)
+        self.event_logger.update_status(self.status())
@@ -1,18 +1,31 @@
+import argparse
 import concurrent.futures
 import multiprocessing
+import os
+import signal
+import threading
+import time
 import traceback
+from array import array
+from typing import Optional, Union
 
-import pytube.exceptions
-
+from cancellation import CancellationToken, create_manager
+from concurrency import AdaptiveConcurrency, is_throttle_error
 from dj_libraries.rekordbox_xml_library import RekordboxXMLLibrary
+from drive_writer import DriveSpace, DriveWriter, DriveFanOut
 from event_queue import EventQueueLogger, EventQueueHandler
-from track_processor import process_track
+from logging_pipeline import start_logging, log_context
+from failure_ledger import FailureLedger, is_permanent_error
+from garbage_collector import PlaylistMembership
+from profiling import create_profile_directory, merge_profiles, summarize_profile, run_profiled, MERGED_PROFILE_NAME
+from progress import ProgressTracker, estimate_playlist_work, estimate_file_size
 from dj_libraries.serato_crate import SeratoCrate
-from settings import SettingsSingleton
+from dj_libraries.serato_database import SeratoDatabase
+from settings import Settings, SettingsSingleton
 from dj_libraries.rekordbox_m3u_playlist import RekordboxM3UPlaylist
-from utils import load_hashmap_from_json, \
-    extract_spotify_playlist_id
+from utils import extract_spotify_playlist_id, save_hashmap_to_json, VIDEO_INDEX_FILE
 from spotify_helper import SpotifyHelper
+from worker_pool import WorkerPool
 from yt_download_helper import YouTubeDownloadHelper
 
 
@@ -21,7 +34,23 @@ class PySyncDJDownload:
     This class does the downloading component of the software.
     """
 
-    def __init__(self, selected_drive, event_queue):
+    def __init__(self, selected_drive, event_queue, worker_pool: WorkerPool = None,
+                 cancel_token: Optional[CancellationToken] = None, log_queue=None,
+                 settings: Optional[Settings] = None, save_main_libraries: bool = True):
+        """
+        Initialize and run the download.
+
+        :param selected_drive: The DJ library drive to sync to, or None to use the drive from settings.
+        :param event_queue: The events queue that handles logging and ui updates.
+        :param worker_pool: A long-lived worker pool to process tracks with. If not given, a pool is created for
+            this run and shut down when it finishes.
+        :param cancel_token: Pauses and cancels the sync. Cancelling stops in-flight downloads, and the DJ library
+            files are still written for the tracks that completed.
+        :param log_queue: The log queue for the workers of a pool created for this run to send their log records to.
+        :param settings: The settings to sync with, defaults to the app's settings from settings.yaml.
+        :param save_main_libraries: Save crates, playlists and the XML library to the main DJ library drive. Turned off
+            when the main drive is only a download cache for the mirror drives, such as in a batch sync.
+        """
         self.event_queue = event_queue
         self.event_logger: EventQueueLogger = EventQueueLogger(self.event_queue)
 
@@ -29,19 +58,83 @@ class PySyncDJDownload:
         self.event_logger.info("===============   Starting  Download  ================")
         self.event_logger.info("=======================================================")
 
-        self.settings = SettingsSingleton(self.event_logger)
+        self.settings = settings or SettingsSingleton(self.event_logger)
+        self.save_main_libraries = save_main_libraries
+        self.event_logger.metrics = bool(self.settings.metrics_port)
+        self.owns_worker_pool = worker_pool is None
+        if worker_pool:
+            if settings is None:
+                # A long-lived pool outlives a single sync, so pick up any edits made to settings.yaml since the
+                # last one
+                self.settings.reload_settings()
+            worker_pool.configure(self.settings.max_pool_workers,
+                                  self.settings.execution_mode,
+                                  self.settings.download_workers["transcode"])
+        else:
+            worker_pool = WorkerPool(create_manager(),
+                                     self.settings.max_pool_workers,
+                                     self.settings.execution_mode,
+                                     self.settings.download_workers["transcode"],
+                                     log_queue)
+        self.worker_pool = worker_pool
+        self.stage_limiters = worker_pool.create_stage_limiters(self.settings.download_workers)
+        self.adaptive_concurrency: Optional[AdaptiveConcurrency] = None
+        if self.settings.adaptive_concurrency:
+            self.adaptive_concurrency = AdaptiveConcurrency([self.stage_limiters["search"],
+                                                             self.stage_limiters["download"]],
+                                                            self.event_logger,
+                                                            max_workers=self.settings.adaptive_max_workers)
+        self.cancel_token = cancel_token or CancellationToken(worker_pool.create_event(), worker_pool.create_event())
+
         if selected_drive:
             self.settings.update_setting("dj_library_drive", selected_drive)
-        self.total_playlists = (
-                int(self.settings.download_liked_songs) +
-                (len(self.settings.playlists_to_download) if self.settings.playlists_to_download else 0)
-        )
-
-        self.spotify_helper = SpotifyHelper(self.event_logger)
+        self.progress_tracker = ProgressTracker(self.event_logger)
+        # The last stage limits and Spotify cache stats sent as metrics, so only changes are sent
+        self.reported_stage_limits: Optional[dict[str, int]] = None
+        self.reported_cache_stats: dict[str, int] = {}
+        # Workers find the profile directory in their settings, and only profile when it is set
+        self.profile_directory: Optional[str] = create_profile_directory() if self.settings.profile else None
+        self.settings.update_setting("profile_directory", self.profile_directory)
+
+        self.spotify_helper = SpotifyHelper(self.event_logger, self.settings)
         self.ytd_helper = YouTubeDownloadHelper(self.settings.dj_library_drive, self.settings.tracks_folder)
-        self.itunes_library = RekordboxXMLLibrary(self.event_logger)
-
-        self.run()
+        self.itunes_library = RekordboxXMLLibrary(self.event_logger, settings=self.settings)
+        self.skipped_library_writes = 0
+        self.failure_ledger = FailureLedger(self.settings.dj_library_drive,
+                                            base_retry_delay=self.settings.failure_retry_delay_hours * 60 * 60)
+        self.skipped_failed_tracks = 0
+        self.playlist_membership = PlaylistMembership(self.settings.dj_library_drive)
+        self.drive_space = DriveSpace(self.settings.dj_library_drive, self.settings.min_free_space_mb)
+        self.mirror_drives = [drive for drive in self.settings.mirror_drives if drive != self.settings.dj_library_drive]
+        # Playlist names and their tracks, to write each mirror drive's DJ libraries once its tracks are copied and to
+        # add the tracks to Serato's database once at the end of the sync
+        self.synced_playlists: list[tuple[str, list[str]]] = []
+        self.drive_writer: Optional[Union[DriveWriter, DriveFanOut]] = None
+        if self.settings.staging_directory:
+            # With mirror drives the staged copy is kept until every drive has it
+            self.drive_writer = DriveWriter(self.settings.staging_directory, self.settings.dj_library_drive,
+                                            self.drive_space, self.event_logger, keep_source=bool(self.mirror_drives))
+        if self.mirror_drives:
+            mirror_source = self.settings.staging_directory or self.settings.dj_library_drive
+            mirror_writers = [DriveWriter(mirror_source, mirror_drive,
+                                          DriveSpace(mirror_drive, self.settings.min_free_space_mb),
+                                          self.event_logger, library_drive=self.settings.dj_library_drive,
+                                          keep_source=True, link=self.settings.mirror_link_mode == "hardlink")
+                              for mirror_drive in self.mirror_drives]
+            self.drive_writer = DriveFanOut(self.drive_writer, mirror_writers, self.drive_space)
+
+        try:
+            run_profiled(self.profile_directory, "sync", self.settings.profile_memory, self.run)
+            self.report_profile()
+        finally:
+            # Make sure everything completed before a cancel or error is on the drive
+            if self.drive_writer:
+                self.drive_writer.shutdown()
+            self.worker_pool.save_track_index()
+            self.failure_ledger.save()
+            self.playlist_membership.save()
+            if self.owns_worker_pool:
+                self.worker_pool.shutdown()
 
     def run(self):
         """
@@ -50,16 +143,48 @@ class PySyncDJDownload:
         This method does the overall process of syncing the Spotify library
         with the DJ library.
         """
+        self.worker_pool.load_track_index(self.settings.dj_library_drive)
+        self.report_stage_limits()
+        self.estimate_playlists()
+
         if self.settings.download_liked_songs:
             self.download_liked_songs()
         if self.settings.playlists_to_download:
             self.download_all_playlists()
 
-        self.itunes_library.save_xml()
-
-        self.event_logger.update_progress(1)
+        if self.save_main_libraries:
+            self.record_library_write(self.itunes_library.save_xml())
+        if self.settings.update_serato_database and self.save_main_libraries:
+            self.save_serato_database(self.settings.dj_library_drive,
+                                      [track for _, track_list in self.synced_playlists for track in track_list])
+        if self.mirror_drives:
+            self.save_mirror_libraries()
+        self.event_logger.info(f"Skipped rewriting {self.skipped_library_writes} unchanged DJ library files")
+        self.report_failures()
+        if cache_stats := self.spotify_helper.cache_stats():
+            self.event_logger.debug(f"Spotify responses: {cache_stats['fresh']} from cache, "
+                                    f"{cache_stats['revalidated']} unchanged, {cache_stats['downloaded']} downloaded")
+        if self.drive_space.full:
+            self.event_logger.error(self.drive_space.report())
+
+        self.progress_tracker.finish()
         self.event_logger.enable_download_button()
-        self.event_logger.info("Download completed!")
+        if self.cancel_token.cancelled:
+            self.event_logger.info("Download cancelled.")
+        else:
+            self.event_logger.info("Download completed!")
+
+    def estimate_playlists(self) -> None:
+        """
+        Add every playlist to the progress totals up front, from its track count, so progress is measured across the
+        whole sync. Liked songs are downloaded first, so their tracks are fetched before any progress is shown.
+        """
+        if not self.settings.playlists_to_download:
+            return
+        for playlist_name, playlist_url in self.settings.playlists_to_download.items():
+            track_count = self.spotify_helper.get_playlist_track_count(extract_spotify_playlist_id(playlist_url))
+            if track_count:
+                self.progress_tracker.add_playlist_estimate(playlist_name, track_count)
 
     def download_liked_songs(self) -> None:
         """
@@ -69,8 +194,9 @@ class PySyncDJDownload:
         self.event_logger.info(f"Getting liked songs information")
         playlist_name = "Liked Songs"
 
-        liked_songs_data = self.spotify_helper.get_liked_tracks()
-        downloaded_track_list = self.download_playlist(liked_songs_data, 0) or []
+        # Passed straight through, so download_playlist holds the only reference and can release tracks as it goes
+        downloaded_track_list = self.download_playlist(self.spotify_helper.get_liked_tracks(), playlist_name)
+        self.report_cache_metrics()
 
         self.save_to_dj_libraries(playlist_name, downloaded_track_list)
 
@@ -79,77 +205,369 @@ class PySyncDJDownload:
         Get and download all playlists specified in settings, creating corresponding Serato crates and Rekordbox
         playlists.
         """
-
-        playlist_index = 1 if self.settings.download_liked_songs else 0
         for playlist_name, playlist_url in self.settings.playlists_to_download.items():
+            if self.cancel_token.cancelled or self.drive_space.full:
+                break
+
             playlist_id = extract_spotify_playlist_id(playlist_url)
 
             self.event_logger.debug(
                 f"Getting playlist information for playlist {playlist_name=}, {playlist_url=}, {playlist_id=}")
             self.event_logger.info(f"Downloading playlist: {playlist_name}")
 
-            playlist_data = self.spotify_helper.get_playlist_tracks(playlist_id)
-            downloaded_track_list = self.download_playlist(playlist_data, playlist_index)
+            downloaded_track_list = self.download_playlist(self.spotify_helper.get_playlist_tracks(playlist_id),
+                                                           playlist_name)
+            self.report_cache_metrics()
 
             self.save_to_dj_libraries(playlist_name, downloaded_track_list)
 
-            playlist_index += 1
-
     def save_to_dj_libraries(self, playlist_name, downloaded_track_list):
+        self.synced_playlists.append((playlist_name, downloaded_track_list))
+        if not self.save_main_libraries:
+            return
         self.event_logger.info("Saving DJ library data...")
-        SeratoCrate(playlist_name, downloaded_track_list)
-        RekordboxM3UPlaylist(playlist_name, downloaded_track_list, self.settings.dj_library_drive).create_m3u_file()
+        self.record_library_write(SeratoCrate(playlist_name, downloaded_track_list).save_crate(settings=self.settings))
+        self.record_library_write(RekordboxM3UPlaylist(playlist_name, downloaded_track_list,
+                                                       self.settings.dj_library_drive, self.settings).create_m3u_file())
         self.itunes_library.add_playlist(playlist_name, downloaded_track_list)
+        # Only a playlist synced in full says which tracks it still has, for the garbage collector
+        if not self.cancel_token.cancelled and not self.drive_space.full:
+            self.playlist_membership.record_playlist(playlist_name, downloaded_track_list)
 
-    def download_playlist(self, playlist_data: list[dict], playlist_index: int) -> list[str]:
+    def save_mirror_libraries(self) -> None:
         """
-        Downloads tracks from a given playlist and updates the Serato crate and Rekordbox playlist objects.
+        Wait for the tracks to be copied to the mirror drives, then save each mirror drive's Serato crates, Rekordbox
+        playlists and XML library, and its own copy of the track index, with the paths of the tracks on that drive.
+        A mirror drive's libraries only list the tracks that are on it, so a full mirror drive still has working
+        crates and playlists.
+        """
+        self.event_logger.info(f"Waiting for tracks to be copied to {', '.join(self.mirror_drives)}...")
+        self.drive_writer.shutdown()
+
+        id_to_video_map = dict(self.worker_pool.id_to_video_map)
+        video_to_file_map = dict(self.worker_pool.video_to_file_map)
+        for writer in self.drive_writer.mirror_writers:
+            self.event_logger.info(f"Saving DJ library data to {writer.drive}...")
+            itunes_library = RekordboxXMLLibrary(self.event_logger, writer.drive, self.settings)
+            mirror_tracks = []
+            for playlist_name, downloaded_track_list in self.synced_playlists:
+                mirror_track_list = [mirror_path for mirror_path in map(writer.target_path, downloaded_track_list)
+                                     if os.path.isfile(mirror_path)]
+                mirror_tracks += mirror_track_list
+                crate = SeratoCrate(playlist_name, mirror_track_list)
+                self.record_library_write(crate.save_crate(writer.drive, self.settings))
+                self.record_library_write(RekordboxM3UPlaylist(playlist_name, mirror_track_list, writer.drive,
+                                                               self.settings).create_m3u_file())
+                itunes_library.add_playlist(playlist_name, mirror_track_list)
+            self.record_library_write(itunes_library.save_xml())
+            if self.settings.update_serato_database:
+                self.save_serato_database(writer.drive, mirror_tracks)
+
+            # The mirror drive's own index lets it be synced on its own without downloading its tracks again. It only
+            # lists the tracks on the drive, as the main drive can hold tracks the mirror was never sent, such as the
+            # other profiles' tracks in a batch sync's download cache
+            mirror_paths = {index_path: writer.target_path(index_path)
+                            for index in (id_to_video_map, video_to_file_map) for index_path in index.values()
+                            if "youtube.com/" not in index_path}
+            mirror_paths = {index_path: os.path.splitdrive(mirror_path)[1]
+                            for index_path, mirror_path in mirror_paths.items() if os.path.isfile(mirror_path)}
+            for index, file_path in ((id_to_video_map, "id_to_video_map.json"), (video_to_file_map, VIDEO_INDEX_FILE)):
+                save_hashmap_to_json({key: index_path if "youtube.com/" in index_path else mirror_paths[index_path]
+                                      for key, index_path in index.items()
+                                      if "youtube.com/" in index_path or index_path in mirror_paths},
+                                     writer.drive, file_path)
+
+    def save_serato_database(self, drive: str, track_list: list[str]) -> None:
+        """
+        Add the synced tracks that Serato doesn't know about yet to its database on the drive, in one rewrite of the
+        database.
 
-        :param playlist_data: List of dictionaries containing playlist track data.
-        :param playlist_index: Index of the playlist out of all the playlist to download.
-        :return: List of downloaded tack's file paths.
+        :param drive: The drive with the tracks and Serato database.
+        :param track_list: The file paths of every synced track, tracks on several playlists can be listed more than
+            once.
+        """
+        try:
+            serato_database = SeratoDatabase(drive, self.settings.serato_subcrate_dir)
+            added_tracks = serato_database.add_tracks(dict.fromkeys(track_list))
+            self.record_library_write(serato_database.save())
+        except Exception as e:
+            self.event_logger.error(f"Failed to update the Serato database on {drive}: {e}")
+            return
+        self.event_logger.info(f"Added {added_tracks} tracks to the Serato database on {drive}")
+
+    def report_stage_limits(self) -> None:
+        """Send the number of tracks allowed in each stage as metrics, if they have changed since last sent."""
+        stage_limits = {stage: limiter.limit for stage, limiter in self.stage_limiters.items()}
+        stage_limits["track"] = self.settings.max_pool_workers
+        if stage_limits != self.reported_stage_limits:
+            self.reported_stage_limits = stage_limits
+            self.event_logger.metric("limits", stage_limits)
+
+    def report_cache_metrics(self) -> None:
+        """Send the Spotify responses taken from the cache since the last report as metrics."""
+        cache_stats = self.spotify_helper.cache_stats()
+        if not cache_stats:
+            return
+        hits = sum(cache_stats[key] - self.reported_cache_stats.get(key, 0) for key in ("fresh", "revalidated"))
+        misses = cache_stats["downloaded"] - self.reported_cache_stats.get("downloaded", 0)
+        self.reported_cache_stats = dict(cache_stats)
+        self.event_logger.metric("cache", "spotify", hits, misses)
+
+    def record_library_write(self, was_written: bool) -> None:
         """
+        Keep count of DJ library files that were skipped because their contents were unchanged.
 
-        manager = multiprocessing.Manager()
-        id_to_video_map = manager.dict(load_hashmap_from_json(self.settings.dj_library_drive))
-        lock = manager.Lock()
+        :param was_written: Whether the DJ library file was written.
+        """
+        if not was_written:
+            self.skipped_library_writes += 1
 
-        downloaded_tracks: list[None, str] = [None for i in range(len(playlist_data))]
+    def report_failures(self) -> None:
+        """
+        Log the tracks that are still failing to download. Tracks that need a custom URL are shown to the user,
+        tracks that will be retried automatically are only logged to the debug log.
+        """
+        report = self.failure_ledger.report()
+        if self.skipped_failed_tracks:
+            self.event_logger.info(f"Skipped {self.skipped_failed_tracks} tracks that failed on an earlier sync")
+        if not report:
+            return
+
+        self.event_logger.info(report[0])
+        for failure, line in zip(self.failure_ledger.outstanding_failures(), report[1:]):
+            if failure["permanent"]:
+                self.event_logger.info(line)
+            else:
+                self.event_logger.debug(line)
+
+    def report_profile(self) -> None:
+        """
+        Merge the profiles of the sync and every worker into one pstats file, and log the functions with the most
+        cumulative time.
+        """
+        if not self.profile_directory:
+            return
 
-        with concurrent.futures.ProcessPoolExecutor(max_workers=3) as executor:
-            # Submit tasks to the executor
-            future_to_track_data = {executor.submit(process_track,
-                                                    track_data,
-                                                    lock,
-                                                    self.settings.get_setting_object(),
-                                                    id_to_video_map,
-                                                    self.event_queue): track_data
-                                    for track_data in playlist_data}
+        stats = merge_profiles(self.profile_directory)
+        if stats is None:
+            return
+        self.event_logger.info(f"Profile saved to {os.path.join(self.profile_directory, MERGED_PROFILE_NAME)}")
+        for line in summarize_profile(stats, self.settings.profile_top_n):
+            self.event_logger.info(line)
 
-            for index, future in enumerate(concurrent.futures.as_completed(future_to_track_data)):
-                track_data = future_to_track_data[future]
-                track_artist = track_data.get("track", {}).get("artists", [{}])[0].get("name", "Unknown")
-                track_identifier = f"{track_artist} - {track_data.get('track', {}).get('name')}"
+    def filter_failed_tracks(self, playlist_data: list[dict]) -> list[dict]:
+        """
+        Remove tracks that the failure ledger says to skip this run, because they are parked or still backing off.
 
-                try:
-                    track_file_path = future.result()
-                    downloaded_tracks[index] = track_file_path
+        :param playlist_data: List of dictionaries containing playlist track data.
+        :return: The tracks to download.
+        """
+        if not self.failure_ledger.entries:
+            return playlist_data
+
+        # One copy of the index rather than a manager round trip per track
+        id_to_video_map = dict(self.worker_pool.id_to_video_map)
+        tracks_to_download = []
+        for track_data in playlist_data:
+            track_id = track_data.get("track", {}).get("id")
+            if self.failure_ledger.should_skip(track_id, self.custom_url(id_to_video_map.get(track_id))):
+                self.skipped_failed_tracks += 1
+                continue
+            tracks_to_download.append(track_data)
+        return tracks_to_download
+
+    @staticmethod
+    def custom_url(track_file_path: Optional[str]) -> Optional[str]:
+        """Return the track index entry if it is a custom YouTube URL rather than a downloaded file path."""
+        if track_file_path and "youtube.com/" in track_file_path:
+            return track_file_path
+        return None
+
+    def download_playlist(self, playlist_data: list[dict], playlist_name: str) -> list[str]:
+        """
+        Downloads tracks from a given playlist and updates the Serato crate and Rekordbox playlist objects.
 
-                except pytube.exceptions.AgeRestrictedError as e:
-                    self.event_logger.error(f"Age Restricted Video, \"{track_identifier}\" Cant Download.")
-                    self.event_logger.debug(f"{track_data=}, error={e}")
+        Tracks are submitted to the worker pool through a bounded window, so at most tracks_in_flight futures exist at
+        once and memory use doesn't grow with the playlist size. Each track's data is released from playlist_data as
+        soon as it has been processed. No new tracks are submitted while the sync is paused.
 
-                except Exception as e:
-                    self.event_logger.error(f"Error downloading track:  \"{track_identifier}\"")
-                    self.event_logger.debug(f"{track_data=}, error={e}")
-                    self.event_logger.error(traceback.format_exc())
-                    print(e)
+        Progress is reported by the estimated work of each processed track, out of the whole sync. Each track
+        reserves its estimated size on the DJ drive before it is submitted, and once the drive is about to fill only the
+        tracks already on it are submitted. In staging mode, finished tracks are passed to the DriveWriter to be moved to the drive.
 
-                self.event_logger.update_progress((index / len(playlist_data) + playlist_index) / self.total_playlists)
+        :param playlist_data: List of dictionaries containing playlist track data. Emptied as tracks are processed.
+        :param playlist_name: The playlist's name.
+        :return: List of downloaded tack's file paths, in playlist order.
+        """
+        playlist_data = self.filter_failed_tracks(playlist_data)
+        track_count = len(playlist_data)
+        track_work = estimate_playlist_work(playlist_data, dict(self.worker_pool.id_to_video_map))
+        self.progress_tracker.start_playlist(playlist_name, track_work)
+        window_size = self.settings.tracks_in_flight
+
+        # Downloaded paths with their playlist positions, kept in completion order and sorted back at the end
+        downloaded_positions = array("L")
+        downloaded_paths: list[str] = []
+
+        context = self.worker_pool.create_context(self.settings.get_setting_object(),
+                                                  self.event_queue,
+                                                  self.stage_limiters,
+                                                  self.cancel_token)
+
+        in_flight: dict[concurrent.futures.Future, int] = {}
+        next_position = 0
+        skipped_for_space = 0
+        while next_position < track_count or in_flight:
+            # Top up the window, unless paused or cancelled
+            while (next_position < track_count and len(in_flight) < window_size
+                   and not self.cancel_token.paused and not self.cancel_token.cancelled):
+                # Tracks already on the drive need no space, and are still submitted once the drive is full so the
+                # playlist's crate and playlist files keep them
+                if not self.drive_space.reserve(estimate_file_size(track_work[next_position])):
+                    playlist_data[next_position] = None
+                    skipped_for_space += 1
+                    next_position += 1
+                    continue
+                in_flight[self.worker_pool.submit(playlist_data[next_position], context)] = next_position
+                self.event_logger.metric("stage", "track", "queued")
+                next_position += 1
+
+            if self.cancel_token.cancelled:
+                next_position = track_count
+                for pending_future in in_flight:
+                    pending_future.cancel()
+            if not in_flight:
+                if self.cancel_token.paused:
+                    time.sleep(0.5)
+                continue
+
+            done, _ = concurrent.futures.wait(in_flight, timeout=0.5,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                position = in_flight.pop(future)
+                with log_context(playlist_data[position]["track"]["id"]):
+                    track_file_path = self.handle_track_result(future, playlist_data[position])
+                playlist_data[position] = None
+                if self.adaptive_concurrency:
+                    self.report_stage_limits()
+                reserved_size = estimate_file_size(track_work[position])
+                if track_file_path:
+                    downloaded_positions.append(position)
+                    downloaded_paths.append(track_file_path)
+                if track_file_path and self.drive_writer:
+                    self.drive_writer.submit(track_file_path, reserved_size)
+                else:
+                    self.drive_space.release(reserved_size)
+                self.progress_tracker.complete_track(track_work[position])
+
+        if skipped_for_space:
+            self.event_logger.info(f"DJ drive nearly full, not downloading {skipped_for_space} tracks of "
+                                   f"{playlist_name}")
+        self.progress_tracker.update(force=True)
+        self.failure_ledger.save()
+        return [downloaded_paths[i] for i in sorted(range(len(downloaded_paths)), key=downloaded_positions.__getitem__)]
+
+    def handle_track_result(self, future: concurrent.futures.Future, track_data: dict) -> Optional[str]:
+        """
+        Record the outcome of a processed track in the failure ledger and adaptive concurrency, logging any errors.
 
-        return [item for item in downloaded_tracks if item is not None]
+        :param future: The track's completed future.
+        :param track_data: The track's Spotify data.
+        :return: The downloaded track's file path, or None if it failed or was cancelled.
+        """
+        track_artist = track_data.get("track", {}).get("artists", [{}])[0].get("name", "Unknown")
+        track_identifier = f"{track_artist} - {track_data.get('track', {}).get('name')}"
+        track_id = track_data.get("track", {}).get("id")
+
+        try:
+            track_result = future.result()
+            # Tracks stopped by a cancel return None, and count as neither a success nor a failure
+            if not track_result:
+                return None
+            self.failure_ledger.record_success(track_id)
+            # Only tracks that were downloaded say anything about how many searches and downloads YouTube allows
+            if self.adaptive_concurrency and track_result.downloaded:
+                self.adaptive_concurrency.record_success()
+            return track_result.file_path
+
+        except concurrent.futures.CancelledError:
+            self.event_logger.metric("stage", "track", "dropped")
+            return None
+
+        except Exception as e:
+            if is_throttle_error(e):
+                self.event_logger.metric("throttle")
+            self.failure_ledger.record_failure(track_id, track_identifier, e,
+                                               self.custom_url(self.worker_pool.id_to_video_map.get(track_id)))
+            if is_permanent_error(e):
+                self.event_logger.error(f"{type(e).__name__}, \"{track_identifier}\" Cant Download. Add a "
+                                        f"custom URL for it to id_to_video_map.json to retry it.")
+                self.event_logger.debug(f"{track_data=}, error={e}")
+            else:
+                if self.adaptive_concurrency:
+                    self.adaptive_concurrency.record_failure(e)
+                self.event_logger.error(f"Error downloading track:  \"{track_identifier}\"")
+                self.event_logger.debug(f"{track_data=}, error={e}")
+                self.event_logger.error(traceback.format_exc())
+            return None
+
+
+def main() -> None:
+    """
+    Run a sync from the command line. The first Ctrl+C cancels the sync gracefully, finishing the DJ library files
+    for the tracks already downloaded, and a second Ctrl+C stops immediately.
+    """
+    parser = argparse.ArgumentParser(description="Sync the Spotify playlists in settings.yaml to the DJ library drive.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the sync and every worker with cProfile, saving the profiles to the logs "
+                             "directory.")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Also trace memory allocations with tracemalloc. Much slower.")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve live sync metrics on this local port, replacing metrics_port in settings.yaml.")
+    parser.add_argument("--mirror-drive", action="append",
+                        help="Also sync the library to this drive, replacing mirror_drives in settings.yaml. Can be "
+                             "given more than once.")
+    args = parser.parse_args()
+
+    event_queue_handler = EventQueueHandler()
+    log_listener = start_logging(event_queue_handler.log_queue)
+    settings = SettingsSingleton(EventQueueLogger(event_queue_handler.event_queue))
+    if args.profile:
+        settings.update_setting("profile", True)
+    if args.profile_memory:
+        settings.update_setting("profile_memory", True)
+    if args.mirror_drive:
+        settings.update_setting("mirror_drives", args.mirror_drive)
+    if args.metrics_port:
+        settings.update_setting("metrics_port", args.metrics_port)
+
+    # With no ui to take events off the queue, a thread collects the metric events from it
+    stop_metrics = threading.Event()
+    if settings.metrics_port:
+        event_queue_handler.start_metrics(settings.metrics_port)
+        threading.Thread(target=event_queue_handler.process_queue_headless, args=(stop_metrics,),
+                         name="metrics-events", daemon=True).start()
+
+    cancel_token = CancellationToken(event_queue_handler.manager.Event(), event_queue_handler.manager.Event())
+
+    def handle_interrupt(signum, frame):
+        if cancel_token.cancelled:
+            raise KeyboardInterrupt
+        print("Cancelling download, press Ctrl+C again to stop immediately")
+        cancel_token.cancel()
+
+    signal.signal(signal.SIGINT, handle_interrupt)
+    try:
+        PySyncDJDownload(None, event_queue_handler.event_queue, cancel_token=cancel_token,
+                         log_queue=event_queue_handler.log_queue)
+    finally:
+        stop_metrics.set()
+        if event_queue_handler.metrics_server:
+            event_queue_handler.metrics_server.shutdown()
+        log_listener.stop()
 
 
 if __name__ == "__main__":
     multiprocessing.freeze_support()
-    PySyncDJDownload(None, EventQueueHandler().event_queue)
+    main()
@@ -1,25 +1,39 @@
 import logging
 import multiprocessing
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
+from download_service import DownloadService
 from event_queue import EventQueueHandler
-from ui_elements.ui_main import UIMain
-from utils import setup_file_logging
+from logging_pipeline import start_logging
+
+if TYPE_CHECKING:
+    from ui_elements.ui_main import UIMain
 
 
 class PySyncDJMain:
 
     def __init__(self):
         self.logger: Optional[logging] = None
-        self.ui: Optional[UIMain] = None
+        self.ui: Optional['UIMain'] = None
 
         self.event_queue_handler = EventQueueHandler()
 
-        self.logging = setup_file_logging()
-        self.start_ui()
+        self.log_listener = start_logging(self.event_queue_handler.log_queue)
+        self.download_service = DownloadService(self.event_queue_handler.manager,
+                                                self.event_queue_handler.event_queue,
+                                                self.event_queue_handler.log_queue)
+        try:
+            self.start_ui()
+        finally:
+            self.download_service.shutdown()
+            self.log_listener.stop()
 
     def start_ui(self):
-        self.ui = UIMain(self.event_queue_handler.event_queue)
+        # Imported here, not at module level, because spawned child processes re-import this module as __mp_main__
+        # and shouldn't have to load customtkinter.
+        from ui_elements.ui_main import UIMain
+
+        self.ui = UIMain(self.event_queue_handler.event_queue, self.download_service)
         self.event_queue_handler.set_ui(self.ui)
 
         self.ui.app.after(250, self.event_queue_handler.process_queue())
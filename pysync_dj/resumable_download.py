@@ -0,0 +1,142 @@
+import logging
+import os
+import re
+import time
+from typing import Optional, TYPE_CHECKING
+
+from utils import LOGGER_NAME
+
+if TYPE_CHECKING:
+    import requests
+
+    from cancellation import CancellationToken
+
+DEFAULT_CHUNK_SIZE = 9 * 1024 * 1024  # YouTube throttles single large requests, so download in ranges of 9MB
+PART_FILE_SUFFIX = ".part"
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+# Retries back off from 1 second, doubling up to this, so a throttling server isn't asked again straight away
+MAX_RETRY_DELAY = 30
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class IncompleteDownloadError(Exception):
+    """Raised when a download can't be completed, or finishes at a different size to the one expected."""
+
+
+def part_file_path(file_path: str) -> str:
+    """The path a file is downloaded to before it is complete."""
+    return file_path + PART_FILE_SUFFIX
+
+
+def download_file(url: str,
+                  file_path: str,
+                  expected_size: Optional[int] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  max_retries: int = 5,
+                  timeout: float = 30,
+                  session: Optional['requests.Session'] = None,
+                  cancel_token: Optional['CancellationToken'] = None) -> str:
+    """
+    Download a file in chunks using HTTP range requests, resuming where it left off if the connection drops.
+
+    The download is written to a .part file next to the target, which is only renamed to the target once it is
+    complete and its size has been verified. If a .part file is already there from an earlier, interrupted run, the
+    download resumes from its current size.
+
+    :param url: The URL to download.
+    :param file_path: Where to save the downloaded file.
+    :param expected_size: The expected size of the file in bytes, if known. Used to verify the download.
+    :param chunk_size: The number of bytes to request per range request.
+    :param max_retries: How many times in a row to retry after a dropped connection before giving up.
+    :param timeout: Seconds to wait for the server before treating the connection as dropped.
+    :param session: The requests session to download with.
+    :param cancel_token: Checked between chunks and while waiting to retry, so a cancelled sync stops the download
+        part way through. The .part file is kept, so the download resumes on the next sync.
+    :return: The path of the downloaded file.
+    :raises SyncCancelled: If the sync is cancelled during the download.
+    """
+    if os.path.isfile(file_path) and (expected_size is None or os.path.getsize(file_path) == expected_size):
+        return file_path
+
+    import requests
+
+    session = session or requests.Session()
+    part_path = part_file_path(file_path)
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    if expected_size is not None and offset > expected_size:
+        logger.warning(f"Partial download {part_path} is larger than expected, starting again")
+        offset = 0
+    if offset:
+        logger.debug(f"Resuming download of {file_path} from byte {offset}")
+
+    total_size = expected_size
+    retries = 0
+    with open(part_path, "ab") as part_file:
+        part_file.truncate(offset)
+
+        while total_size is None or offset < total_size:
+            range_end = offset + chunk_size - 1
+            if total_size is not None:
+                range_end = min(range_end, total_size - 1)
+
+            try:
+                with session.get(url, headers={"Range": f"bytes={offset}-{range_end}"}, stream=True,
+                                 timeout=timeout) as response:
+                    response.raise_for_status()
+
+                    if response.status_code == 206:
+                        total_size = total_size or _total_size_from_content_range(response)
+                    elif offset:
+                        # The server ignored the range and is sending the whole file, so start the file again
+                        logger.debug(f"Server ignored range request for {file_path}, restarting download")
+                        offset = 0
+                        part_file.truncate(0)
+                    if response.status_code == 200:
+                        total_size = total_size or int(response.headers.get("Content-Length", 0)) or None
+
+                    received = 0
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        if cancel_token:
+                            cancel_token.check()
+                        part_file.write(chunk)
+                        offset += len(chunk)
+                        received += len(chunk)
+                    part_file.flush()
+
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                part_file.flush()
+                retries += 1
+                if retries > max_retries:
+                    raise IncompleteDownloadError(
+                        f"Download of {file_path} failed after {max_retries} retries at byte {offset}") from e
+                logger.debug(f"Connection dropped downloading {file_path} at byte {offset}, retrying: {e}")
+                retry_delay = min(2 ** (retries - 1), MAX_RETRY_DELAY)
+                if cancel_token:
+                    cancel_token.cancel_event.wait(retry_delay)
+                    cancel_token.check()
+                else:
+                    time.sleep(retry_delay)
+                continue
+
+            retries = 0
+            if response.status_code == 200:
+                break
+            if total_size is None and received < chunk_size:
+                break  # Without a known size, a short range means we've reached the end of the file
+            if not received:
+                raise IncompleteDownloadError(f"Server sent no data for {file_path} at byte {offset}")
+
+    if expected_size is not None and offset != expected_size:
+        raise IncompleteDownloadError(f"Downloaded {offset} bytes for {file_path} but expected {expected_size}")
+
+    os.replace(part_path, file_path)
+    return file_path
+
+
+def _total_size_from_content_range(response: 'requests.Response') -> Optional[int]:
+    """Read the full file size from a partial response's Content-Range header, if the server gave one."""
+    match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range", ""))
+    if match and match.group(3) != "*":
+        return int(match.group(3))
+    return None
@@ -1,10 +1,235 @@
+import copy
 import os
 
 import yaml
 from typing import Any, Optional
 
+DEFAULT_DOWNLOAD_WORKERS = {"search": 3, "download": 3, "transcode": 2}
 
-class SettingsSingleton:
+
+class Settings:
+    """
+    User settings, as loaded from a settings.yaml. Each instance holds its own settings, so more than one configuration
+    can be used in a process, such as the profiles of a batch sync. SettingsSingleton is the one instance shared by the
+    whole app.
+
+    :ivar _settings: Stores the loaded settings.
+    :ivar _file_path: The path the settings were loaded from.
+    :ivar _logger: Program logger
+    """
+
+    def __init__(self,
+                 settings: Optional[dict] = None,
+                 file_path: Optional[str] = None,
+                 event_logger: 'EventQueueLogger' = None) -> None:
+        """
+        Initialize the Settings.
+
+        :param settings: The settings, as loaded from a settings file.
+        :param file_path: The path the settings were loaded from, if they were.
+        :param event_logger: Logger for setting updates.
+        """
+        self._settings = settings if settings is not None else {}
+        self._file_path = file_path
+        self._logger = event_logger
+
+    @classmethod
+    def from_file(cls, file_path: str, event_logger: 'EventQueueLogger' = None) -> 'Settings':
+        """
+        Load settings from a settings file.
+
+        :param file_path: The path to the settings file.
+        :param event_logger: Logger for setting updates.
+        :return: The loaded settings.
+        """
+        with open(file_path, 'r') as file:
+            return cls(yaml.safe_load(file) or {}, file_path, event_logger)
+
+    def copy(self) -> 'Settings':
+        """
+        :return: A copy of the settings that can be updated without changing these.
+        """
+        return Settings(copy.deepcopy(self.get_setting_object()), self._file_path, self._logger)
+
+    def reload_settings(self) -> None:
+        """
+        Reload settings from the file they were originally loaded from, discarding any session updates.
+        """
+        if self._file_path is not None:
+            with open(self._file_path, 'r') as file:
+                self._settings = yaml.safe_load(file) or {}
+
+    def get_setting(self, key: str) -> Any:
+        """
+        Retrieve a specific setting value by key.
+
+        :param key: The key of the setting to retrieve.
+        :return: The value of the specified setting.
+        """
+        return self._settings.get(key)
+
+    def update_setting(self, key: str, value: Any) -> None:
+        """
+        Update a specific setting value by key in the current session.
+
+        :param key: The key of the setting to update.
+        :param value: The new value for the setting.
+        """
+        self._settings[key] = value
+        if self._logger:
+            self._logger.debug(f"Updated setting {key} to {value}")
+
+    def get_setting_object(self):
+        return self._settings
+
+    @property
+    def spotify_client_id(self) -> str:
+        return self.get_setting('spotify_client_id')
+
+    @property
+    def spotify_client_secret(self) -> str:
+        return self.get_setting('spotify_client_secret')
+
+    @property
+    def spotify_redirect_uri(self) -> str:
+        return self.get_setting('spotify_redirect_uri')
+
+    @property
+    def spotify_token_cache(self) -> Optional[str]:
+        return self.get_setting('spotify_token_cache')
+
+    @property
+    def dj_library_drive(self) -> str:
+        return self.get_setting('dj_library_drive')
+
+    @property
+    def mirror_drives(self) -> list[str]:
+        return self.get_setting('mirror_drives') or []
+
+    @property
+    def mirror_link_mode(self) -> str:
+        return self.get_setting('mirror_link_mode') or "copy"
+
+    @property
+    def tracks_folder(self) -> str:
+        return self.get_setting('tracks_folder')
+
+    @property
+    def track_layout(self) -> str:
+        return self.get_setting('track_layout') or "flat"
+
+    @property
+    def serato_subcrate_dir(self) -> str:
+        return self.get_setting('serato_subcrate_dir')
+
+    @property
+    def rekordbox_playlist_folder(self) -> str:
+        return self.get_setting('rekordbox_playlist_folder')
+
+    @property
+    def download_liked_songs(self) -> bool:
+        return self.get_setting('download_liked_songs')
+
+    @property
+    def liked_songs_track_limit(self) -> int:
+        return self.get_setting('liked_songs_track_limit')
+
+    @property
+    def liked_songs_date_limit(self) -> str:
+        return self.get_setting('liked_songs_date_limit')
+
+    @property
+    def playlists_to_download(self) -> dict[str, str]:
+        return self.get_setting('playlists_to_download')
+
+    @property
+    def download_workers(self) -> dict[str, int]:
+        """The number of tracks that can be in each pipeline stage at once, with defaults for unset stages."""
+        return {**DEFAULT_DOWNLOAD_WORKERS, **(self.get_setting('download_workers') or {})}
+
+    @property
+    def adaptive_concurrency(self) -> bool:
+        return bool(self.get_setting('adaptive_concurrency'))
+
+    @property
+    def adaptive_max_workers(self) -> int:
+        return self.get_setting('adaptive_max_workers') or 8
+
+    @property
+    def execution_mode(self) -> str:
+        return self.get_setting('execution_mode') or "process"
+
+    @property
+    def tracks_in_flight(self) -> int:
+        """The most tracks submitted to the worker pool at once, by default enough to keep every worker busy."""
+        return self.get_setting('tracks_in_flight') or self.max_pool_workers * 2
+
+    @property
+    def failure_retry_delay_hours(self) -> float:
+        return self.get_setting('failure_retry_delay_hours') or 1
+
+    @property
+    def staging_directory(self) -> Optional[str]:
+        return self.get_setting('staging_directory')
+
+    @property
+    def min_free_space_mb(self) -> float:
+        min_free_space_mb = self.get_setting('min_free_space_mb')
+        return 200 if min_free_space_mb is None else min_free_space_mb
+
+    @property
+    def gc_retention_days(self) -> float:
+        gc_retention_days = self.get_setting('gc_retention_days')
+        return 30 if gc_retention_days is None else gc_retention_days
+
+    @property
+    def gc_quarantine_days(self) -> float:
+        gc_quarantine_days = self.get_setting('gc_quarantine_days')
+        return 30 if gc_quarantine_days is None else gc_quarantine_days
+
+    @property
+    def gc_quarantine_folder(self) -> str:
+        return self.get_setting('gc_quarantine_folder') or "PySync DJ Quarantine"
+
+    @property
+    def spotify_cache_mb(self) -> float:
+        spotify_cache_mb = self.get_setting('spotify_cache_mb')
+        return 50 if spotify_cache_mb is None else spotify_cache_mb
+
+    @property
+    def analyse_audio(self) -> bool:
+        return bool(self.get_setting('analyse_audio'))
+
+    @property
+    def update_serato_database(self) -> bool:
+        return bool(self.get_setting('update_serato_database'))
+
+    @property
+    def metrics_port(self) -> Optional[int]:
+        return self.get_setting('metrics_port')
+
+    @property
+    def profile(self) -> bool:
+        return bool(self.get_setting('profile')) or self.profile_memory
+
+    @property
+    def profile_memory(self) -> bool:
+        return bool(self.get_setting('profile_memory'))
+
+    @property
+    def profile_top_n(self) -> int:
+        return self.get_setting('profile_top_n') or 25
+
+    @property
+    def max_pool_workers(self) -> int:
+        """The number of workers needed to fill every stage's limit."""
+        max_workers = max(self.download_workers.values())
+        if self.adaptive_concurrency:
+            max_workers = max(max_workers, self.adaptive_max_workers)
+        return max_workers
+
+
+class SettingsSingleton(Settings):
     """
     A singleton class for loading and accessing user settings from settings.yaml.
 
@@ -13,16 +238,18 @@ class SettingsSingleton:
 
     :ivar _instance: Holds the singleton instance.
     :ivar _settings: Stores the loaded settings.
+    :ivar _file_path: The path the settings were loaded from.
     :ivar _logger: Program logger
     """
 
     _instance = None
     _settings = None
+    _file_path: Optional[str] = None
     _logger: 'EventQueueLogger' = None
 
     def __new__(cls,
                 event_logger: 'EventQueueLogger' = None,
-                file_path: Optional[str] = "..\settings.yaml") -> 'SettingsSingleton':
+                file_path: Optional[str] = "..\\settings.yaml") -> 'SettingsSingleton':
         """
         Create a new instance of SettingsSingleton if it doesn't exist, or return the existing instance.
 
@@ -32,10 +259,15 @@ class SettingsSingleton:
         if cls._instance is None:
             cls._instance = super(SettingsSingleton, cls).__new__(cls)
             cls._instance.load_settings(file_path)
+            cls._file_path = file_path
             cls._logger = event_logger
 
         return cls._instance
 
+    def __init__(self, *args, **kwargs) -> None:
+        # The settings are held by the class, and loaded once in __new__
+        pass
+
     @staticmethod
     def load_settings(file_path: str) -> None:
         """
@@ -62,6 +294,14 @@ class SettingsSingleton:
             with open(safe_file_path, 'r') as file:
                 SettingsSingleton._settings = yaml.safe_load(file)
 
+    def reload_settings(self) -> None:
+        """
+        Reload settings from the file they were originally loaded from, discarding any session updates. Used by
+        long-lived processes so that edits made to settings.yaml between syncs are picked up.
+        """
+        SettingsSingleton._settings = None
+        self.load_settings(self._file_path)
+
     @staticmethod
     def get_setting(key: str) -> Any:
         """
@@ -86,48 +326,4 @@ class SettingsSingleton:
             self._logger.error("Attempted to update setting on uninitialized settings.")
 
     def get_setting_object(self):
-        return self._settings
-
-    @property
-    def spotify_client_id(self) -> str:
-        return self.get_setting('spotify_client_id')
-
-    @property
-    def spotify_client_secret(self) -> str:
-        return self.get_setting('spotify_client_secret')
-
-    @property
-    def spotify_redirect_uri(self) -> str:
-        return self.get_setting('spotify_redirect_uri')
-
-    @property
-    def dj_library_drive(self) -> str:
-        return self.get_setting('dj_library_drive')
-
-    @property
-    def tracks_folder(self) -> str:
-        return self.get_setting('tracks_folder')
-
-    @property
-    def serato_subcrate_dir(self) -> str:
-        return self.get_setting('serato_subcrate_dir')
-
-    @property
-    def rekordbox_playlist_folder(self) -> str:
-        return self.get_setting('rekordbox_playlist_folder')
-
-    @property
-    def download_liked_songs(self) -> bool:
-        return self.get_setting('download_liked_songs')
-
-    @property
-    def liked_songs_track_limit(self) -> int:
-        return self.get_setting('liked_songs_track_limit')
-
-    @property
-    def liked_songs_date_limit(self) -> str:
-        return self.get_setting('liked_songs_date_limit')
-
-    @property
-    def playlists_to_download(self) -> dict[str, str]:
-        return self.get_setting('playlists_to_download')
+        return SettingsSingleton._settings
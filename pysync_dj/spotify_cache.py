@@ -0,0 +1,287 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from utils import write_file_if_changed
+
+SPOTIFY_CACHE_DIRECTORY = "../cache/spotify"
+CACHE_ENTRY_SUFFIX = ".json"
+
+# Response headers kept with a cached response. The rest, such as connection and encoding headers, only describe the
+# original transfer
+KEPT_HEADERS = ("Content-Type", "ETag", "Cache-Control", "Last-Modified")
+
+
+def parse_cache_control(header: Optional[str]) -> dict[str, Optional[str]]:
+    """
+    Parse a Cache-Control header into its directives.
+
+    :param header: The header's value, or None.
+    :return: Lowercase directive names mapped to their values, or None for directives without one.
+    """
+    directives = {}
+    for directive in (header or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers) -> Optional[float]:
+    """
+    Work out how long a response can be used without revalidating it.
+
+    :param headers: The response headers.
+    :return: Seconds the response stays fresh, 0 if it must always be revalidated, or None if it mustn't be stored.
+    """
+    directives = parse_cache_control(headers.get("Cache-Control"))
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    max_age = directives.get("max-age")
+    if max_age and re.fullmatch(r"\d+", max_age):
+        return int(max_age)
+    return 0
+
+
+class HTTPCache:
+    """
+    On disk store of GET responses, one file per URL. The total size is kept under a cap by evicting the least
+    recently used entries.
+
+    Responses only meant for one user are stored under a scope as well as their URL, such as a hash of the request's
+    credentials, and are only returned for that scope. Another user sharing the cache directory never gets them.
+    """
+
+    def __init__(self, directory: str = SPOTIFY_CACHE_DIRECTORY, max_size_mb: float = 50) -> None:
+        """
+        Initialize the HTTPCache.
+
+        :param directory: The directory to store responses in.
+        :param max_size_mb: The most space the stored responses can use.
+        """
+        self.directory = directory
+        self.max_size = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # File name to (size, last used), loaded once so eviction doesn't have to scan the directory every time
+        self.entry_sizes: dict[str, tuple[int, float]] = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(CACHE_ENTRY_SUFFIX) and entry.is_file():
+                    stat = entry.stat()
+                    self.entry_sizes[entry.name] = (stat.st_size, stat.st_mtime)
+
+    @staticmethod
+    def file_name(url: str, scope: Optional[str] = None) -> str:
+        key = f"{scope} {url}" if scope else url
+        return hashlib.sha256(key.encode()).hexdigest() + CACHE_ENTRY_SUFFIX
+
+    @property
+    def size(self) -> int:
+        return sum(size for size, _ in self.entry_sizes.values())
+
+    def get(self, url: str, scope: Optional[str] = None) -> Optional[dict]:
+        """
+        :param url: The request URL, including its query string.
+        :param scope: The scope of a response only meant for one user, or None for a shared response.
+        :return: The stored entry, with its url, status, headers, body and expires time, or None if not stored.
+        """
+        file_name = self.file_name(url, scope)
+        if file_name not in self.entry_sizes:
+            return None
+        try:
+            with open(os.path.join(self.directory, file_name), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.delete(url, scope)
+            return None
+        if entry.get("url") != url or entry.get("scope") != scope:
+            return None
+
+        entry["body"] = base64.b64decode(entry["body"])
+        self.touch(file_name)
+        return entry
+
+    def touch(self, file_name: str) -> None:
+        """Mark an entry as just used, so it is the last to be evicted."""
+        with self.lock:
+            size, _ = self.entry_sizes.get(file_name, (0, 0))
+            self.entry_sizes[file_name] = (size, time.time())
+        try:
+            os.utime(os.path.join(self.directory, file_name))
+        except OSError:
+            pass
+
+    def put(self, url: str, status: int, headers, body: bytes, expires: float, scope: Optional[str] = None) -> None:
+        """
+        Store a response, then evict the least recently used entries if over the size cap.
+
+        :param url: The request URL, including its query string.
+        :param status: The response status code.
+        :param headers: The response headers.
+        :param body: The response body.
+        :param expires: The time the response stops being fresh.
+        :param scope: The scope of a response only meant for one user, or None for a shared response.
+        """
+        data = json.dumps({
+            "url": url,
+            "scope": scope,
+            "status": status,
+            "headers": {name: headers[name] for name in KEPT_HEADERS if name in headers},
+            "expires": expires,
+            "body": base64.b64encode(body).decode("ascii"),
+        }).encode()
+        if len(data) > self.max_size:
+            return
+
+        file_name = self.file_name(url, scope)
+        write_file_if_changed(os.path.join(self.directory, file_name), data)
+        with self.lock:
+            self.entry_sizes[file_name] = (len(data), time.time())
+        self.evict()
+
+    def update_expiry(self, url: str, entry: dict, expires: float) -> None:
+        """Store a new expiry time for an entry that was revalidated."""
+        self.put(url, entry["status"], entry["headers"], entry["body"], expires, entry.get("scope"))
+
+    def delete(self, url: str, scope: Optional[str] = None) -> None:
+        file_name = self.file_name(url, scope)
+        with self.lock:
+            self.entry_sizes.pop(file_name, None)
+        try:
+            os.remove(os.path.join(self.directory, file_name))
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache is under its size cap."""
+        with self.lock:
+            total_size = self.size
+            if total_size <= self.max_size:
+                return
+            evicted = []
+            for file_name, (size, _) in sorted(self.entry_sizes.items(), key=lambda item: item[1][1]):
+                if total_size <= self.max_size:
+                    break
+                total_size -= size
+                evicted.append(file_name)
+            for file_name in evicted:
+                del self.entry_sizes[file_name]
+
+        for file_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except OSError:
+                pass
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter that answers GET requests from an HTTPCache. Fresh responses, by their Cache-Control max-age,
+    are returned without a request. Stale responses with an ETag are revalidated with If-None-Match, and when the
+    server answers 304 Not Modified the stored body is returned, so an unchanged resource costs a request but no
+    download.
+    """
+
+    def __init__(self, cache: HTTPCache, **kwargs) -> None:
+        """
+        Initialize the CachingAdapter.
+
+        :param cache: The cache to store responses in.
+        :param kwargs: Passed to HTTPAdapter, such as max_retries.
+        """
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.stats = {"fresh": 0, "revalidated": 0, "downloaded": 0}
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        # Responses marked private, such as a user's liked songs, are only shared with requests made with the same
+        # credentials, so profiles logged in to different accounts over one cache never get each other's
+        authorization = request.headers.get("Authorization")
+        private_scope = hashlib.sha256(authorization.encode()).hexdigest() if authorization else None
+        entry = private_scope and self.cache.get(request.url, private_scope)
+        if not entry:
+            entry = self.cache.get(request.url)
+            # A private response stored without a scope, by an older version, isn't known to be this user's
+            if entry and private_scope and "private" in parse_cache_control(entry["headers"].get("Cache-Control")):
+                entry = None
+        if entry and entry["expires"] > time.time():
+            self.stats["fresh"] += 1
+            return self.build_cached_response(request, entry)
+        if entry and entry["headers"].get("ETag"):
+            request.headers["If-None-Match"] = entry["headers"]["ETag"]
+
+        response = super().send(request, **kwargs)
+
+        if entry and response.status_code == 304:
+            self.stats["revalidated"] += 1
+            lifetime = freshness_lifetime(response.headers)
+            if lifetime:
+                self.cache.update_expiry(request.url, entry, time.time() + lifetime)
+            response.close()
+            return self.build_cached_response(request, entry)
+
+        self.stats["downloaded"] += 1
+        if response.status_code == 200:
+            lifetime = freshness_lifetime(response.headers)
+            private = "private" in parse_cache_control(response.headers.get("Cache-Control"))
+            scope = private_scope if private else None
+            if entry and entry.get("scope") != scope:
+                self.cache.delete(request.url, entry.get("scope"))
+            if lifetime is not None and (lifetime or response.headers.get("ETag")):
+                self.cache.put(request.url, response.status_code, response.headers, response.content,
+                               time.time() + lifetime, scope)
+            elif entry:
+                self.cache.delete(request.url, entry.get("scope"))
+        return response
+
+    @staticmethod
+    def build_cached_response(request: requests.PreparedRequest, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"]
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "OK"
+        return response
+
+
+def create_cached_session(cache: HTTPCache, retries: int = 3, backoff_factor: float = 0.3) -> requests.Session:
+    """
+    Create a requests session that caches GET responses, with the same retries spotipy sets up for its own sessions.
+
+    :param cache: The cache to store responses in.
+    :param retries: The number of retries for failed requests.
+    :param backoff_factor: The backoff factor between retries.
+    :return: The session. Its adapter, with the cache stats, is mounted for https://.
+    """
+    retry = urllib3.Retry(total=retries,
+                          connect=None,
+                          read=False,
+                          allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+                          status=retries,
+                          backoff_factor=backoff_factor,
+                          status_forcelist=(429, 500, 502, 503, 504))
+    session = requests.Session()
+    adapter = CachingAdapter(cache, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
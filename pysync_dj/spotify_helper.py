@@ -2,10 +2,40 @@ from datetime import datetime
 
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from event_queue import EventQueueLogger
-from settings import SettingsSingleton
+from settings import Settings, SettingsSingleton
+from spotify_cache import HTTPCache, CachingAdapter, create_cached_session
+
+
+def compact_track(item: Dict) -> Optional[Dict]:
+    """
+    Keep only the parts of a Spotify playlist item that the sync uses. Full items carry fields such as
+    available_markets and every image size, which for a large library add up to hundreds of MB held for the whole
+    run. Items are compacted as each page arrives so the full page can be freed.
+
+    :param item: A playlist or saved tracks item from the Spotify API.
+    :return: The compacted item, or None if it isn't a Spotify track, such as a local file or a removed track.
+    """
+    track = item.get("track")
+    if not track or not track.get("id"):
+        return None
+
+    album = track.get("album") or {}
+    return {
+        "added_at": item.get("added_at"),
+        "track": {
+            "id": track["id"],
+            "name": track["name"],
+            "artists": [{"name": artist["name"]} for artist in track.get("artists", [])],
+            "album": {"name": album.get("name"), "images": [{"url": image["url"]} for image in
+                                                            album.get("images", [])[:2]]},
+            "popularity": track.get("popularity"),
+            "duration_ms": track.get("duration_ms"),
+            "external_ids": {"isrc": track.get("external_ids", {}).get("isrc")},
+        },
+    }
 
 
 class SpotifyHelper:
@@ -14,64 +44,109 @@ class SpotifyHelper:
 
     This class provides methods to interact with Spotify, such as retrieving playlist tracks
     and liked tracks, using the Spotipy library.
+
+    Both Spotify clients share a requests session that caches responses on disk, so pages of playlists that haven't
+    changed since the last sync are answered with 304 Not Modified instead of being downloaded again.
     """
 
-    def __init__(self, event_logger: EventQueueLogger) -> None:
+    def __init__(self, event_logger: EventQueueLogger, settings: Optional[Settings] = None) -> None:
         """
         Initializes the SpotifyHelper with Spotify API credentials.
+
+        :param event_logger: Logger for Spotify requests.
+        :param settings: The settings with the Spotify credentials and what to sync, defaults to the app's settings.
         """
         self.logger = event_logger
-        self.settings = SettingsSingleton()
+        self.settings = settings or SettingsSingleton()
+
+        self.session = True
+        if self.settings.spotify_cache_mb:
+            self.session = create_cached_session(HTTPCache(max_size_mb=self.settings.spotify_cache_mb))
+
         self.client_credentials_manager = SpotifyClientCredentials(
             client_id=self.settings.spotify_client_id,
             client_secret=self.settings.spotify_client_secret
         )
-        self.sp = spotipy.Spotify(client_credentials_manager=self.client_credentials_manager)
+        self.sp = spotipy.Spotify(client_credentials_manager=self.client_credentials_manager,
+                                  requests_session=self.session)
+        self._user_sp: Optional[spotipy.Spotify] = None
+
+    @property
+    def user_sp(self) -> spotipy.Spotify:
+        """
+        Spotify client authorised as the user, to read their liked songs. Created the first time it is needed, as
+        it may prompt the user to log in, and then reused along with its access token.
+        """
+        if self._user_sp is None:
+            auth_manager = SpotifyOAuth(
+                client_id=self.settings.spotify_client_id,
+                client_secret=self.settings.spotify_client_secret,
+                redirect_uri=self.settings.spotify_redirect_uri,
+                scope="user-library-read",
+                cache_path=self.settings.spotify_token_cache
+            )
+            self._user_sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=self.session)
+        return self._user_sp
+
+    def cache_stats(self) -> Optional[dict[str, int]]:
+        """
+        :return: The number of responses that were fresh in the cache, revalidated with a 304 and downloaded, or None
+            if the cache is off.
+        """
+        if isinstance(self.session, bool):
+            return None
+        adapter = self.session.get_adapter("https://")
+        return dict(adapter.stats) if isinstance(adapter, CachingAdapter) else None
 
     def get_playlist_tracks(self, playlist_id: str) -> List[Dict]:
         """
         Retrieves tracks from a given Spotify playlist.
 
         :param playlist_id: Spotify playlist ID
-        :return: A list of dictionaries, each representing a track in the playlist.
+        :return: A list of dictionaries, each representing a track in the playlist, compacted by compact_track.
         """
         try:
             results = self.sp.playlist_items(playlist_id)
-            tracks = results['items']
-            while results['next']:
-                results = self.sp.next(results)
-                tracks.extend(results['items'])
+            tracks = []
+            while results:
+                tracks.extend(track for item in results['items'] if (track := compact_track(item)))
+                results = self.sp.next(results) if results['next'] else None
             return tracks
         except Exception as e:
             self.logger.error(f"Error retrieving playlist tracks: {e}")
             return []
 
+    def get_playlist_track_count(self, playlist_id: str) -> Optional[int]:
+        """
+        Retrieves the number of tracks in a Spotify playlist, without fetching the tracks.
+
+        :param playlist_id: Spotify playlist ID
+        :return: The number of tracks, or None if it couldn't be retrieved.
+        """
+        try:
+            return self.sp.playlist(playlist_id, fields="tracks.total")["tracks"]["total"]
+        except Exception as e:
+            self.logger.debug(f"Error retrieving playlist track count: {e}")
+            return None
+
     def get_liked_tracks(self) -> List[Dict]:
         """
         Retrieves tracks from the users liked list.
 
-        :return: A list of dictionaries, each representing a liked track.
+        :return: A list of dictionaries, each representing a liked track, compacted by compact_track.
         """
-        auth_manager = SpotifyOAuth(
-            client_id=self.settings.spotify_client_id,
-            client_secret=self.settings.spotify_client_secret,
-            redirect_uri=self.settings.spotify_redirect_uri,
-            scope="user-library-read"
-        )
-
-        # Create a Spotipy client with the auth manager
-        sp = spotipy.Spotify(auth_manager=auth_manager)
+        sp = self.user_sp
 
         # Fetch liked songs
         liked_songs = []
         try:
             results = sp.current_user_saved_tracks()
             while results:
-                for track in results["items"]:
-                    if self._is_track_within_date_and_track_limit(liked_songs, track):
-                        liked_songs.append(track)
-                    else:
+                for item in results["items"]:
+                    if not self._is_track_within_date_and_track_limit(liked_songs, item):
                         return liked_songs[:self.settings.liked_songs_track_limit]
+                    if track := compact_track(item):
+                        liked_songs.append(track)
 
                 results = sp.next(results) if results['next'] else None
             return liked_songs[:self.settings.liked_songs_track_limit]
@@ -0,0 +1,322 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import string
+from typing import Optional
+
+import parse_serato_crates
+from garbage_collector import MEMBERSHIP_FILE, PlaylistMembership
+from utils import LOGGER_NAME, VIDEO_INDEX_FILE, load_hashmap_from_json, save_hashmap_to_json, sanitize_filename, \
+    write_file_if_changed
+
+FLAT_LAYOUT = "flat"
+SHARDED_LAYOUT = "sharded"
+SHARDED_TEMPLATE = "{shard}/{artist} - {title} [{spotify_id}]"
+LAYOUT_FIELDS = {"shard", "artist_initial", "artist", "title", "spotify_id"}
+# Kept well under the 255 character name limit, as the whole path is limited to 260 characters on Windows
+MAX_NAME_LENGTH = 80
+MIGRATION_JOURNAL_FILE = "layout_migration.json"
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class TrackLayout:
+    """
+    Works out where a track's file goes in the tracks folder, from its Spotify ID, artist and title, using a template
+    such as "{shard}/{artist} - {title} [{spotify_id}]". The Spotify ID in every file name means two tracks can never
+    share a file, and the shard, a short hash of the Spotify ID, spreads the tracks evenly over subfolders, so no
+    folder gets so large that FAT32 and exFAT drives slow down looking through it.
+
+    The template can use:
+     - {shard}: The first characters of a hash of the Spotify ID, in lower case hex so it's the same on case
+       insensitive drives.
+     - {artist_initial}: The first letter or number of the artist's name, or "#".
+     - {artist}: The track's first artist.
+     - {title}: The track's name.
+     - {spotify_id}: The Spotify track ID, which the template must include.
+
+    The "flat" layout keeps naming tracks after their YouTube video, all in the tracks folder.
+    """
+
+    def __init__(self, layout: Optional[str] = FLAT_LAYOUT, shard_length: int = 2) -> None:
+        """
+        Initialize the TrackLayout.
+
+        :param layout: "flat", "sharded" for the default sharded template, or a template. None for "flat".
+        :param shard_length: The number of hex characters in {shard}, 2 for 256 subfolders.
+        :raises ValueError: If the template uses unknown fields or doesn't include {spotify_id}.
+        """
+        layout = layout or FLAT_LAYOUT
+        self.template = SHARDED_TEMPLATE if layout == SHARDED_LAYOUT else layout
+        self.shard_length = shard_length
+        if self.is_flat:
+            return
+
+        fields = {field_name for _, field_name, _, _ in string.Formatter().parse(self.template) if field_name}
+        if unknown_fields := fields - LAYOUT_FIELDS:
+            raise ValueError(f"Unknown track layout fields: {', '.join(sorted(unknown_fields))}")
+        if "spotify_id" not in fields:
+            raise ValueError("Track layouts must include {spotify_id}, so that two tracks can't share a file")
+
+    @property
+    def is_flat(self) -> bool:
+        return self.template == FLAT_LAYOUT
+
+    def shard(self, track_id: str) -> str:
+        return hashlib.sha1(track_id.encode()).hexdigest()[:self.shard_length]
+
+    @staticmethod
+    def clean_name(name: str) -> str:
+        # Windows doesn't allow names ending with a dot or space
+        return sanitize_filename(name, MAX_NAME_LENGTH).strip().rstrip(".") or "Unknown"
+
+    def track_path(self, track_id: str, artist: str, title: str) -> str:
+        """
+        Work out a track's file path in the tracks folder.
+
+        :param track_id: The Spotify track ID.
+        :param artist: The track's first artist.
+        :param title: The track's name.
+        :return: The track's file path relative to the tracks folder, without an extension.
+        """
+        artist = self.clean_name(artist)
+        artist_initial = next((char.upper() for char in artist if char.isalnum()), "#")
+        path = self.template.format(shard=self.shard(track_id), artist_initial=artist_initial, artist=artist,
+                                    title=self.clean_name(title), spotify_id=track_id)
+        return os.path.join(*path.split("/"))
+
+
+def read_artist_and_title(file_path: str) -> tuple[Optional[str], Optional[str]]:
+    """
+    Read a track's first artist and title from its tags.
+
+    :param file_path: The track's MP3 file.
+    :return: The first artist and the title, or None for those that can't be read.
+    """
+    from mutagen.id3 import ID3, ID3NoHeaderError
+
+    try:
+        tags = ID3(file_path)
+    except (ID3NoHeaderError, OSError):
+        return None, None
+    artist = tags.get("TPE1")
+    title = tags.get("TIT2")
+    # The artists are written joined, see utils.set_track_metadata
+    return (str(artist.text[0]).split(", ")[0] if artist and artist.text else None,
+            str(title.text[0]) if title and title.text else None)
+
+
+class LayoutMigration:
+    """
+    Moves the tracks already on a DJ library drive to where a track layout puts them, and rewrites everything on the
+    drive that points at them, the track indexes, playlist membership, Serato crates and database, and Rekordbox
+    playlists and XML library, in one pass.
+
+    The moves are recorded in a journal on the drive before any file is moved, so a migration cut short, such as by
+    unplugging the drive, carries on from where it stopped when run again.
+    """
+
+    def __init__(self, drive: str, tracks_folder: str, layout: TrackLayout, serato_subcrate_dir: str,
+                 rekordbox_playlist_folder: str) -> None:
+        """
+        Initialize the LayoutMigration.
+
+        :param drive: The DJ library drive.
+        :param tracks_folder: The tracks folder on the drive.
+        :param layout: The layout to move the tracks to.
+        :param serato_subcrate_dir: The Serato subcrates folder on the drive.
+        :param rekordbox_playlist_folder: The Rekordbox playlists folder on the drive.
+        """
+        self.drive = drive
+        self.tracks_dir = os.path.join(drive, tracks_folder)
+        self.layout = layout
+        self.serato_subcrate_dir = serato_subcrate_dir
+        self.rekordbox_dir = os.path.join(drive, rekordbox_playlist_folder)
+        self.journal_path = os.path.join(drive, MIGRATION_JOURNAL_FILE)
+        self.id_to_video_map = load_hashmap_from_json(drive)
+        self.video_to_file_map = load_hashmap_from_json(drive, VIDEO_INDEX_FILE)
+
+    def _full_path(self, index_path: str) -> str:
+        return os.path.join(self.drive, index_path)
+
+    @staticmethod
+    def _index_path(file_path: str) -> str:
+        return os.path.splitdrive(file_path)[1]
+
+    def plan(self) -> dict[str, str]:
+        """
+        Work out where each track's file moves to. A file shared by several Spotify tracks is placed by the first of
+        them in ID order, so the plan is the same every time. An unfinished migration's plan is carried on with.
+
+        :return: The index path each file moves from, to the index path it moves to.
+        """
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, "r") as file:
+                return json.load(file)
+
+        file_track_ids: dict[str, list[str]] = {}
+        for track_id, index_path in self.id_to_video_map.items():
+            if "youtube.com/" not in index_path:
+                file_track_ids.setdefault(index_path, []).append(track_id)
+
+        moves = {}
+        for index_path, track_ids in file_track_ids.items():
+            file_path = self._full_path(index_path)
+            if not os.path.isfile(file_path):
+                logger.warning(f"Not moving missing file {file_path}")
+                continue
+
+            artist, title = read_artist_and_title(file_path)
+            if not title:
+                title = os.path.splitext(os.path.basename(file_path))[0]
+            relative_path = self.layout.track_path(min(track_ids), artist or "Unknown", title)
+            new_index_path = self._index_path(os.path.join(self.tracks_dir, relative_path + ".mp3"))
+            if new_index_path != index_path:
+                moves[index_path] = new_index_path
+        return moves
+
+    def apply(self, moves: dict[str, str], dry_run: bool = True) -> int:
+        """
+        Move the files and rewrite everything that points at them.
+
+        :param moves: The plan of moves.
+        :param dry_run: If True, only log the moves.
+        :return: The number of files moved.
+        """
+        if dry_run:
+            for old_index_path, new_index_path in moves.items():
+                logger.info(f"Would move {old_index_path} to {new_index_path}")
+            return 0
+
+        write_file_if_changed(self.journal_path, json.dumps(moves, indent=1).encode())
+
+        moved = 0
+        for old_index_path, new_index_path in moves.items():
+            old_path, new_path = self._full_path(old_index_path), self._full_path(new_index_path)
+            if not os.path.exists(old_path):
+                # Already moved by an earlier run
+                continue
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(old_path, new_path)
+            moved += 1
+
+        self.rewrite_indexes(moves)
+        self.rewrite_crates(moves)
+        self.rewrite_serato_database(moves)
+        self.rewrite_rekordbox_files(moves)
+        os.remove(self.journal_path)
+        return moved
+
+    def rewrite_indexes(self, moves: dict[str, str]) -> None:
+        """Point the track and video indexes and the playlist membership at the moved files."""
+        for index, file_name in ((self.id_to_video_map, "id_to_video_map.json"),
+                                 (self.video_to_file_map, VIDEO_INDEX_FILE)):
+            save_hashmap_to_json({key: moves.get(index_path, index_path) for key, index_path in index.items()},
+                                 self.drive, file_name)
+
+        if os.path.isfile(os.path.join(self.drive, MEMBERSHIP_FILE)):
+            membership = PlaylistMembership(self.drive)
+            membership.playlists = {playlist_name: [moves.get(index_path, index_path) for index_path in index_paths]
+                                    for playlist_name, index_paths in membership.playlists.items()}
+            membership.last_seen = {moves.get(index_path, index_path): last_seen
+                                    for index_path, last_seen in membership.last_seen.items()}
+            membership.save()
+
+    def rewrite_crates(self, moves: dict[str, str]) -> None:
+        """
+        Point every Serato crate on the drive, the user's own as well as PySync DJ's, at the moved files.
+        """
+        from dj_libraries.serato_database import path_key
+
+        crate_moves = {path_key(old_index_path): new_index_path for old_index_path, new_index_path in moves.items()}
+        subcrate_dir = os.path.join(self.drive, self.serato_subcrate_dir.replace("\\", os.sep))
+        if not os.path.isdir(subcrate_dir):
+            return
+
+        for file_name in os.listdir(subcrate_dir):
+            if not file_name.endswith(".crate"):
+                continue
+            crate_path = os.path.join(subcrate_dir, file_name)
+            with open(crate_path, "rb") as file:
+                crate = parse_serato_crates.decode_struct(file.read())
+            crate = [(tag, [(field_tag, crate_moves.get(path_key(value), value) if field_tag == "ptrk" else value)
+                            for field_tag, value in fields])
+                     if tag == "otrk" else (tag, fields)
+                     for tag, fields in crate]
+            write_file_if_changed(crate_path, parse_serato_crates.encode_struct(crate))
+
+    def rewrite_serato_database(self, moves: dict[str, str]) -> None:
+        """Point the Serato database's entries for the moved files at their new paths, keeping everything else."""
+        from dj_libraries.serato_database import SeratoDatabase, path_key
+
+        serato_database = SeratoDatabase(self.drive, self.serato_subcrate_dir)
+        if not os.path.isfile(serato_database.file_path):
+            return
+
+        database_moves = {path_key(serato_database.serato_path(self._full_path(old_index_path))):
+                          serato_database.serato_path(self._full_path(new_index_path))
+                          for old_index_path, new_index_path in moves.items()}
+        serato_database.entries = [
+            (tag, [(field_tag, database_moves.get(path_key(value), value) if field_tag == "pfil" else value)
+                   for field_tag, value in fields])
+            if tag == "otrk" else (tag, fields)
+            for tag, fields in serato_database.entries]
+        serato_database.save()
+
+    def rewrite_rekordbox_files(self, moves: dict[str, str]) -> None:
+        """Point the Rekordbox M3U playlists and XML library at the moved files."""
+        import urllib.parse
+
+        if not os.path.isdir(self.rekordbox_dir):
+            return
+
+        full_path_moves = {self._full_path(old_index_path): self._full_path(new_index_path)
+                           for old_index_path, new_index_path in moves.items()}
+        for file_name in os.listdir(self.rekordbox_dir):
+            file_path = os.path.join(self.rekordbox_dir, file_name)
+            if file_name.endswith(".m3u"):
+                with open(file_path, "rb") as file:
+                    lines = file.read().decode().splitlines()
+                lines = [full_path_moves.get(line, line) for line in lines]
+                write_file_if_changed(file_path, "".join(line + os.linesep for line in lines).encode())
+            elif file_name.endswith(".xml"):
+                with open(file_path, "rb") as file:
+                    library = file.read().decode("UTF-8")
+                for old_path, new_path in full_path_moves.items():
+                    library = library.replace(f">file://localhost/{urllib.parse.quote(old_path)}<",
+                                              f">file://localhost/{urllib.parse.quote(new_path)}<")
+                write_file_if_changed(file_path, library.encode("UTF-8"))
+
+
+def main() -> None:
+    from settings import SettingsSingleton
+
+    parser = argparse.ArgumentParser(description="Move the tracks on the DJ library drive to the track layout in "
+                                                 "settings.yaml, and update the DJ libraries to match.")
+    parser.add_argument("--drive", help="The DJ library drive to migrate, defaults to the drive in settings.yaml.")
+    parser.add_argument("--layout", help="The layout to migrate to, defaults to track_layout in settings.yaml.")
+    parser.add_argument("--apply", action="store_true",
+                        help="Move the files. Without this, only report what would be moved.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    settings = SettingsSingleton()
+    layout = TrackLayout(args.layout or settings.track_layout)
+    if layout.is_flat:
+        logger.error("Set track_layout in settings.yaml, or --layout, to the layout to move the tracks to")
+        return
+
+    migration = LayoutMigration(args.drive or settings.dj_library_drive, settings.tracks_folder, layout,
+                                settings.serato_subcrate_dir, settings.rekordbox_playlist_folder)
+    moves = migration.plan()
+    moved = migration.apply(moves, dry_run=not args.apply)
+    if args.apply:
+        logger.info(f"Moved {moved} tracks to the {layout.template} layout")
+    else:
+        logger.info(f"{len(moves)} tracks to move, run with --apply to move them")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,169 @@
+import contextlib
 import os
+from concurrent.futures import Executor
+from typing import Iterator, NamedTuple, Optional, TYPE_CHECKING
 
+from cancellation import CancellationToken, SyncCancelled
+from candidate_ranking import TrackQuery, VideoCandidate, rank_candidates
 from event_queue import EventQueueLogger
-from utils import sanitize_filename, set_track_metadata, save_hashmap_to_json
-from yt_download_helper import YouTubeDownloadHelper
+from logging_pipeline import log_context
+from profiling import run_profiled
+from track_layout import TrackLayout
+from utils import sanitize_filename, set_track_metadata, save_hashmap_to_json, VIDEO_INDEX_FILE, SEARCH_CACHE_FILE
+from yt_download_helper import YouTubeDownloadHelper, VideoNotFoundError, StreamRejectedError
 
+if TYPE_CHECKING:
+    from pytubefix import YouTube
+    from audio_analysis import TrackAnalysis
 
-def process_track(track_data, lock, settings, id_to_video_map, event_queue) -> str:
+# The most search results to load and check for a track before giving up, as each costs a request to YouTube
+MAX_CANDIDATE_ATTEMPTS = 3
+
+
+class TrackResult(NamedTuple):
+    """A processed track's file, and whether it was downloaded rather than found already on the drive."""
+    file_path: str
+    downloaded: bool
+
+
+class WorkerContext:
+    """
+    The state shared by every track processed in a sync. In process mode this is pickled and sent with each track,
+    with manager proxies for the shared parts. In thread mode a single instance is shared in memory by every worker
+    thread, so nothing is pickled.
     """
-    Initializes a track processor class and processes the track
+
+    def __init__(self, settings: dict, lock, id_to_video_map, video_to_file_map, search_cache, event_queue,
+                 stage_limiters: dict, cancel_token: CancellationToken,
+                 transcode_executor: Optional[Executor] = None) -> None:
+        """
+        Initialize the WorkerContext.
+
+        :param settings: Users settings.
+        :param lock: Lock used for safely saving id_to_video_map, video_to_file_map and search_cache.
+        :param id_to_video_map: The track index, mapping Spotify track IDs to file paths.
+        :param video_to_file_map: Maps the YouTube video IDs that have been downloaded to their file paths.
+        :param search_cache: Maps Spotify track IDs to the YouTube video ID chosen for them by search.
+        :param event_queue: This is the events queue that handles logging.
+        :param stage_limiters: Limiters for the number of tracks in each pipeline stage (search, download, transcode).
+        :param cancel_token: Pauses and cancels the sync. Tracks wait while paused, and stop at the next stage or
+            download chunk once cancelled.
+        :param transcode_executor: Process pool to run MP3 conversion in. If None, conversion runs in the worker.
+        """
+        self.settings = settings
+        self.lock = lock
+        self.id_to_video_map = id_to_video_map
+        self.video_to_file_map = video_to_file_map
+        self.search_cache = search_cache
+        self.event_queue = event_queue
+        self.stage_limiters = stage_limiters
+        self.cancel_token = cancel_token
+        self.transcode_executor = transcode_executor
+
+    def __getstate__(self) -> dict:
+        # Executors can't be pickled, and only thread mode, which never pickles the context, uses one
+        return {**self.__dict__, "transcode_executor": None}
+
+    def convert_to_mp3(self, file_path: str) -> str:
+        """
+        Convert a downloaded audio file to MP3, in the transcode process pool if there is one.
+
+        :param file_path: Path of the downloaded audio file.
+        :return: Path of the MP3 file.
+        """
+        if self.transcode_executor is None:
+            return YouTubeDownloadHelper.convert_to_mp3(file_path)
+        return self.transcode_executor.submit(run_profiled,
+                                              self.settings.get("profile_directory"),
+                                              "transcode",
+                                              bool(self.settings.get("profile_memory")),
+                                              YouTubeDownloadHelper.convert_to_mp3,
+                                              file_path).result()
+
+    def analyse_audio(self, file_path: str) -> 'TrackAnalysis':
+        """
+        Analyse a converted track's tempo and loudness, in the transcode process pool if there is one, as the
+        analysis is CPU bound like the conversion. Without one the analysis runs in the worker, already inside the
+        worker's track profiler, as a second profiler in the same thread would replace it.
+
+        :param file_path: Path of the MP3 file.
+        :return: The track's analysis.
+        """
+        # Imported here so only workers that analyse tracks load numpy
+        from audio_analysis import analyse_file
+
+        if self.transcode_executor is None:
+            return analyse_file(file_path)
+        return self.transcode_executor.submit(run_profiled,
+                                              self.settings.get("profile_directory"),
+                                              "analysis",
+                                              bool(self.settings.get("profile_memory")),
+                                              analyse_file,
+                                              file_path).result()
+
+
+def process_track(track_data: dict, context: WorkerContext) -> Optional[TrackResult]:
+    """
+    Initializes a track processor class and processes the track. When profiling, the worker's profile is written to
+    the sync's profile directory after every track.
 
     :param track_data: Track data from Spotify API.
-    :param lock: Lock used for safely saving id_to_video_map.
-    :param settings: Users settings.
-    :param id_to_video_map:
-    :param event_queue: This is the events queue that handles logging
-    :return: Downloaded track's file path
+    :param context: State shared by every track in the sync.
+    :return: The track's file path and whether it was downloaded, or None if the sync was cancelled
     """
-    event_logger = EventQueueLogger(event_queue)
-    track_consumer = TrackProcessor(track_data, lock, settings, id_to_video_map, event_logger)
-    return track_consumer.process_spotify_track(track_data)
+    return run_profiled(context.settings.get("profile_directory"),
+                        "track",
+                        bool(context.settings.get("profile_memory")),
+                        _process_track,
+                        track_data,
+                        context)
+
+
+def _process_track(track_data: dict, context: WorkerContext) -> Optional[TrackResult]:
+    event_logger = EventQueueLogger(context.event_queue, bool(context.settings.get("metrics_port")))
+    event_logger.metric("stage", "track", "started")
+    try:
+        context.cancel_token.wait_if_paused()
+
+        with log_context(track_data["track"]["id"]):
+            track_consumer = TrackProcessor(track_data, context, event_logger)
+            track_file_path = track_consumer.process_spotify_track(track_data)
+    except SyncCancelled:
+        event_logger.metric("stage", "track", "cancelled")
+        return None
+    except BaseException:
+        event_logger.metric("stage", "track", "failed")
+        raise
+
+    event_logger.metric("stage", "track", "skipped" if track_consumer.skipped else "completed")
+    return TrackResult(track_file_path, track_consumer.downloaded)
 
 
 class TrackProcessor:
-    def __init__(self, track_data, lock, settings, id_to_video_map, event_logger):
+    def __init__(self, track_data, context: WorkerContext, event_logger):
         self.event_logger: EventQueueLogger = event_logger
-        self.ytd_helper = YouTubeDownloadHelper(settings["dj_library_drive"], settings["tracks_folder"])
+        self.context = context
+        self.stage_limiters = context.stage_limiters
+        # In staging mode tracks are downloaded and converted on a local disk, and moved to the drive by the
+        # DriveWriter in the main process
+        self.staging_dir = context.settings.get("staging_directory")
+        self.ytd_helper = YouTubeDownloadHelper(self.staging_dir or context.settings["dj_library_drive"],
+                                                context.settings["tracks_folder"],
+                                                context.settings.get("max_duration_ratio"),
+                                                context.settings.get("max_file_size_mb"))
+        self.track_layout = TrackLayout(context.settings.get("track_layout"))
         self.track_data = track_data
-        self.lock = lock
-        self.id_to_video_map = id_to_video_map
-        self.settings = settings
+        self.cancel_token = context.cancel_token
+        self.lock = context.lock
+        self.id_to_video_map = context.id_to_video_map
+        self.video_to_file_map = context.video_to_file_map
+        self.search_cache = context.search_cache
+        self.settings = context.settings
+        # Whether the track was already downloaded, for the metrics
+        self.skipped = False
+        # Whether a video was downloaded for the track, rather than it being found on the drive or linked to a video
+        # another track downloaded
+        self.downloaded = False
 
     def process_spotify_track(self, track: dir) -> str:
         """
@@ -47,6 +182,8 @@ class TrackProcessor:
             # If the file paths is not a custom url and the file is downloaded, skip
             if not track_file_path_is_url and os.path.exists(track_file_path_with_drive):
                 self.event_logger.info(f"Skipping track \"{track['track']['name']}\" as it is already downloaded")
+                self.event_logger.metric("cache", "track_index", 1, 0)
+                self.skipped = True
                 return track_file_path
 
             # If the file path is a custom url, download the track from the given url
@@ -55,31 +192,213 @@ class TrackProcessor:
                 return self.download_track(track, track_file_path)
 
         # If there is no file path in the database, or fails other checks, download the track
+        self.event_logger.metric("cache", "track_index", 0, 1)
         self.event_logger.info(f"Downloading track: \"{track['track']['name']}\"")
         return self.download_track(track)
 
     def download_track(self, track: dir, custom_yt_url: str = None) -> str:
         """
-        Takes a spotify track and downloads it from YouTube.
+        Takes a spotify track and downloads it from YouTube. Search results are tried best first, moving on to the
+        next when a video's stream fails the pre-download checks.
 
         :param track: Spotify track to download
         :param custom_yt_url: A url for a video to be used instead of a YouTube search if provided
-        :return: The file location of the downloaded track
+        :return: The file location of the downloaded track, on the DJ drive even if it is still in the staging
+            directory
         """
         track_name = track["track"]["name"]
         track_artist = sanitize_filename(track["track"]["artists"][0]["name"])
         track_id = track["track"]["id"]
 
         if custom_yt_url:
-            youtube_video = self.ytd_helper.search_video_url(custom_yt_url)
+            # The user picked this video themselves, so it isn't checked against the track's duration
+            with self.stage("search"):
+                custom_video = self.ytd_helper.search_video_url(custom_yt_url)
+            videos = [custom_video] if custom_video else []
+            expected_duration = None
         else:
-            youtube_video = self.ytd_helper.search_video(f"{track_artist} - {track_name}")
+            videos = self.find_candidate_videos(track)
+            expected_duration = TrackQuery.from_track(track).duration_seconds
 
-        track_file_path = self.ytd_helper.download_audio(youtube_video)
-        set_track_metadata(track, track_file_path)
+        # Named from the Spotify track rather than the video, so tracks whose videos share a title get their own file
+        file_name = None
+        if not self.track_layout.is_flat:
+            file_name = self.track_layout.track_path(track_id, track["track"]["artists"][0]["name"], track_name)
 
-        with self.lock:
-            self.id_to_video_map[track_id] = os.path.splitdrive(track_file_path)[1]
-            save_hashmap_to_json(dict(self.id_to_video_map), self.settings["dj_library_drive"])
+        rejection = None
+        for youtube_video in videos:
+            # Another Spotify track (a single, album or compilation release of the same recording) may have already
+            # downloaded this video, in which case link to its file instead of downloading it again
+            video_id = youtube_video.video_id
+            if existing_file_path := self.find_downloaded_video(video_id):
+                self.event_logger.info(f"Linking track \"{track_name}\" to already downloaded video {video_id}")
+                self.update_track_index(track_id, existing_file_path)
+                return existing_file_path
+
+            try:
+                with self.stage("download"):
+                    self.cancel_token.check()
+                    downloaded_file_path = self.ytd_helper.download_audio_stream(youtube_video, expected_duration,
+                                                                                 self.cancel_token, file_name)
+                    self.record_file_bytes("download", downloaded_file_path)
+                    self.downloaded = True
+            except StreamRejectedError as e:
+                self.event_logger.debug(f"Skipping video for \"{track_name}\": {e}")
+                rejection = e
+                continue
+
+            if not custom_yt_url:
+                self.cache_search_result(track_id, video_id)
+            break
+        else:
+            if rejection:
+                raise StreamRejectedError(f"Every video found for \"{track_artist} - {track_name}\" was rejected, "
+                                          f"last: {rejection}")
+            raise VideoNotFoundError(f"No YouTube video found for \"{track_artist} - {track_name}\"")
+
+        with self.stage("transcode"):
+            self.cancel_token.check()
+            track_file_path = self.context.convert_to_mp3(downloaded_file_path)
+            self.record_file_bytes("transcode", track_file_path)
+            analysis = self.analyse_track(track_file_path) if self.settings.get("analyse_audio") else None
+
+        set_track_metadata(track, track_file_path, video_id, analysis)
+        if self.staging_dir:
+            track_file_path = os.path.join(self.settings["dj_library_drive"],
+                                           os.path.relpath(track_file_path, self.staging_dir))
+        self.update_track_index(track_id, track_file_path, video_id)
 
         return track_file_path
+
+    @contextlib.contextmanager
+    def stage(self, stage_name: str) -> Iterator[None]:
+        """
+        Run a pipeline stage, waiting for the stage's limiter, and send metric events as the track queues for, starts
+        and finishes the stage.
+
+        :param stage_name: The stage, one of concurrency.PIPELINE_STAGES.
+        """
+        self.event_logger.metric("stage", stage_name, "queued")
+        with self.stage_limiters[stage_name]:
+            self.event_logger.metric("stage", stage_name, "started")
+            try:
+                yield
+            except SyncCancelled:
+                self.event_logger.metric("stage", stage_name, "cancelled")
+                raise
+            except BaseException:
+                self.event_logger.metric("stage", stage_name, "failed")
+                raise
+            self.event_logger.metric("stage", stage_name, "completed")
+
+    def record_file_bytes(self, stage_name: str, file_path: str) -> None:
+        """Send the size of a file a stage wrote, for the metrics' throughput."""
+        if self.event_logger.metrics and os.path.isfile(file_path):
+            self.event_logger.metric("bytes", stage_name, os.path.getsize(file_path))
+
+    def analyse_track(self, track_file_path: str) -> Optional['TrackAnalysis']:
+        """
+        Analyse a track's tempo and loudness, to be written with its tags. A track that can't be analysed is still
+        kept, without the analysis.
+
+        :param track_file_path: Path of the MP3 file.
+        :return: The track's analysis, or None if it failed.
+        """
+        try:
+            return self.context.analyse_audio(track_file_path)
+        except Exception as e:
+            self.event_logger.error(f"Couldn't analyse \"{os.path.basename(track_file_path)}\": {e}")
+            return None
+
+    def find_candidate_videos(self, track: dict) -> Iterator['YouTube']:
+        """
+        Search YouTube for a track and yield the results that best match it on duration, title and channel, best
+        first, rather than taking the first result. The video chosen on an earlier sync is yielded first, and the
+        search is only made if that is rejected.
+
+        Results whose listed duration already fails the duration check are dropped without loading them, and at
+        most MAX_CANDIDATE_ATTEMPTS results are tried.
+
+        :param track: Spotify track to search for.
+        :return: Iterator of videos to try in order.
+        """
+        track_id = track["track"]["id"]
+        cached_video_id = self.search_cache.get(track_id)
+        self.event_logger.metric("cache", "search", 1 if cached_video_id else 0, 0 if cached_video_id else 1)
+        if cached_video_id:
+            self.event_logger.debug(f"Using cached search result {cached_video_id} for \"{track['track']['name']}\"")
+            yield self.ytd_helper.video_from_id(cached_video_id)
+
+        query = TrackQuery.from_track(track)
+        with self.stage("search"):
+            self.cancel_token.check()
+            candidates = self.ytd_helper.search_candidates(query.search_query,
+                                                           self.settings.get("search_candidates") or 10)
+        ranked_candidates = rank_candidates(query, candidates)
+
+        attempts = 0
+        for score, candidate in ranked_candidates:
+            if candidate.video_id == cached_video_id or not self.duration_allowed(query, candidate):
+                continue
+            if attempts >= MAX_CANDIDATE_ATTEMPTS:
+                return
+
+            self.event_logger.debug(f"Trying search result for \"{query.search_query}\": \"{candidate.title}\" by "
+                                    f"{candidate.channel} (score {score:.2f}, result {candidate.position + 1} of "
+                                    f"{len(candidates)})")
+            attempts += 1
+            yield self.ytd_helper.video_from_id(candidate.video_id)
+
+    def duration_allowed(self, query: TrackQuery, candidate: VideoCandidate) -> bool:
+        """Check a search result's listed duration against the max duration ratio, before loading the video."""
+        max_duration_ratio = self.ytd_helper.max_duration_ratio
+        if not (max_duration_ratio and query.duration_seconds and candidate.duration_seconds):
+            return True
+        ratio = max(candidate.duration_seconds / query.duration_seconds,
+                    query.duration_seconds / candidate.duration_seconds)
+        return ratio <= max_duration_ratio
+
+    def cache_search_result(self, track_id: str, video_id: str) -> None:
+        """Remember the video chosen for a track, so later syncs don't search for it again."""
+        if self.search_cache.get(track_id) == video_id:
+            return
+        with self.lock:
+            self.search_cache[track_id] = video_id
+            save_hashmap_to_json(dict(self.search_cache), self.settings["dj_library_drive"], SEARCH_CACHE_FILE)
+
+    def find_downloaded_video(self, video_id: str) -> Optional[str]:
+        """
+        Find the file a YouTube video was already downloaded to. With a staging directory, a file still waiting there
+        to be written to the drive counts as downloaded too.
+
+        :param video_id: The YouTube video ID.
+        :return: The file path of the downloaded video on the drive, or None if it hasn't been downloaded or the file
+            is missing.
+        """
+        video_file_path = self.video_to_file_map.get(video_id)
+        if video_file_path:
+            drive = self.settings["dj_library_drive"]
+            video_file_path = os.path.join(drive, video_file_path)
+            staged_file_path = (os.path.join(self.staging_dir, os.path.relpath(video_file_path, drive))
+                                if self.staging_dir else None)
+            # The staged file is checked first, as the drive writer may move it to the drive in between the checks
+            if not ((staged_file_path and os.path.exists(staged_file_path)) or os.path.exists(video_file_path)):
+                video_file_path = None
+        self.event_logger.metric("cache", "video_index", 1 if video_file_path else 0, 0 if video_file_path else 1)
+        return video_file_path
+
+    def update_track_index(self, track_id: str, track_file_path: str, video_id: Optional[str] = None) -> None:
+        """
+        Record a track's file in the track index, and the video it was downloaded from in the video index.
+
+        :param track_id: The Spotify track ID.
+        :param track_file_path: The track's file path.
+        :param video_id: The YouTube video ID the file was downloaded from, if it was just downloaded.
+        """
+        drive = self.settings["dj_library_drive"]
+        with self.lock:
+            self.id_to_video_map[track_id] = os.path.splitdrive(track_file_path)[1]
+            save_hashmap_to_json(dict(self.id_to_video_map), drive)
+            if video_id:
+                self.video_to_file_map[video_id] = os.path.splitdrive(track_file_path)[1]
+                save_hashmap_to_json(dict(self.video_to_file_map), drive, VIDEO_INDEX_FILE)
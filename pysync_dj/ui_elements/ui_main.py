@@ -1,4 +1,3 @@
-import multiprocessing
 import subprocess
 from multiprocessing import Queue
 from typing import Optional
@@ -10,15 +9,17 @@ import os
 
 import yaml
 
+from download_service import DownloadService
 from event_queue import EventQueueLogger
-from pysync_dj_download import PySyncDJDownload
 from ui_elements.ui_progress_bar import UIProgressBar
 from ui_elements.ui_output_log import UIOutputLog
 
 
 class UIMain:
-    def __init__(self, event_queue: Queue):
+    def __init__(self, event_queue: Queue, download_service: DownloadService):
         self.download_button: Optional[ctk.CTkButton] = None
+        self.pause_button: Optional[ctk.CTkButton] = None
+        self.cancel_button: Optional[ctk.CTkButton] = None
         self.app: Optional[ctk.CTk] = None
         self.ui_output_log: Optional[UIOutputLog] = None
         self.drive_selector: Optional[ctk.CTkComboBox] = None
@@ -26,6 +27,7 @@ class UIMain:
 
         self.event_queue = event_queue
         self.event_logger = EventQueueLogger(self.event_queue)
+        self.download_service = download_service
 
         self.build_ui_app()
         self.build_ui_elements()
@@ -33,13 +35,39 @@ class UIMain:
 
     def run_download(self) -> None:
         self.event_logger.update_progress(0)
+        self.event_logger.update_status("")
         selected_drive = self.drive_selector.get()
 
         self.event_logger.debug("UI Download Button Click")
         self.download_button.configure(state=ctk.DISABLED)
+        self.pause_button.configure(state=ctk.NORMAL, text="Pause")
+        self.cancel_button.configure(state=ctk.NORMAL)
 
-        download_process = multiprocessing.Process(target=PySyncDJDownload, args=(selected_drive, self.event_queue))
-        download_process.start()
+        self.download_service.sync(selected_drive)
+
+    def toggle_pause(self) -> None:
+        if self.download_service.is_paused():
+            self.download_service.resume()
+            self.pause_button.configure(text="Pause")
+            self.event_logger.info("Download resumed.")
+        else:
+            self.download_service.pause()
+            self.pause_button.configure(text="Resume")
+            self.event_logger.info("Download paused. Tracks already downloading will finish.")
+
+    def cancel_download(self) -> None:
+        self.download_service.cancel()
+        self.pause_button.configure(state=ctk.DISABLED, text="Pause")
+        self.cancel_button.configure(state=ctk.DISABLED)
+        self.event_logger.info("Cancelling download...")
+
+    def enable_download_button(self) -> None:
+        """
+        Re-enable the download button, and disable the pause and cancel buttons, once a download has finished.
+        """
+        self.download_button.configure(state=ctk.NORMAL)
+        self.pause_button.configure(state=ctk.DISABLED, text="Pause")
+        self.cancel_button.configure(state=ctk.DISABLED)
 
     def build_ui_app(self) -> None:
         ctk.set_appearance_mode("dark")
@@ -72,6 +100,15 @@ class UIMain:
         self.drive_selector = ctk.CTkComboBox(selection_frame, values=self.get_drives())  # Example values
         self.drive_selector.pack(side='left', padx=(5, 20))
 
+        # Build Cancel and Pause Buttons
+        self.cancel_button = ctk.CTkButton(selection_frame, text="Cancel", width=80, state=ctk.DISABLED,
+                                           command=self.cancel_download)
+        self.cancel_button.pack(side='right', padx=(5, 0))
+
+        self.pause_button = ctk.CTkButton(selection_frame, text="Pause", width=80, state=ctk.DISABLED,
+                                          command=self.toggle_pause)
+        self.pause_button.pack(side='right', padx=(5, 0))
+
         # Build Download Button
         self.download_button = ctk.CTkButton(selection_frame, text="Download", command=self.run_download)
         self.download_button.pack(side='right', expand=True, fill='x')
@@ -13,7 +13,7 @@ class UIProgressBar:
         if not cls._instance:
             cls._instance = super().__new__(cls)
             cls._instance.app = app
-            cls.progress_bar = cls.build_ui_elements(app)
+            cls.progress_bar, cls.status_label = cls.build_ui_elements(app)
         return cls._instance
 
     @staticmethod
@@ -33,7 +33,10 @@ class UIProgressBar:
         progress_bar.pack(fill='x', padx=20, pady=(10, 20))
         progress_bar.set(0)  # Initialize progress at 0
 
-        return progress_bar
+        status_label = ctk.CTkLabel(app, text="")
+        status_label.pack(anchor='e', padx=20)
+
+        return progress_bar, status_label
 
     def set_progress(self, progress: float) -> None:
         """
@@ -50,3 +53,10 @@ class UIProgressBar:
 
         self.progress_bar.update()
 
+    def set_status(self, status: str) -> None:
+        """
+        Sets the text under the bar, showing the tracks done, throughput and estimated time left.
+
+        :param status: The status text.
+        """
+        self.status_label.configure(text=status)
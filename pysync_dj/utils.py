@@ -1,64 +1,19 @@
-import datetime
 import json
-import logging
 import os
 import re
 import shutil
 import time
-from logging.handlers import RotatingFileHandler
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
 import unicodedata
-from mutagen.id3 import TIT2, TPE1, TALB, COMM, ID3, APIC
-from mutagen.mp3 import MP3
-from mutagen.mp4 import MP4, MP4Cover
-from mutagen.mp4 import MP4Tags
-import requests
 
-LOGGER_NAME = "LOGGER_MAIN"
-
-
-def setup_file_logging() -> logging.Logger:
-    def find_log_files(directory):
-        matched_files = []
-        for filename in os.listdir(directory):
-            if filename.startswith("pysync_dj_log_") and filename.endswith(".log"):
-                matched_files.append(os.path.join(directory, filename))
-        return matched_files
-
-    log_directory = "../logs"
-    if not os.path.exists(log_directory):
-        os.makedirs(log_directory)
-
-    # Clean up old log files, ensure only the latest 3 are kept.
-    existing_logs = find_log_files(os.path.join(log_directory))
-    existing_logs.sort(reverse=True)
-    for old_log in existing_logs[2:]:
-        os.remove(old_log)
-
-    # Filename with datetime suffix
-    datetime_suffix = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    log_filename = os.path.join(log_directory, f"pysync_dj_log_{datetime_suffix}.log")
-
-    # Set up logging
-    logger = logging.getLogger(LOGGER_NAME)
-    logger.setLevel(logging.DEBUG)  # Adjust as needed
-
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)  # Adjust as needed
-    console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-
-    # File handler with rotation
-    file_handler = RotatingFileHandler(log_filename, maxBytes=5 * 1024 * 1024, backupCount=2)
-    file_handler.setLevel(logging.DEBUG)  # Adjust as needed
-    file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
+if TYPE_CHECKING:
+    from audio_analysis import TrackAnalysis
 
-    return logger
+LOGGER_NAME = "LOGGER_MAIN"
+VIDEO_INDEX_FILE = "video_id_map.json"
+SEARCH_CACHE_FILE = "search_cache.json"
+VIDEO_ID_TAG = "YouTube Video ID"
 
 
 def set_track_metadata_mp4(track: dir, track_file_path: str) -> None:
@@ -68,6 +23,9 @@ def set_track_metadata_mp4(track: dir, track_file_path: str) -> None:
     :param track: Track data from spotify
     :param track_file_path: path to the mp4 audio file
     """
+    import requests
+    from mutagen.mp4 import MP4, MP4Cover, MP4Tags
+
     audio = MP4(track_file_path)
     if not audio.tags:
         audio.tags = MP4Tags()
@@ -97,13 +55,20 @@ def set_track_metadata_mp4(track: dir, track_file_path: str) -> None:
     audio.save()
 
 
-def set_track_metadata(track: dict, track_file_path: str) -> None:
+def set_track_metadata(track: dict, track_file_path: str, video_id: Optional[str] = None,
+                       analysis: Optional['TrackAnalysis'] = None) -> None:
     """
     Adds metadata from the Spotify track data to the MP3 audio file, including cover art if available.
 
     :param track: Track data from Spotify.
     :param track_file_path: Path to the MP3 audio file.
+    :param video_id: The ID of the YouTube video the audio was downloaded from.
+    :param analysis: The track's tempo and loudness analysis, written as BPM and ReplayGain tags with the rest.
     """
+    import requests
+    from mutagen.id3 import TIT2, TPE1, TALB, COMM, ID3, APIC, TSRC, TXXX
+    from mutagen.mp3 import MP3
+
     audio = MP3(track_file_path, ID3=ID3)
 
     track_data = track["track"]
@@ -121,6 +86,15 @@ def set_track_metadata(track: dict, track_file_path: str) -> None:
     audio['COMM'] = COMM(encoding=3, lang='eng', desc=f'Popularity = {track_popularity}',
                          text=f"{track_popularity}")  # todo: Needs fixing after mp3 update
 
+    # Identify the recording and source video, so duplicate files can be found later
+    if isrc := track_data.get("external_ids", {}).get("isrc"):
+        audio['TSRC'] = TSRC(encoding=3, text=isrc)
+    if video_id:
+        audio[f'TXXX:{VIDEO_ID_TAG}'] = TXXX(encoding=3, desc=VIDEO_ID_TAG, text=video_id)
+    if analysis:
+        from audio_analysis import add_analysis_frames
+        add_analysis_frames(audio, analysis)
+
     audio.save()
 
     audio = ID3(track_file_path)
@@ -142,14 +116,14 @@ def set_track_metadata(track: dict, track_file_path: str) -> None:
 
 def save_hashmap_to_json(id_to_video_map: dict, file_drive, file_path: str = "id_to_video_map.json") -> None:
     """
-    Save a hashmap to a JSON file.
+    Save a hashmap to a JSON file. The file is replaced atomically, so it is never left truncated if the program is
+    stopped mid-save, and isn't rewritten if nothing has changed.
 
     :param file_drive: The Drive to save the hashmap to.
     :param id_to_video_map: The hashmap to save.
     :param file_path: The path to the JSON file where the hashmap will be saved.
     """
-    with open(os.path.join(file_drive, file_path), 'w') as file:
-        json.dump(id_to_video_map, file, indent=4)
+    write_file_if_changed(os.path.join(file_drive, file_path), json.dumps(id_to_video_map, indent=4).encode())
 
 
 def load_hashmap_from_json(file_drive, file_path: str = "id_to_video_map.json") -> dict:
@@ -178,6 +152,36 @@ def load_hashmap_from_json(file_drive, file_path: str = "id_to_video_map.json")
             return json.load(file)
 
 
+def write_file_if_changed(file_path: str, data: bytes) -> bool:
+    """
+    Write data to a file only if it differs from the file's current contents. The new contents are written to a
+    temporary file next to the target and swapped in with os.replace, so a crash mid-write never leaves a truncated
+    file behind.
+
+    :param file_path: The path of the file to write.
+    :param data: The complete new contents of the file.
+    :return: True if the file was written, False if it was already up to date and the write was skipped.
+    """
+    if os.path.isfile(file_path) and os.path.getsize(file_path) == len(data):
+        with open(file_path, 'rb') as file:
+            if file.read() == data:
+                return False
+
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_file_path = f"{file_path}.tmp"
+    try:
+        with open(temp_file_path, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file_path, file_path)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+    return True
+
+
 def extract_spotify_playlist_id(url: str) -> Optional[str]:
     """
     Extract the Spotify playlist ID from a given URL.
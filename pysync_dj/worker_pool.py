@@ -0,0 +1,215 @@
+import concurrent.futures
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing.managers import SyncManager
+from typing import Optional
+
+from cancellation import CancellationToken, ignore_keyboard_interrupt
+from concurrency import StageLimiter, create_stage_limiters
+from logging_pipeline import configure_process_logging
+from track_processor import process_track, WorkerContext
+from utils import load_hashmap_from_json, save_hashmap_to_json, VIDEO_INDEX_FILE, SEARCH_CACHE_FILE
+
+EXECUTION_MODES = ("process", "thread")
+
+
+def warm_worker(log_queue=None) -> None:
+    """
+    Pool worker initializer. Imports the track processing stack up front so the first track a worker picks up
+    doesn't pay for loading pytubefix, moviepy and mutagen.
+
+    :param log_queue: The log queue to send the worker's log records to. Only given when the pool starts a worker,
+        not when warm_up runs this as a task.
+    """
+    ignore_keyboard_interrupt()
+    if log_queue is not None:
+        configure_process_logging(log_queue)
+
+    import requests  # noqa: F401
+    import pytubefix  # noqa: F401
+    import mutagen.id3  # noqa: F401
+    import mutagen.mp3  # noqa: F401
+    from moviepy.audio.io.AudioFileClip import AudioFileClip  # noqa: F401
+
+
+def warm_transcode_worker(log_queue=None) -> None:
+    """Transcode pool worker initializer, which only needs moviepy."""
+    ignore_keyboard_interrupt()
+    if log_queue is not None:
+        configure_process_logging(log_queue)
+    from moviepy.audio.io.AudioFileClip import AudioFileClip  # noqa: F401
+
+
+class WorkerPool:
+    """
+    A pool of track processing workers that is kept alive between syncs, along with the shared state the workers
+    use. Creating this once and reusing it means later syncs don't pay for spawning processes, re-importing the
+    download stack or reloading the track index.
+
+    The pool runs in one of two execution modes:
+     - process: every track runs in a worker process, with the track index and locks shared through the manager.
+     - thread: the network bound stages run in worker threads sharing in-memory state, and only MP3 conversion is
+       sent to a small process pool.
+    """
+
+    def __init__(self, manager: SyncManager, max_workers: int = 3, execution_mode: str = "process",
+                 transcode_workers: int = 2, log_queue=None) -> None:
+        """
+        Initialize the WorkerPool.
+
+        :param manager: The multiprocessing manager used to share state with worker processes.
+        :param max_workers: The number of track workers.
+        :param execution_mode: Either "process" or "thread".
+        :param transcode_workers: The number of MP3 conversion processes used in thread mode.
+        :param log_queue: The log queue worker processes send their log records to, or None to not set up logging
+            in them.
+        """
+        self.manager = manager
+        self.log_queue = log_queue
+        self.max_workers = max_workers
+        self.execution_mode = execution_mode
+        self.transcode_workers = transcode_workers
+
+        self.lock = None
+        self.id_to_video_map = None
+        self.video_to_file_map = None
+        self.search_cache = None
+        self.loaded_drive: Optional[str] = None
+        self.loaded_mtime: Optional[float] = None
+        self.executor: Optional[concurrent.futures.Executor] = None
+        self.transcode_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._start()
+
+    def _start(self) -> None:
+        if self.execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode {self.execution_mode}, expected one of {EXECUTION_MODES}")
+
+        if self.execution_mode == "thread":
+            self.lock = threading.Lock()
+            self.id_to_video_map = {}
+            self.video_to_file_map = {}
+            self.search_cache = {}
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+            self.transcode_executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.transcode_workers,
+                                                                             initializer=warm_transcode_worker,
+                                                                             initargs=(self.log_queue,))
+        else:
+            self.lock = self.manager.Lock()
+            self.id_to_video_map = self.manager.dict()
+            self.video_to_file_map = self.manager.dict()
+            self.search_cache = self.manager.dict()
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers,
+                                                                   initializer=warm_worker,
+                                                                   initargs=(self.log_queue,))
+            self.transcode_executor = None
+        self.loaded_drive = None
+        self.loaded_mtime = None
+
+    def configure(self, max_workers: int, execution_mode: str, transcode_workers: int) -> None:
+        """
+        Change the pool's size or execution mode. Executors can't be resized, so they are replaced with new warm
+        ones, but only if something has actually changed.
+
+        :param max_workers: The number of track workers.
+        :param execution_mode: Either "process" or "thread".
+        :param transcode_workers: The number of MP3 conversion processes used in thread mode.
+        """
+        if (max_workers, execution_mode, transcode_workers) == \
+                (self.max_workers, self.execution_mode, self.transcode_workers):
+            return
+
+        self._shutdown_executors()
+        self.max_workers = max_workers
+        self.execution_mode = execution_mode
+        self.transcode_workers = transcode_workers
+        self._start()
+        self.warm_up()
+
+    def warm_up(self) -> None:
+        """
+        Start every worker process now instead of on the first submitted track.
+        """
+        if self.transcode_executor:
+            concurrent.futures.wait([self.transcode_executor.submit(warm_transcode_worker)
+                                     for _ in range(self.transcode_workers)])
+        else:
+            concurrent.futures.wait([self.executor.submit(warm_worker) for _ in range(self.max_workers)])
+
+    def load_track_index(self, drive: str) -> None:
+        """
+        Load the drive's id_to_video_map, video_to_file_map (VIDEO_INDEX_FILE) and search cache into the shared track
+        index. The index is kept between syncs and only reloaded when syncing to a different drive, or when the file
+        has changed since it was loaded, so custom URLs added by the user are picked up.
+
+        :param drive: The DJ library drive to load the track index from.
+        """
+        index_path = os.path.join(drive, "id_to_video_map.json")
+        index_mtime = os.path.getmtime(index_path) if os.path.exists(index_path) else None
+        if drive == self.loaded_drive and index_mtime == self.loaded_mtime:
+            return
+
+        self.id_to_video_map.clear()
+        self.id_to_video_map.update(load_hashmap_from_json(drive))
+        self.video_to_file_map.clear()
+        self.video_to_file_map.update(load_hashmap_from_json(drive, VIDEO_INDEX_FILE))
+        self.search_cache.clear()
+        self.search_cache.update(load_hashmap_from_json(drive, SEARCH_CACHE_FILE))
+        self.loaded_drive = drive
+        self.loaded_mtime = index_mtime
+
+    def save_track_index(self) -> None:
+        """
+        Write the shared track index, video index and search cache back to the loaded drive. Workers save after
+        every track, so this only writes anything if a save was missed, such as when a sync is cancelled.
+        """
+        if self.loaded_drive is None:
+            return
+
+        with self.lock:
+            save_hashmap_to_json(dict(self.id_to_video_map), self.loaded_drive)
+            save_hashmap_to_json(dict(self.video_to_file_map), self.loaded_drive, VIDEO_INDEX_FILE)
+            save_hashmap_to_json(dict(self.search_cache), self.loaded_drive, SEARCH_CACHE_FILE)
+
+    def create_stage_limiters(self, stage_workers: dict[str, int]) -> dict[str, StageLimiter]:
+        """
+        Create the pipeline stage limiters, shared through the manager only if workers are separate processes.
+
+        :param stage_workers: The number of workers allowed in each stage.
+        """
+        return create_stage_limiters(stage_workers, self.manager if self.execution_mode == "process" else None)
+
+    def create_event(self):
+        """Create an event that the pool's workers can see."""
+        return self.manager.Event() if self.execution_mode == "process" else threading.Event()
+
+    def create_context(self, settings: dict, event_queue, stage_limiters: dict[str, StageLimiter],
+                       cancel_token: CancellationToken) -> WorkerContext:
+        """
+        Create the context shared by every track in a sync.
+
+        :param settings: The users settings.
+        :param event_queue: The events queue that handles logging.
+        :param stage_limiters: Limiters for the number of tracks in each pipeline stage.
+        :param cancel_token: Pauses and cancels the sync.
+        """
+        return WorkerContext(settings, self.lock, self.id_to_video_map, self.video_to_file_map, self.search_cache,
+                             event_queue, stage_limiters, cancel_token, self.transcode_executor)
+
+    def submit(self, track_data: dict, context: WorkerContext) -> Future:
+        """
+        Submit a track to be processed by the pool.
+
+        :param track_data: Track data from the Spotify API.
+        :param context: The state shared by every track in the sync.
+        :return: A future resolving to the downloaded track's file path.
+        """
+        return self.executor.submit(process_track, track_data, context)
+
+    def _shutdown_executors(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.transcode_executor:
+            self.transcode_executor.shutdown(wait=True, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        self._shutdown_executors()
@@ -1,17 +1,39 @@
 import logging
 import os
 import re
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
-import pytube.helpers
 import unicodedata
-from moviepy.audio.io.AudioFileClip import AudioFileClip
-from moviepy.video.io.VideoFileClip import VideoFileClip
-from pytubefix import Search, YouTube
-from pytubefix.exceptions import VideoUnavailable
 
+from candidate_ranking import VideoCandidate, parse_search_results
+from resumable_download import download_file
 from utils import LOGGER_NAME
 
+# moviepy picks the codec from the extension, so the temporary file still ends in .mp3
+TRANSCODE_TEMP_SUFFIX = ".transcoding.mp3"
+
+if TYPE_CHECKING:
+    from pytubefix import Stream, YouTube
+
+    from cancellation import CancellationToken
+
+
+class VideoNotFoundError(Exception):
+    """Raised when no YouTube video could be found for a track."""
+
+
+class NoAudioStreamError(Exception):
+    """Raised when a YouTube video has no audio stream to download."""
+
+
+class StreamRejectedError(Exception):
+    """Raised when a video's audio stream fails the pre-download checks, such as being far longer than the track."""
+
+
+# The highest audio bitrate YouTube serves in bits per second. Long tracks, such as continuous mixes, are allowed at least
+# this much audio, so the size limit never rejects every video for a track only because the track is long
+MAX_AUDIO_BITRATE = 320_000
+
 
 class YouTubeDownloadHelper:
     """
@@ -21,15 +43,25 @@ class YouTubeDownloadHelper:
     and download the highest quality audio stream available for that video.
     """
 
-    def __init__(self, root_dir: str, tracks_folder: str) -> None:
+    def __init__(self,
+                 root_dir: str,
+                 tracks_folder: str,
+                 max_duration_ratio: Optional[float] = None,
+                 max_file_size_mb: Optional[float] = None) -> None:
         """
         Initialize the YouTubeDownloadHelper.
 
         :param root_dir: The root directory where tracks will be stored.
         :param tracks_folder: The specific folder within root_dir for storing tracks.
+        :param max_duration_ratio: Reject videos more than this many times longer or shorter than the track. None to
+            not check the duration.
+        :param max_file_size_mb: Reject audio streams larger than this, raised for long tracks to what the track's length
+            needs at MAX_AUDIO_BITRATE. None to not check the size.
         """
         self.logger = logging.getLogger(LOGGER_NAME)
         self.track_dir = os.path.join(root_dir, tracks_folder)
+        self.max_duration_ratio = max_duration_ratio
+        self.max_file_size_mb = max_file_size_mb
 
     @staticmethod
     def _safe_filename(s: str, max_length: int = 255) -> str:
@@ -69,13 +101,15 @@ class YouTubeDownloadHelper:
         # Filter out non-ASCII characters
         return ''.join(c for c in normalized if unicodedata.category(c) != 'Mn' and ord(c) < 128)
 
-    def search_video(self, search_query: str) -> Optional[YouTube]:
+    def search_video(self, search_query: str) -> Optional['YouTube']:
         """
         Search YouTube with the given query and return the first video result.
 
         :param search_query: The query string to search on YouTube.
         :return: The first YouTube video object found or None if no results.
         """
+        from pytubefix import Search
+
         search = Search(search_query)
         if search_results := search.results:
             self.logger.debug(f"Search results for {search_query}: {search_results[0]}")
@@ -84,13 +118,50 @@ class YouTubeDownloadHelper:
             self.logger.warning(f"No search results for {search_query}")
             return None
 
-    def search_video_url(self, search_url: str) -> Optional[YouTube]:
+    def search_candidates(self, search_query: str, limit: int = 10) -> list[VideoCandidate]:
+        """
+        Search YouTube and read the top video results from the raw search response. Unlike search_video, this gets
+        each result's title, channel and duration from the single search request, so the results can be ranked
+        without loading every video.
+
+        :param search_query: The query string to search on YouTube.
+        :param limit: The most results to return.
+        :return: The video results in the order YouTube returned them, empty if there were none.
+        """
+        from pytubefix import Search
+
+        raw_results = Search(search_query).fetch_query()
+        try:
+            candidates = parse_search_results(raw_results, limit)
+        except (KeyError, IndexError, TypeError):
+            self.logger.warning(f"Unexpected search response format for {search_query}")
+            return []
+
+        if not candidates:
+            self.logger.warning(f"No search results for {search_query}")
+        return candidates
+
+    @staticmethod
+    def video_from_id(video_id: str) -> 'YouTube':
+        """
+        Create the YouTube video object for a video ID. The video isn't loaded until its streams are used.
+
+        :param video_id: The YouTube video ID.
+        """
+        from pytubefix import YouTube
+
+        return YouTube(f"https://www.youtube.com/watch?v={video_id}")
+
+    def search_video_url(self, search_url: str) -> Optional['YouTube']:
         """
         Search YouTube for the video corresponding to the given URL.
 
         :param search_url: The URL string of the YouTube video.
         :return: The YouTube video object if found, otherwise None.
         """
+        from pytubefix import YouTube
+        from pytubefix.exceptions import VideoUnavailable
+
         try:
             video = YouTube(search_url)
             self.logger.debug(f"Found video from URL: {video.title}")
@@ -99,34 +170,95 @@ class YouTubeDownloadHelper:
             self.logger.warning(f"Video unavailable for URL: {search_url}")
             return None
 
-    def download_audio(self, video: YouTube) -> str:
+    def download_audio(self, video: 'YouTube') -> str:
         """
-        Download the highest quality audio stream of the given YouTube video.
+        Download the highest quality audio stream of the given YouTube video and convert it to MP3.
 
         :param video: The YouTube video object from which to download audio.
-        :return: The file path of the downloaded audio, if available.
+        :return: The file path of the MP3 audio, if available.
         """
-        # Override this function to avoid Streams doing a file size check which will here always be different from raw
-        # file, I assume due to metadata (image including) on audio files.
-        def override_exists_at_path(file_path: str) -> bool:
-            mp3_file_path = os.path.splitext(file_path)[0] + '.mp3'
-            return os.path.isfile(mp3_file_path)
+        return self.convert_to_mp3(self.download_audio_stream(video))
+
+    def download_audio_stream(self,
+                              video: 'YouTube',
+                              expected_duration: Optional[float] = None,
+                              cancel_token: Optional['CancellationToken'] = None,
+                              file_name: Optional[str] = None) -> str:
+        """
+        Download the highest quality audio stream of the given YouTube video, without converting it.
+
+        The stream is checked against the duration and file size limits before anything is downloaded. The stream is
+        downloaded in chunks to a .part file, so an interrupted download picks up where it left off on the next
+        attempt, even after a restart, instead of starting over.
 
+        :param video: The YouTube video object from which to download audio.
+        :param expected_duration: The length of the track in seconds, used to reject videos of the wrong length.
+        :param cancel_token: Stops the download part way through if the sync is cancelled.
+        :param file_name: The file's path in the tracks folder without an extension, from the track layout. None to
+            name the file after the video.
+        :return: The file path of the downloaded audio.
+        :raises NoAudioStreamError: If the video has no audio stream.
+        :raises StreamRejectedError: If the stream fails the pre-download checks.
+        """
         audio_stream = video.streams.get_audio_only()
-        if audio_stream:
-            audio_stream.exists_at_path = override_exists_at_path
+        if not audio_stream:
+            self.logger.warning(f"No audio stream available for this video {video}")
+            raise NoAudioStreamError(f"No audio stream available for video {video.watch_url}")
+
+        self.check_stream(video, audio_stream, expected_duration)
+
+        if file_name:
+            file_path = os.path.join(self.track_dir, file_name + os.path.splitext(audio_stream.default_filename)[1])
+        else:
             file_name = self._remove_diacritics(audio_stream.default_filename)
             file_name = self._safe_filename(file_name)
-            file_path = audio_stream.download(filename=file_name, output_path=self.track_dir)
-            return self.convert_to_mp3(file_path)
-        else:
-            self.logger.warning(f"No audio stream available for this video {video}")
+            file_path = os.path.join(self.track_dir, file_name)
+
+        # Skip the download if it has already been converted, as the MP3 is all that's kept
+        if os.path.isfile(os.path.splitext(file_path)[0] + '.mp3'):
+            return file_path
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return download_file(audio_stream.url, file_path, audio_stream.filesize, cancel_token=cancel_token)
+
+    def check_stream(self, video: 'YouTube', audio_stream: 'Stream', expected_duration: Optional[float]) -> None:
+        """
+        Check an audio stream's duration and size before downloading it, using only the metadata that came with the
+        video's stream list.
+
+        :param video: The YouTube video the stream belongs to.
+        :param audio_stream: The audio stream to be downloaded.
+        :param expected_duration: The length of the track in seconds, or None to skip the duration check.
+        :raises StreamRejectedError: If the stream is the wrong length or too large.
+        """
+        video_duration = video.length
+        if self.max_duration_ratio and expected_duration and video_duration:
+            ratio = max(video_duration / expected_duration, expected_duration / video_duration)
+            if ratio > self.max_duration_ratio:
+                raise StreamRejectedError(f"Video {video.video_id} is {video_duration}s long but the track is "
+                                          f"{expected_duration:.0f}s")
+
+        if self.max_file_size_mb:
+            # The size comes from the stream list's contentLength. Streams without one are estimated from their
+            # bitrate rather than making a separate request for the size.
+            file_size = audio_stream._filesize
+            if not file_size and audio_stream.bitrate and video_duration:
+                file_size = video_duration * audio_stream.bitrate / 8
+            max_file_size = self.max_file_size_mb * 1024 * 1024
+            if expected_duration:
+                max_file_size = max(max_file_size, expected_duration * MAX_AUDIO_BITRATE / 8)
+            if file_size and file_size > max_file_size:
+                raise StreamRejectedError(f"Audio for video {video.video_id} is {file_size / (1024 * 1024):.0f}MB, "
+                                          f"over the {max_file_size / (1024 * 1024):.0f}MB limit")
 
     @staticmethod
     def convert_to_mp3(mp4_file: str) -> str:
         """
         Convert an MP4 file to MP3 format, delete the original MP4 file, and return the name of the MP3 file.
 
+        The MP3 is written to a temporary file and renamed once complete, as an existing MP3 is taken to be a finished
+        conversion, and one cut short by a crash or shutdown would otherwise never be redone.
+
         :param mp4_file: The path to the MP4 file.
         :return: The path of the created MP3 file.
         """
@@ -135,9 +267,18 @@ class YouTubeDownloadHelper:
         if os.path.isfile(mp3_file):
             return mp3_file
 
-        video_clip = AudioFileClip(mp4_file)
-        video_clip.write_audiofile(mp3_file)
-        video_clip.close()
+        # Imported here as moviepy pulls in numpy, imageio and proglog, which only the transcode step needs
+        from moviepy.audio.io.AudioFileClip import AudioFileClip
+
+        temp_mp3_file = os.path.splitext(mp4_file)[0] + TRANSCODE_TEMP_SUFFIX
+        try:
+            video_clip = AudioFileClip(mp4_file)
+            video_clip.write_audiofile(temp_mp3_file)
+            video_clip.close()
+            os.replace(temp_mp3_file, mp3_file)
+        finally:
+            if os.path.exists(temp_mp3_file):
+                os.remove(temp_mp3_file)
 
         # Delete the original MP4 file
         os.remove(mp4_file)
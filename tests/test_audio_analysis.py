@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from mutagen.id3 import ID3, TIT2
+
+from audio_analysis import (TrackAnalysis, integrated_loudness, estimate_tempo, analyse_samples, add_analysis_frames,
+                            has_analysis, SAMPLE_RATE)
+
+
+def create_sine(amplitude, seconds=10, frequency=1000):
+    time = np.arange(SAMPLE_RATE * seconds) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * time)).astype(np.float32)
+
+
+def create_beat(bpm, seconds=20):
+    """A short burst of decaying noise on every beat, over quiet noise."""
+    rng = np.random.default_rng(0)
+    signal = 0.01 * rng.standard_normal(SAMPLE_RATE * seconds).astype(np.float32)
+    burst_length = int(0.03 * SAMPLE_RATE)
+    burst = rng.standard_normal(burst_length).astype(np.float32) * np.exp(-np.arange(burst_length) / 400)
+    for beat_time in np.arange(0, seconds - 0.05, 60 / bpm):
+        start = int(beat_time * SAMPLE_RATE)
+        signal[start:start + burst_length] += burst
+    return signal
+
+
+class TestLoudness(unittest.TestCase):
+    def test_sine_loudness(self):
+        # BS.1770 gives a full scale 1kHz sine in one channel -3.01 LUFS, and each channel adds its power
+        sine = create_sine(0.1)
+
+        self.assertAlmostEqual(-23.01, integrated_loudness(sine[:, None]), delta=0.1)
+        self.assertAlmostEqual(-20.0, integrated_loudness(np.stack([sine, sine], axis=1)), delta=0.1)
+
+    def test_silence_is_gated(self):
+        samples = np.zeros((SAMPLE_RATE * 5, 2), dtype=np.float32)
+
+        self.assertEqual(float("-inf"), integrated_loudness(samples))
+
+    def test_quiet_passages_are_gated(self):
+        loud = create_sine(0.1)
+        quiet = create_sine(0.0001)
+
+        self.assertAlmostEqual(-23.01, integrated_loudness(np.concatenate([loud, quiet])[:, None]), delta=0.1)
+
+
+class TestTempo(unittest.TestCase):
+    def test_estimates_tempo(self):
+        for bpm in (90, 128, 140, 174):
+            with self.subTest(bpm=bpm):
+                self.assertAlmostEqual(bpm, estimate_tempo(create_beat(bpm)), delta=1)
+
+    def test_no_beat(self):
+        noise = np.random.default_rng(1).standard_normal(SAMPLE_RATE * 20).astype(np.float32)
+
+        self.assertIsNone(estimate_tempo(noise))
+
+    def test_too_short(self):
+        self.assertIsNone(estimate_tempo(create_beat(128, seconds=1)))
+
+    def test_analyse_samples(self):
+        beat = create_beat(128)
+        analysis = analyse_samples(np.stack([beat, beat], axis=1))
+
+        self.assertAlmostEqual(128, analysis.bpm, delta=1)
+        self.assertAlmostEqual(-18 - analysis.loudness, analysis.replay_gain, delta=0.01)
+        self.assertAlmostEqual(float(np.abs(beat).max()), analysis.peak, places=5)
+
+
+class TestAnalysisTags(unittest.TestCase):
+    def test_frames(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "track.mp3")
+            tags = ID3()
+            tags["TIT2"] = TIT2(encoding=3, text="Solar System")
+            tags.save(file_path)
+            self.assertFalse(has_analysis(file_path))
+
+            tags = ID3(file_path)
+            add_analysis_frames(tags, TrackAnalysis(127.6, -9.5, -8.5, 0.98))
+            tags.save(file_path)
+
+            tags = ID3(file_path)
+            self.assertEqual("128", str(tags["TBPM"]))
+            self.assertEqual("-8.50 dB", str(tags["TXXX:REPLAYGAIN_TRACK_GAIN"]))
+            self.assertEqual("0.980000", str(tags["TXXX:REPLAYGAIN_TRACK_PEAK"]))
+            self.assertEqual("Solar System", str(tags["TIT2"]))
+            self.assertTrue(has_analysis(file_path))
+
+    def test_no_bpm_frame_without_tempo(self):
+        tags = ID3()
+        add_analysis_frames(tags, TrackAnalysis(None, -9.5, -8.5, 0.98))
+
+        self.assertNotIn("TBPM", tags)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from batch_sync import BatchSync, load_profiles
+from cancellation import CancellationToken
+from settings import Settings
+
+
+class TestBatchSync(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_drive = os.path.join(self.temp_dir.name, "cache")
+        self.profiles = {
+            "alice": Settings({"dj_library_drive": os.path.join(self.temp_dir.name, "alice"), "tracks_folder": "Tracks",
+                               "playlists_to_download": {"House": "house"}}),
+            "bob": Settings({"dj_library_drive": os.path.join(self.temp_dir.name, "bob"), "tracks_folder": "Music",
+                             "spotify_token_cache": ".cache-bob-account", "mirror_link_mode": "copy"}),
+        }
+        self.synced = {"alice": ["Tracks/a.mp3", "Tracks/b.mp3"], "bob": ["Tracks/b.mp3", "Tracks/c.mp3"]}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_batch(self, **kwargs):
+        return BatchSync(self.profiles, self.cache_drive, MagicMock(),
+                         cancel_token=CancellationToken(threading.Event(), threading.Event()), **kwargs)
+
+    def test_profile_settings(self):
+        batch = self.create_batch(link_mode="hardlink")
+        settings = batch.profile_settings("bob", self.profiles["bob"])
+
+        self.assertEqual(self.cache_drive, settings.dj_library_drive)
+        self.assertEqual([self.profiles["bob"].dj_library_drive], settings.mirror_drives)
+        self.assertEqual("Tracks", settings.tracks_folder)
+        self.assertEqual("hardlink", settings.mirror_link_mode)
+        self.assertEqual(".cache-bob-account", settings.spotify_token_cache)
+        self.assertEqual(".cache-alice", batch.profile_settings("alice", self.profiles["alice"]).spotify_token_cache)
+        # The profile's own settings are left alone
+        self.assertEqual("Music", self.profiles["bob"].tracks_folder)
+        self.assertEqual("copy", self.profiles["bob"].mirror_link_mode)
+
+    def test_profile_on_cache_drive(self):
+        self.profiles["bob"].update_setting("dj_library_drive", self.cache_drive)
+
+        with self.assertRaises(ValueError):
+            self.create_batch().run()
+
+    @patch("batch_sync.create_manager")
+    @patch("batch_sync.WorkerPool")
+    @patch("batch_sync.PySyncDJDownload")
+    def test_syncs_every_profile_through_one_pool(self, mock_download, mock_worker_pool, _):
+        mock_download.side_effect = lambda *args, settings, **kwargs: MagicMock(
+            synced_playlists=[("Playlist", self.synced[os.path.basename(settings.mirror_drives[0])])])
+        batch = self.create_batch()
+
+        batch.run()
+
+        self.assertEqual(2, mock_download.call_count)
+        for call in mock_download.call_args_list:
+            self.assertIs(mock_worker_pool.return_value, call.args[2])
+            self.assertFalse(call.kwargs["save_main_libraries"])
+        mock_worker_pool.return_value.shutdown.assert_called_once()
+        self.assertTrue(os.path.isdir(self.cache_drive))
+        self.assertIn("Synced 4 tracks to 2 profiles from 3 tracks", batch.report())
+
+    @patch("batch_sync.create_manager")
+    @patch("batch_sync.WorkerPool")
+    @patch("batch_sync.PySyncDJDownload")
+    def test_cancel_skips_remaining_profiles(self, mock_download, _, __):
+        batch = self.create_batch()
+        mock_download.side_effect = lambda *args, **kwargs: (batch.cancel_token.cancel(),
+                                                             MagicMock(synced_playlists=[]))[1]
+
+        batch.run()
+
+        self.assertEqual(1, mock_download.call_count)
+
+    def test_load_profiles(self):
+        file_paths = []
+        for name in ("alice", "bob"):
+            file_paths.append(os.path.join(self.temp_dir.name, f"{name}.yaml"))
+            with open(file_paths[-1], "w") as file:
+                file.write(f"dj_library_drive: {name}\n")
+
+        profiles = load_profiles(file_paths)
+
+        self.assertEqual(["alice", "bob"], list(profiles))
+        self.assertEqual("bob", profiles["bob"].dj_library_drive)
+        with self.assertRaises(ValueError):
+            load_profiles(file_paths + file_paths[:1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest
+
+from cancellation import CancellationToken, SyncCancelled
+
+
+def create_token():
+    return CancellationToken(threading.Event(), threading.Event())
+
+
+class TestCancellationToken(unittest.TestCase):
+    def test_check(self):
+        token = create_token()
+        token.check()
+
+        token.cancel()
+
+        self.assertTrue(token.cancelled)
+        with self.assertRaises(SyncCancelled):
+            token.check()
+
+    def test_cancel_clears_pause(self):
+        token = create_token()
+        token.pause()
+
+        token.cancel()
+
+        self.assertFalse(token.paused)
+
+    def test_wait_if_paused_blocks_until_resumed(self):
+        token = create_token()
+        token.pause()
+        threading.Timer(0.1, token.resume).start()
+
+        start = time.monotonic()
+        token.wait_if_paused(poll_interval=0.01)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_wait_if_paused_raises_when_cancelled(self):
+        token = create_token()
+        token.pause()
+        threading.Timer(0.05, token.cancel).start()
+
+        with self.assertRaises(SyncCancelled):
+            token.wait_if_paused(poll_interval=0.01)
+
+    def test_reset(self):
+        token = create_token()
+        token.pause()
+        token.cancel()
+
+        token.reset()
+
+        self.assertFalse(token.paused)
+        self.assertFalse(token.cancelled)
@@ -0,0 +1,90 @@
+import unittest
+
+from candidate_ranking import (TrackQuery, VideoCandidate, normalize_text, parse_duration, parse_search_results,
+                               rank_candidates)
+
+
+def create_track(name="Solar System", artist="Sub Focus", duration_ms=215000):
+    return {"track": {"id": "track1", "name": name, "artists": [{"name": artist}], "duration_ms": duration_ms}}
+
+
+def create_video_renderer(video_id, title, channel, length, badge_style=None):
+    video = {"videoId": video_id,
+             "title": {"runs": [{"text": title}]},
+             "ownerText": {"runs": [{"text": channel}]},
+             "lengthText": {"simpleText": length}}
+    if badge_style:
+        video["ownerBadges"] = [{"metadataBadgeRenderer": {"style": badge_style}}]
+    return {"videoRenderer": video}
+
+
+def create_search_response(items):
+    return {"contents": {"twoColumnSearchResultsRenderer": {"primaryContents": {"sectionListRenderer": {
+        "contents": [{"itemSectionRenderer": {"contents": items}},
+                     {"continuationItemRenderer": {}}]}}}}}
+
+
+class TestParsing(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(225, parse_duration("3:45"))
+        self.assertEqual(3723, parse_duration("1:02:03"))
+        self.assertIsNone(parse_duration("LIVE"))
+
+    def test_normalize_text(self):
+        self.assertEqual("beyonce halo official video", normalize_text("Beyoncé - Halo (Official Video)"))
+
+    def test_parse_search_results(self):
+        response = create_search_response([
+            {"shelfRenderer": {}},
+            create_video_renderer("video1", "Sub Focus - Solar System", "Sub Focus", "3:35",
+                                  "BADGE_STYLE_TYPE_VERIFIED_ARTIST"),
+            {"playlistRenderer": {"playlistId": "playlist1"}},
+            create_video_renderer("video2", "Solar System (Live)", "Festival", "6:10"),
+            create_video_renderer("video3", "Solar System", "Someone", "3:30"),
+        ])
+
+        candidates = parse_search_results(response, limit=2)
+
+        self.assertEqual([VideoCandidate("video1", "Sub Focus - Solar System", "Sub Focus", 215, 0, True),
+                          VideoCandidate("video2", "Solar System (Live)", "Festival", 370, 1, False)], candidates)
+
+
+class TestRankCandidates(unittest.TestCase):
+    def setUp(self):
+        self.query = TrackQuery.from_track(create_track())
+
+    def best(self, candidates):
+        return rank_candidates(self.query, candidates)[0][1].video_id
+
+    def test_track_query(self):
+        self.assertEqual(TrackQuery("Sub Focus - Solar System", "sub focus", "solar system", 215), self.query)
+
+    def test_prefers_matching_duration_over_first_result(self):
+        self.assertEqual("track", self.best([
+            VideoCandidate("mix", "Sub Focus - Solar System", "Mixes", 3600, 0),
+            VideoCandidate("track", "Sub Focus - Solar System", "Mixes", 214, 1),
+        ]))
+
+    def test_penalizes_negative_keywords(self):
+        self.assertEqual("studio", self.best([
+            VideoCandidate("live", "Sub Focus - Solar System (Live at Glastonbury)", "Sub Focus", 220, 0),
+            VideoCandidate("lyrics", "Sub Focus - Solar System (Lyrics)", "Lyric Channel", 215, 1),
+            VideoCandidate("studio", "Solar System", "Sub Focus - Topic", 216, 2),
+        ]))
+
+    def test_keyword_in_spotify_name_not_penalized(self):
+        self.query = TrackQuery.from_track(create_track(name="Solar System - Live"))
+
+        self.assertEqual("live", self.best([
+            VideoCandidate("studio", "Sub Focus - Solar System", "Sub Focus", 215, 0),
+            VideoCandidate("live", "Sub Focus - Solar System (Live)", "Sub Focus", 215, 1),
+        ]))
+
+    def test_prefers_title_match(self):
+        self.assertEqual("match", self.best([
+            VideoCandidate("other", "Sub Focus - Out The Blue", "Sub Focus", 215, 0),
+            VideoCandidate("match", "Sub Focus - Solar System", "Uploader", 215, 1),
+        ]))
+
+    def test_empty(self):
+        self.assertEqual([], rank_candidates(self.query, []))
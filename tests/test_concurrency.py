@@ -0,0 +1,111 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from concurrency import StageLimiter, AdaptiveConcurrency, is_throttle_error
+
+
+def create_limiter(limit):
+    return StageLimiter.create_local(limit)
+
+
+class BotDetection(Exception):
+    pass
+
+
+class TestStageLimiter(unittest.TestCase):
+    def test_limits_concurrent_workers(self):
+        limiter = create_limiter(2)
+        active = []
+        max_active = []
+
+        def work():
+            with limiter:
+                active.append(1)
+                max_active.append(len(active))
+                time.sleep(0.05)
+                active.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(2, max(max_active))
+
+    def test_raising_limit_releases_waiting_workers(self):
+        limiter = create_limiter(0)
+        finished = threading.Event()
+
+        def work():
+            with limiter:
+                finished.set()
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        self.assertFalse(finished.wait(0.1))
+
+        limiter.set_limit(1)
+        self.assertTrue(finished.wait(1))
+        thread.join()
+
+
+class TestIsThrottleError(unittest.TestCase):
+    def test_throttle_error_by_name(self):
+        self.assertTrue(is_throttle_error(BotDetection("video")))
+
+    def test_throttle_error_by_message(self):
+        self.assertTrue(is_throttle_error(Exception("HTTP Error 429: Too Many Requests")))
+
+    def test_other_error(self):
+        self.assertFalse(is_throttle_error(Exception("Video unavailable")))
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.limiter = create_limiter(2)
+        self.controller = AdaptiveConcurrency([self.limiter], MagicMock(), min_workers=1, max_workers=4)
+
+    def test_additive_increase_after_successful_window(self):
+        self.controller.record_success()
+        self.controller.record_success()
+        self.assertEqual(3, self.limiter.limit)
+
+    def test_increase_capped_at_max_workers(self):
+        for _ in range(20):
+            self.controller.record_success()
+        self.assertEqual(4, self.limiter.limit)
+
+    def test_multiplicative_decrease_on_throttle(self):
+        for _ in range(5):
+            self.controller.record_success()
+        self.assertEqual(4, self.limiter.limit)
+
+        self.controller.record_failure(BotDetection("video"))
+        self.assertEqual(2, self.limiter.limit)
+
+    def test_decrease_cooldown(self):
+        self.limiter.set_limit(4)
+        controller = AdaptiveConcurrency([self.limiter], MagicMock(), max_workers=4)
+        controller.record_failure(BotDetection("video"))
+        controller.record_failure(BotDetection("video"))
+        self.assertEqual(2, self.limiter.limit)
+
+    def test_decrease_when_most_of_window_fails(self):
+        self.controller.record_failure(Exception("Video unavailable"))
+        self.controller.record_failure(Exception("Video unavailable"))
+        self.assertEqual(1, self.limiter.limit)
+
+    def test_no_increase_when_throughput_drops(self):
+        with patch("concurrency.time.monotonic", side_effect=[0, 1, 1, 11, 11]):
+            controller = AdaptiveConcurrency([self.limiter], MagicMock(), max_workers=8)
+            controller.record_success()
+            controller.record_success()  # 2 tracks in 1 second
+            self.assertEqual(3, self.limiter.limit)
+
+            controller.record_success()
+            controller.record_success()
+            controller.record_success()  # 3 tracks in 10 seconds
+            self.assertEqual(3, self.limiter.limit)
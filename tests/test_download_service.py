@@ -0,0 +1,86 @@
+import queue
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cancellation import CancellationToken
+from download_service import DownloadService, run_download_service
+
+
+class TestRunDownloadService(unittest.TestCase):
+    def setUp(self):
+        self.command_queue = queue.Queue()
+        self.event_queue = queue.Queue()
+        self.cancel_token = CancellationToken(threading.Event(), threading.Event())
+
+    def run_service(self, mock_download):
+        with patch("download_service.ignore_keyboard_interrupt"), \
+                patch("download_service.create_manager") as mock_create_manager, \
+                patch("worker_pool.WorkerPool") as mock_worker_pool, \
+                patch("pysync_dj_download.PySyncDJDownload", mock_download):
+            run_download_service(self.command_queue, self.event_queue, self.cancel_token)
+        return mock_worker_pool.return_value, mock_create_manager.return_value
+
+    def test_reuses_warm_pool_across_syncs(self):
+        mock_download = MagicMock()
+        for command in (("sync", "E:\\"), ("sync", "F:\\"), ("shutdown", None)):
+            self.command_queue.put(command)
+
+        worker_pool, manager = self.run_service(mock_download)
+
+        worker_pool.warm_up.assert_called_once()
+        self.assertEqual([("E:\\", self.event_queue, worker_pool, self.cancel_token),
+                          ("F:\\", self.event_queue, worker_pool, self.cancel_token)],
+                         [call.args for call in mock_download.call_args_list])
+        worker_pool.shutdown.assert_called_once()
+        manager.shutdown.assert_called_once()
+
+    def test_failed_sync_keeps_service_running(self):
+        mock_download = MagicMock(side_effect=[RuntimeError("sync failed"), None])
+        for command in (("sync", "E:\\"), ("sync", "E:\\"), ("shutdown", None)):
+            self.command_queue.put(command)
+
+        worker_pool, _ = self.run_service(mock_download)
+
+        self.assertEqual(2, mock_download.call_count)
+        events = [self.event_queue.get() for _ in range(self.event_queue.qsize())]
+        self.assertIn(("enable_download_button", None), events)
+        worker_pool.shutdown.assert_called_once()
+
+
+class TestDownloadService(unittest.TestCase):
+    def setUp(self):
+        manager = MagicMock()
+        manager.Queue.return_value = queue.Queue()
+        manager.Event.side_effect = threading.Event
+        with patch("download_service.multiprocessing.Process") as mock_process:
+            self.service = DownloadService(manager, queue.Queue())
+        self.process = mock_process.return_value
+
+    def test_sync_resets_cancel(self):
+        self.service.cancel()
+        self.service.sync("E:\\")
+
+        self.assertFalse(self.service.cancel_token.cancelled)
+        self.assertEqual(("sync", "E:\\"), self.service.command_queue.get_nowait())
+
+    def test_shutdown(self):
+        self.process.is_alive.return_value = False
+
+        self.service.shutdown(timeout=1)
+
+        self.assertTrue(self.service.cancel_token.cancelled)
+        self.assertEqual(("shutdown", None), self.service.command_queue.get_nowait())
+        self.process.join.assert_called_once_with(1)
+        self.process.terminate.assert_not_called()
+
+    def test_shutdown_terminates_stuck_process(self):
+        self.process.is_alive.return_value = True
+
+        self.service.shutdown(timeout=1)
+
+        self.process.terminate.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
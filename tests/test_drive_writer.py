@@ -0,0 +1,191 @@
+import errno
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from drive_writer import DriveSpace, DriveWriter, DriveFanOut, COPY_TEMP_SUFFIX
+
+
+class TestDriveSpace(unittest.TestCase):
+    def test_reserves_until_min_free_space(self):
+        drive_space = DriveSpace(".", min_free_space_mb=1)
+
+        with patch.object(DriveSpace, "free_space", return_value=4 * 1024 * 1024):
+            self.assertTrue(drive_space.reserve(1024 * 1024))
+            self.assertTrue(drive_space.reserve(1024 * 1024))
+            self.assertFalse(drive_space.reserve(1024 * 1024.5))
+
+        self.assertTrue(drive_space.full)
+        self.assertEqual(2 * 1024 * 1024, drive_space.reserved)
+
+    def test_release(self):
+        drive_space = DriveSpace(".", min_free_space_mb=0)
+
+        with patch.object(DriveSpace, "free_space", return_value=100):
+            drive_space.reserve(60)
+            drive_space.release(60)
+            self.assertTrue(drive_space.reserve(60))
+
+    def test_cached_tracks_need_no_space(self):
+        drive_space = DriveSpace(".", min_free_space_mb=0)
+
+        with patch.object(DriveSpace, "free_space", return_value=0):
+            self.assertTrue(drive_space.reserve(0))
+            drive_space.mark_full()
+            self.assertTrue(drive_space.reserve(0))
+
+
+class TestDriveWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.staging_dir = os.path.join(self.temp_dir.name, "staging")
+        self.drive = os.path.join(self.temp_dir.name, "drive")
+        self.drive_space = DriveSpace(self.temp_dir.name, min_free_space_mb=0)
+        self.writer = DriveWriter(self.staging_dir, self.drive, self.drive_space, MagicMock())
+
+    def tearDown(self):
+        self.writer.executor.shutdown()
+        self.temp_dir.cleanup()
+
+    def stage_track(self, name):
+        staged_path = os.path.join(self.staging_dir, "Tracks", name)
+        os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+        with open(staged_path, "wb") as f:
+            f.write(b"audio")
+        return os.path.join(self.drive, "Tracks", name)
+
+    def test_moves_staged_track(self):
+        file_path = self.stage_track("track.mp3")
+        self.drive_space.reserved = 10
+
+        self.writer.submit(file_path, 10).result()
+
+        with open(file_path, "rb") as f:
+            self.assertEqual(b"audio", f.read())
+        self.assertFalse(os.path.exists(self.writer.staged_path(file_path)))
+        self.assertEqual(0, self.drive_space.reserved)
+
+    def test_track_already_on_drive_not_moved(self):
+        self.drive_space.reserved = 10
+
+        self.assertIsNone(self.writer.submit(os.path.join(self.drive, "Tracks", "track.mp3"), 10))
+        self.assertEqual(0, self.drive_space.reserved)
+
+    def test_drive_full_keeps_staged_track(self):
+        file_path = self.stage_track("track.mp3")
+
+        with patch("drive_writer.shutil.copyfile", side_effect=OSError(errno.ENOSPC, "No space left on device")):
+            self.assertFalse(self.writer.move(self.writer.staged_path(file_path), file_path))
+
+        self.assertTrue(self.drive_space.full)
+        self.assertTrue(os.path.exists(self.writer.staged_path(file_path)))
+        self.assertFalse(os.path.exists(file_path + COPY_TEMP_SUFFIX))
+
+
+class TestDriveFanOut(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.staging_dir = os.path.join(self.temp_dir.name, "staging")
+        self.drive = os.path.join(self.temp_dir.name, "drive")
+        self.mirror_drives = [os.path.join(self.temp_dir.name, name) for name in ("mirror1", "mirror2")]
+        self.drive_space = DriveSpace(self.temp_dir.name, min_free_space_mb=0)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_fan_out(self, staging=True, mirror_free_space=None, link=False):
+        source = self.staging_dir if staging else self.drive
+        drive_writer = DriveWriter(self.staging_dir, self.drive, self.drive_space, MagicMock(),
+                                   keep_source=True) if staging else None
+        mirror_writers = []
+        for mirror_drive in self.mirror_drives:
+            mirror_space = DriveSpace(self.temp_dir.name, min_free_space_mb=0)
+            if mirror_free_space is not None:
+                mirror_space.free_space = MagicMock(return_value=mirror_free_space)
+            mirror_writers.append(DriveWriter(source, mirror_drive, mirror_space, MagicMock(),
+                                              library_drive=self.drive, keep_source=True, link=link))
+        return DriveFanOut(drive_writer, mirror_writers, self.drive_space)
+
+    def write_track(self, root, name, data=b"audio"):
+        file_path = os.path.join(root, "Tracks", name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(data)
+        return file_path
+
+    def read(self, file_path):
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    def test_writes_staged_track_to_every_drive(self):
+        fan_out = self.create_fan_out()
+        staged_path = self.write_track(self.staging_dir, "track.mp3")
+        file_path = os.path.join(self.drive, "Tracks", "track.mp3")
+
+        self.assertEqual(3, len(fan_out.submit(file_path)))
+        fan_out.shutdown()
+
+        for drive in [self.drive] + self.mirror_drives:
+            self.assertEqual(b"audio", self.read(os.path.join(drive, "Tracks", "track.mp3")))
+        self.assertFalse(os.path.exists(staged_path))
+
+    def test_copies_from_main_drive_without_staging(self):
+        fan_out = self.create_fan_out(staging=False)
+        file_path = self.write_track(self.drive, "track.mp3")
+
+        fan_out.submit(file_path)
+        fan_out.shutdown()
+
+        for drive in self.mirror_drives:
+            self.assertEqual(b"audio", self.read(os.path.join(drive, "Tracks", "track.mp3")))
+        self.assertTrue(os.path.exists(file_path))
+
+    def test_hardlinks_to_mirrors(self):
+        fan_out = self.create_fan_out(staging=False, link=True)
+        file_path = self.write_track(self.drive, "track.mp3")
+
+        fan_out.submit(file_path)
+        fan_out.shutdown()
+
+        for writer in fan_out.mirror_writers:
+            self.assertTrue(os.path.samefile(file_path, writer.target_path(file_path)))
+            self.assertEqual((1, 0), (writer.linked_tracks, writer.moved_bytes))
+
+    def test_hardlink_falls_back_to_copy(self):
+        fan_out = self.create_fan_out(staging=False, link=True)
+        file_path = self.write_track(self.drive, "track.mp3")
+
+        with patch("drive_writer.os.link", side_effect=OSError(errno.EXDEV, "Invalid cross-device link")):
+            fan_out.submit(file_path)
+            fan_out.shutdown()
+
+        for drive in self.mirror_drives:
+            mirror_path = os.path.join(drive, "Tracks", "track.mp3")
+            self.assertEqual(b"audio", self.read(mirror_path))
+            self.assertFalse(os.path.samefile(file_path, mirror_path))
+
+    def test_skips_tracks_already_on_mirror(self):
+        fan_out = self.create_fan_out(staging=False)
+        file_path = self.write_track(self.drive, "track.mp3")
+        for drive in self.mirror_drives:
+            self.write_track(drive, "track.mp3")
+
+        self.assertEqual([], fan_out.submit(file_path))
+        fan_out.shutdown()
+
+    def test_full_mirror_is_skipped(self):
+        fan_out = self.create_fan_out(mirror_free_space=0)
+        staged_path = self.write_track(self.staging_dir, "track.mp3")
+
+        self.assertEqual(1, len(fan_out.submit(os.path.join(self.drive, "Tracks", "track.mp3"))))
+        fan_out.shutdown()
+
+        self.assertTrue(all(writer.drive_space.full for writer in fan_out.mirror_writers))
+        self.assertEqual([1, 1], [writer.skipped_tracks for writer in fan_out.mirror_writers])
+        self.assertTrue(os.path.exists(os.path.join(self.drive, "Tracks", "track.mp3")))
+        self.assertFalse(os.path.exists(staged_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
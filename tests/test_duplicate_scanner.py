@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import unittest
+
+from mutagen.id3 import ID3, TIT2, TSRC, TXXX
+
+import parse_serato_crates
+from dj_libraries.serato_database import SeratoDatabase
+from duplicate_scanner import DuplicateScanner, audio_hash
+from utils import VIDEO_ID_TAG
+
+AUDIO = b"\xff\xfb\x90\x00" + bytes(range(256)) * 64
+OTHER_AUDIO = b"\xff\xfb\x90\x00" + bytes(reversed(range(256))) * 64
+
+
+class TestDuplicateScanner(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.drive = self.temp_dir.name
+        self.track_dir = os.path.join(self.drive, "tracks")
+        os.makedirs(self.track_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_track(self, name, audio, title, isrc=None, video_id=None):
+        file_path = os.path.join(self.track_dir, name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as file:
+            file.write(audio)
+
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=title))
+        if isrc:
+            tags.add(TSRC(encoding=3, text=isrc))
+        if video_id:
+            tags.add(TXXX(encoding=3, desc=VIDEO_ID_TAG, text=video_id))
+        tags.save(file_path)
+        return os.path.normcase(os.path.normpath(file_path))
+
+    def write_index(self, index, file_name="id_to_video_map.json"):
+        with open(os.path.join(self.drive, file_name), "w") as file:
+            json.dump(index, file)
+
+    def test_audio_hash_ignores_tags(self):
+        single = self.create_track("single.mp3", AUDIO, "Solar System")
+        album = self.create_track("album.mp3", AUDIO, "Solar System (Album Version)", isrc="GB0000000001")
+
+        self.assertNotEqual(os.path.getsize(single), os.path.getsize(album))
+        self.assertEqual(audio_hash(single), audio_hash(album))
+
+    def test_finds_duplicates_by_each_method(self):
+        self.create_track("a.mp3", AUDIO, "A", isrc="GB0000000001")
+        self.create_track("b.mp3", OTHER_AUDIO, "B", isrc="GB0000000001")
+        self.create_track("c.mp3", OTHER_AUDIO, "C", video_id="video1")
+        self.create_track("d.mp3", AUDIO, "D", video_id="video1")
+        self.create_track("e.mp3", AUDIO + b"\x00", "E")
+
+        scanner = DuplicateScanner(self.drive, "tracks")
+
+        self.assertEqual(1, len(scanner.scan(("isrc",))))
+        self.assertEqual(1, len(scanner.scan(("video_id",))))
+        audio_groups = scanner.scan(("audio_hash",))
+        self.assertEqual(2, len(audio_groups))
+
+        # Matches by different methods join into one group
+        groups = scanner.scan()
+        self.assertEqual(1, len(groups))
+        self.assertEqual(3, len(groups[0].duplicates))
+        self.assertEqual({"isrc", "video_id", "audio_hash"}, groups[0].matched_by)
+
+    def test_scans_sharded_layout(self):
+        first = self.create_track(os.path.join("3f", "Artist - Track [track1].mp3"), AUDIO, "Track")
+        second = self.create_track(os.path.join("a0", "Artist - Track [track2].mp3"), AUDIO, "Track")
+        self.create_track(os.path.join("a0", "Other - Track [track3].mp3"), OTHER_AUDIO, "Other")
+
+        scanner = DuplicateScanner(self.drive, "tracks")
+
+        self.assertEqual(3, len(scanner.list_tracks()))
+        groups = scanner.scan(("audio_hash",))
+        self.assertEqual(1, len(groups))
+        self.assertEqual({first, second}, {groups[0].keep, *groups[0].duplicates})
+
+    def test_dry_run_changes_nothing(self):
+        self.create_track("a.mp3", AUDIO, "A")
+        duplicate = self.create_track("b.mp3", AUDIO, "B")
+
+        scanner = DuplicateScanner(self.drive, "tracks")
+        reclaimed_bytes = scanner.reclaim(scanner.scan())
+
+        self.assertEqual(os.path.getsize(duplicate), reclaimed_bytes)
+        self.assertTrue(os.path.exists(duplicate))
+
+    def test_reclaim_keeps_most_referenced_file_and_repoints_index(self):
+        single = self.create_track("single.mp3", AUDIO, "Single")
+        album = self.create_track("album.mp3", AUDIO, "Album")
+        self.write_index({"spotify1": single, "spotify2": album, "spotify3": album})
+        self.write_index({"video1": single}, "video_id_map.json")
+
+        scanner = DuplicateScanner(self.drive, "tracks")
+        groups = scanner.scan()
+        self.assertEqual(album, groups[0].keep)
+
+        scanner.reclaim(groups, dry_run=False)
+
+        self.assertFalse(os.path.exists(single))
+        self.assertTrue(os.path.exists(album))
+        with open(os.path.join(self.drive, "id_to_video_map.json")) as file:
+            id_to_video_map = json.load(file)
+        with open(os.path.join(self.drive, "video_id_map.json")) as file:
+            video_to_file_map = json.load(file)
+        self.assertEqual({album}, {self.normalize(path) for path in id_to_video_map.values()})
+        self.assertEqual(album, self.normalize(video_to_file_map["video1"]))
+
+    def test_reclaim_repoints_crates_and_playlists(self):
+        keep = self.create_track("album.mp3", AUDIO, "Album")
+        duplicate = self.create_track("single.mp3", AUDIO, "Single")
+        other = self.create_track("other.mp3", OTHER_AUDIO, "Other")
+        self.write_index({"spotify1": keep, "spotify2": keep, "spotify3": duplicate})
+
+        subcrate_dir = os.path.join(self.drive, "_Serato_", "Subcrates")
+        os.makedirs(subcrate_dir)
+        crate_path = os.path.join(subcrate_dir, "Playlist.crate")
+        with open(crate_path, "wb") as file:
+            file.write(parse_serato_crates.encode_struct(
+                [("otrk", [("ptrk", os.path.splitdrive(path)[1])]) for path in (duplicate, other)]))
+        serato_database = SeratoDatabase(self.drive, os.path.join("_Serato_", "Subcrates"))
+        serato_database.entries += [("otrk", [("pfil", serato_database.serato_path(path))])
+                                    for path in (keep, duplicate, other)]
+        serato_database.save()
+        rekordbox_dir = os.path.join(self.drive, "rekordbox")
+        os.makedirs(rekordbox_dir)
+        playlist_path = os.path.join(rekordbox_dir, "Playlist.m3u")
+        with open(playlist_path, "w") as file:
+            file.write(f"{duplicate}\n{other}\n")
+
+        scanner = DuplicateScanner(self.drive, "tracks", os.path.join("_Serato_", "Subcrates"), "rekordbox")
+        scanner.reclaim(scanner.scan(), dry_run=False)
+
+        with open(crate_path, "rb") as file:
+            crate = parse_serato_crates.decode_struct(file.read())
+        self.assertEqual([keep, other], [self.normalize(fields[0][1]) for tag, fields in crate if tag == "otrk"])
+        serato_database = SeratoDatabase(self.drive, os.path.join("_Serato_", "Subcrates"))
+        self.assertEqual([keep, other], [os.path.normcase(os.path.join(self.drive, fields[0][1]))
+                                         for tag, fields in serato_database.entries if tag == "otrk"])
+        with open(playlist_path) as file:
+            self.assertEqual([keep, other], [self.normalize(line) for line in file.read().splitlines()])
+
+    def normalize(self, index_path):
+        return os.path.normcase(os.path.normpath(os.path.join(self.drive, index_path)))
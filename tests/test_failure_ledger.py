@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+from failure_ledger import FailureLedger, is_permanent_error
+
+
+class AgeRestrictedError(Exception):
+    pass
+
+
+class StreamRejectedError(Exception):
+    pass
+
+
+class VideoNotFoundError(Exception):
+    pass
+
+
+CUSTOM_URL = "https://www.youtube.com/watch?v=TUebWv_QXCM"
+
+
+class TestFailureLedger(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ledger = FailureLedger(self.temp_dir.name, base_retry_delay=100, max_retry_delay=1000)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_unknown_track_not_skipped(self):
+        self.assertFalse(self.ledger.should_skip("track1"))
+
+    def test_is_permanent_error(self):
+        self.assertTrue(is_permanent_error(AgeRestrictedError("age restricted")))
+        self.assertFalse(is_permanent_error(VideoNotFoundError("no results")))
+        # Rejected videos only come from one search, and a later search or raised limit can find a video to use
+        self.assertFalse(is_permanent_error(StreamRejectedError("too large")))
+
+    def test_exponential_backoff(self):
+        self.ledger.record_failure("track1", "Artist - Track", VideoNotFoundError(), now=0)
+        self.assertTrue(self.ledger.should_skip("track1", now=99))
+        self.assertFalse(self.ledger.should_skip("track1", now=100))
+
+        self.ledger.record_failure("track1", "Artist - Track", VideoNotFoundError(), now=100)
+        self.assertEqual(2, self.ledger.entries["track1"]["attempts"])
+        self.assertTrue(self.ledger.should_skip("track1", now=299))
+        self.assertFalse(self.ledger.should_skip("track1", now=300))
+
+    def test_backoff_capped(self):
+        self.assertEqual(1000, self.ledger.retry_delay(20))
+
+    def test_permanent_failure_parked_until_new_custom_url(self):
+        self.ledger.record_failure("track1", "Artist - Track", AgeRestrictedError(), now=0)
+
+        self.assertTrue(self.ledger.should_skip("track1", now=10 ** 9))
+        self.assertFalse(self.ledger.should_skip("track1", CUSTOM_URL))
+
+        # A custom URL that has already failed permanently stays parked
+        self.ledger.record_failure("track1", "Artist - Track", AgeRestrictedError(), CUSTOM_URL, now=0)
+        self.assertTrue(self.ledger.should_skip("track1", CUSTOM_URL))
+
+    def test_success_clears_entry(self):
+        self.ledger.record_failure("track1", "Artist - Track", VideoNotFoundError(), now=0)
+        self.ledger.record_success("track1")
+
+        self.assertFalse(self.ledger.should_skip("track1", now=0))
+        self.assertEqual([], self.ledger.report())
+
+    def test_save_and_load(self):
+        self.ledger.record_failure("track1", "Artist - Track", AgeRestrictedError("Video is age restricted"), now=5)
+        self.ledger.save()
+
+        loaded_ledger = FailureLedger(self.temp_dir.name)
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir.name, "failure_ledger.json")))
+        self.assertEqual(self.ledger.entries, loaded_ledger.entries)
+        self.assertEqual("AgeRestrictedError", loaded_ledger.entries["track1"]["error"])
+
+    def test_report_lists_parked_tracks_first(self):
+        self.ledger.record_failure("track1", "Artist - Retry", VideoNotFoundError(), now=0)
+        self.ledger.record_failure("track2", "Artist - Parked", AgeRestrictedError(), now=0)
+
+        report = self.ledger.report()
+
+        self.assertEqual(3, len(report))
+        self.assertIn("2 tracks", report[0])
+        self.assertIn("1 need a custom URL", report[0])
+        self.assertIn("Artist - Parked", report[1])
+        self.assertIn("needs custom URL", report[1])
+        self.assertIn("Artist - Retry", report[2])
+        self.assertIn("retry after", report[2])
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import unittest
+
+from garbage_collector import GarbageCollector, PlaylistMembership, DAY_SECONDS, QUARANTINE_INDEX_FILE
+
+NOW = 1_700_000_000
+
+
+class TestGarbageCollector(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.drive = self.temp_dir.name
+        for folder in ("Tracks", "Subcrates", "Rekordbox"):
+            os.makedirs(os.path.join(self.drive, folder))
+
+        self.id_to_video_map = {}
+        self.video_to_file_map = {}
+        for name in ("kept", "recent", "removed", "untracked"):
+            index_path = os.path.join("Tracks", f"{name}.mp3")
+            with open(os.path.join(self.drive, index_path), "wb") as file:
+                file.write(b"\x00" * 1000)
+            self.id_to_video_map[f"{name}_track"] = index_path
+            self.video_to_file_map[f"{name}_video"] = index_path
+        self.id_to_video_map["custom_track"] = "https://www.youtube.com/watch?v=custom"
+        # Written long before the retention window
+        untracked_path = os.path.join(self.drive, "Tracks", "untracked.mp3")
+        os.utime(untracked_path, (NOW - 90 * DAY_SECONDS, NOW - 90 * DAY_SECONDS))
+        self.save_json("id_to_video_map.json", self.id_to_video_map)
+        self.save_json("video_id_map.json", self.video_to_file_map)
+
+        membership = PlaylistMembership(self.drive)
+        membership.record_playlist("Old Playlist", [os.path.join("Tracks", "removed.mp3")], now=NOW - 60 * DAY_SECONDS)
+        membership.record_playlist("Playlist", [os.path.join("Tracks", "recent.mp3")], now=NOW - 5 * DAY_SECONDS)
+        membership.record_playlist("Playlist", [os.path.join("Tracks", "kept.mp3")], now=NOW - DAY_SECONDS)
+        membership.save()
+
+        for file_path in (os.path.join("Subcrates", "PySync DJ%%Old Playlist.crate"),
+                          os.path.join("Rekordbox", "Old Playlist.m3u")):
+            open(os.path.join(self.drive, file_path), "w").close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def save_json(self, file_name, data):
+        with open(os.path.join(self.drive, file_name), "w") as file:
+            json.dump(data, file)
+
+    def load_json(self, file_name):
+        with open(os.path.join(self.drive, file_name), "r") as file:
+            return json.load(file)
+
+    def create_collector(self, **kwargs):
+        return GarbageCollector(self.drive, ["Playlist"], "Subcrates", "Rekordbox", "Quarantine", **kwargs)
+
+    def test_plan(self):
+        plan = self.create_collector().plan(now=NOW)
+
+        self.assertEqual([os.path.join("Tracks", "removed.mp3"), os.path.join("Tracks", "untracked.mp3")],
+                         [collectable.index_path for collectable in plan.collectable])
+        self.assertEqual(2000, plan.reclaimable_bytes)
+        self.assertEqual(["Old Playlist"], plan.stale_playlists)
+
+    def test_dry_run_changes_nothing(self):
+        collector = self.create_collector()
+        collector.apply(collector.plan(now=NOW), now=NOW)
+
+        self.assertTrue(os.path.isfile(os.path.join(self.drive, "Tracks", "removed.mp3")))
+        self.assertEqual(self.id_to_video_map, self.load_json("id_to_video_map.json"))
+        self.assertTrue(os.path.isfile(os.path.join(self.drive, "Subcrates", "PySync DJ%%Old Playlist.crate")))
+
+    def test_apply_quarantines(self):
+        collector = self.create_collector()
+        collector.apply(collector.plan(now=NOW), dry_run=False, now=NOW)
+
+        self.assertFalse(os.path.exists(os.path.join(self.drive, "Tracks", "removed.mp3")))
+        self.assertTrue(os.path.isfile(os.path.join(self.drive, "Quarantine", "Tracks", "removed.mp3")))
+        self.assertTrue(os.path.isfile(os.path.join(self.drive, "Tracks", "recent.mp3")))
+        self.assertEqual({"kept_track", "recent_track", "custom_track"}, set(self.load_json("id_to_video_map.json")))
+        self.assertEqual({"kept_video", "recent_video"}, set(self.load_json("video_id_map.json")))
+        self.assertFalse(os.path.exists(os.path.join(self.drive, "Subcrates", "PySync DJ%%Old Playlist.crate")))
+        self.assertFalse(os.path.exists(os.path.join(self.drive, "Rekordbox", "Old Playlist.m3u")))
+        self.assertEqual(["Playlist"], list(PlaylistMembership(self.drive).playlists))
+
+    def test_quarantine_expires(self):
+        collector = self.create_collector(quarantine_days=10)
+        collector.apply(collector.plan(now=NOW), dry_run=False, now=NOW)
+
+        collector = self.create_collector(quarantine_days=10)
+        self.assertEqual([], collector.plan(now=NOW + 5 * DAY_SECONDS).expired)
+        plan = collector.plan(now=NOW + 10 * DAY_SECONDS)
+        self.assertEqual(2, len(plan.expired))
+        collector.apply(plan, dry_run=False, now=NOW + 10 * DAY_SECONDS)
+
+        self.assertFalse(os.path.exists(os.path.join(self.drive, "Quarantine", "Tracks", "removed.mp3")))
+        with open(os.path.join(self.drive, "Quarantine", QUARANTINE_INDEX_FILE), "r") as file:
+            self.assertEqual({}, json.load(file))
+
+    def test_no_quarantine_deletes(self):
+        collector = self.create_collector(quarantine_days=0)
+        collector.apply(collector.plan(now=NOW), dry_run=False, now=NOW)
+
+        self.assertFalse(os.path.exists(os.path.join(self.drive, "Tracks", "removed.mp3")))
+        self.assertFalse(os.path.exists(os.path.join(self.drive, "Quarantine")))
+
+    def test_unsynced_playlist_collects_nothing(self):
+        collector = GarbageCollector(self.drive, ["Playlist", "New Playlist"], "Subcrates", "Rekordbox", "Quarantine")
+        plan = collector.plan(now=NOW)
+
+        self.assertEqual([], plan.collectable)
+        self.assertEqual(["New Playlist"], plan.unsynced_playlists)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from mutagen.id3 import ID3, TIT2
+
+from integrity_scanner import IntegrityScanner, validate_mp3, parse_frame_header, REDOWNLOAD, RETAG, \
+    REMOVE_ORPHAN
+from resumable_download import PART_FILE_SUFFIX
+
+# MPEG-1 Layer III, 128kbps, 44.1kHz, stereo: 417 byte frames
+FRAME_HEADER = b"\xff\xfb\x90\x00"
+FRAME_LENGTH = 417
+
+
+def create_audio(frames, info_frame=True):
+    audio = b""
+    if info_frame:
+        # LAME writes an Info header in the first frame, after the 32 bytes of stereo side information
+        info = b"Info" + (0x03).to_bytes(4, "big") + frames.to_bytes(4, "big") + \
+            (frames * FRAME_LENGTH).to_bytes(4, "big")
+        audio += (FRAME_HEADER + bytes(32) + info).ljust(FRAME_LENGTH, b"\x00")
+        frames -= 1
+    return audio + (FRAME_HEADER + bytes(FRAME_LENGTH - 4)) * frames
+
+
+class TestValidateMp3(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, data):
+        file_path = os.path.join(self.temp_dir.name, "track.mp3")
+        with open(file_path, "wb") as file:
+            file.write(data)
+        return file_path
+
+    def test_parse_frame_header(self):
+        header = parse_frame_header(FRAME_HEADER)
+
+        self.assertEqual((1, 128000, 44100, False, FRAME_LENGTH), tuple(header))
+        self.assertIsNone(parse_frame_header(b"\x00\x00\x00\x00"))
+
+    def test_intact(self):
+        self.assertIsNone(validate_mp3(self.write(create_audio(10))))
+
+    def test_truncated(self):
+        self.assertIn("truncated", validate_mp3(self.write(create_audio(10)[:FRAME_LENGTH * 6])))
+
+    def test_not_mp3(self):
+        self.assertIsNotNone(validate_mp3(self.write(b"\x00\x00\x00\x18ftypM4A " + bytes(2000))))
+
+    def test_corrupt_second_frame(self):
+        audio = create_audio(10, info_frame=False)
+        audio = audio[:FRAME_LENGTH] + bytes(4) + audio[FRAME_LENGTH + 4:]
+
+        self.assertEqual("second MP3 frame is corrupt", validate_mp3(self.write(audio)))
+
+    def test_empty(self):
+        self.assertEqual("no audio data", validate_mp3(self.write(b"")))
+
+
+class TestIntegrityScanner(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.drive = self.temp_dir.name
+        self.track_dir = os.path.join(self.drive, "tracks")
+        os.makedirs(os.path.join(self.track_dir, "A"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_file(self, name, data, tagged=True):
+        file_path = os.path.join(self.track_dir, name)
+        with open(file_path, "wb") as file:
+            file.write(data)
+        if tagged:
+            tags = ID3()
+            tags.add(TIT2(encoding=3, text=name))
+            tags.save(file_path)
+        return os.path.normcase(os.path.normpath(file_path))
+
+    def write_index(self, index):
+        with open(os.path.join(self.drive, "id_to_video_map.json"), "w") as file:
+            json.dump(index, file)
+
+    def create_library(self):
+        good = self.create_file("good.mp3", create_audio(10))
+        truncated = self.create_file(os.path.join("A", "truncated.mp3"), create_audio(10)[:FRAME_LENGTH * 3])
+        untagged = self.create_file("untagged.mp3", create_audio(10), tagged=False)
+        orphan = self.create_file("orphan.mp3", create_audio(10))
+        leftover = self.create_file("leftover.mp4", b"partial", tagged=False)
+        self.write_index({"good": good, "truncated": truncated, "untagged": untagged,
+                          "missing": os.path.join(self.track_dir, "missing.mp3"),
+                          "custom": "https://www.youtube.com/watch?v=abc"})
+        return good, truncated, untagged, orphan, leftover
+
+    def test_plan(self):
+        good, truncated, untagged, orphan, leftover = self.create_library()
+
+        plan = IntegrityScanner(self.drive, "tracks").scan()
+
+        actions = {(step.action, os.path.basename(step.file_path)) for step in plan}
+        self.assertEqual({(REDOWNLOAD, "truncated.mp3"), (REDOWNLOAD, "missing.mp3"), (RETAG, "untagged.mp3"),
+                          (REMOVE_ORPHAN, "orphan.mp3"), (REMOVE_ORPHAN, "leftover.mp4")}, actions)
+
+    def test_apply(self):
+        good, truncated, untagged, orphan, leftover = self.create_library()
+        scanner = IntegrityScanner(self.drive, "tracks")
+
+        scanner.apply(scanner.scan(), dry_run=False)
+
+        with open(os.path.join(self.drive, "id_to_video_map.json")) as file:
+            index = json.load(file)
+        self.assertEqual({"good", "untagged", "custom"}, set(index))
+        for removed in (truncated, orphan, leftover):
+            self.assertFalse(os.path.exists(removed))
+        self.assertTrue(os.path.exists(good))
+
+    def test_keeps_partial_downloads_until_stale(self):
+        fresh_part = self.create_file("fresh.m4a" + PART_FILE_SUFFIX, b"partial", tagged=False)
+        stale_part = self.create_file("stale.m4a" + PART_FILE_SUFFIX, b"partial", tagged=False)
+        stale_time = time.time() - 8 * 24 * 60 * 60
+        os.utime(stale_part, (stale_time, stale_time))
+        scanner = IntegrityScanner(self.drive, "tracks")
+
+        scanner.apply(scanner.scan(), dry_run=False)
+
+        self.assertTrue(os.path.exists(fresh_part))
+        self.assertFalse(os.path.exists(stale_part))
+
+    def test_dry_run_changes_nothing(self):
+        files = self.create_library()
+        scanner = IntegrityScanner(self.drive, "tracks")
+
+        scanner.apply(scanner.scan())
+
+        self.assertTrue(all(os.path.exists(file_path) for file_path in files))
+
+    def test_incremental_only_checks_changed(self):
+        good, truncated, *_ = self.create_library()
+        IntegrityScanner(self.drive, "tracks").scan()
+        with open(good, "ab") as file:
+            file.write(b"\x00")
+
+        with patch.object(IntegrityScanner, "check_file", autospec=True, return_value=None) as check_file:
+            plan = IntegrityScanner(self.drive, "tracks").scan(incremental=True)
+
+        self.assertEqual([good], [call.args[1] for call in check_file.call_args_list])
+        self.assertIn((REDOWNLOAD, truncated), {(step.action, step.file_path) for step in plan})
+
+
+if __name__ == '__main__':
+    unittest.main()
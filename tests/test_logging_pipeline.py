@@ -0,0 +1,112 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from logging_pipeline import ContextFilter, DebugSamplingFilter, JsonLinesFormatter, log_context, remove_old_logs
+
+
+def create_record(level=logging.DEBUG, message="message"):
+    return logging.LogRecord("test", level, __file__, 1, message, None, None)
+
+
+class TestContextFilter(unittest.TestCase):
+    def test_adds_worker_and_track(self):
+        record = create_record()
+
+        with log_context("track_id"):
+            ContextFilter().filter(record)
+
+        self.assertEqual("track_id", record.track_id)
+        self.assertIn(str(os.getpid()), record.worker)
+
+    def test_track_reset_after_block(self):
+        with log_context("track_id"):
+            pass
+        record = create_record()
+
+        ContextFilter().filter(record)
+
+        self.assertIsNone(record.track_id)
+
+
+class TestDebugSamplingFilter(unittest.TestCase):
+    def test_samples_debug_under_load(self):
+        sampling_filter = DebugSamplingFilter(max_per_second=10, sample_every=5)
+
+        with patch("logging_pipeline.time.monotonic", return_value=100):
+            kept = [sampling_filter.filter(create_record()) for _ in range(50)]
+
+        # The first 10, then one in every 5 of the remaining 40
+        self.assertEqual(18, sum(kept))
+
+    def test_keeps_info_and_errors(self):
+        sampling_filter = DebugSamplingFilter(max_per_second=0, sample_every=1000)
+
+        with patch("logging_pipeline.time.monotonic", return_value=100):
+            self.assertTrue(all(sampling_filter.filter(create_record(logging.INFO)) for _ in range(100)))
+            self.assertTrue(sampling_filter.filter(create_record(logging.ERROR)))
+
+    def test_reports_dropped_records(self):
+        sampling_filter = DebugSamplingFilter(max_per_second=1, sample_every=3)
+
+        with patch("logging_pipeline.time.monotonic", return_value=100):
+            for _ in range(2):
+                sampling_filter.filter(create_record())
+        record = create_record()
+        with patch("logging_pipeline.time.monotonic", return_value=102):
+            self.assertTrue(sampling_filter.filter(record))
+
+        self.assertEqual(1, record.sampled_out)
+
+
+class TestJsonLinesFormatter(unittest.TestCase):
+    def test_formats_json(self):
+        record = create_record(logging.INFO, "Downloading \"Track\"")
+        with log_context("track_id"):
+            ContextFilter().filter(record)
+
+        entry = json.loads(JsonLinesFormatter().format(record))
+
+        self.assertEqual("INFO", entry["level"])
+        self.assertEqual("track_id", entry["track_id"])
+        self.assertEqual("Downloading \"Track\"", entry["message"])
+
+
+class TestQueuePipeline(unittest.TestCase):
+    def test_records_keep_context_through_queue(self):
+        log_queue = queue.Queue()
+        handler = logging.handlers.QueueHandler(log_queue)
+        handler.addFilter(ContextFilter())
+        logger = logging.getLogger("test_logging_pipeline")
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+
+        with log_context("track_id"):
+            logger.debug("queued")
+
+        record = log_queue.get_nowait()
+        self.assertEqual("track_id", json.loads(JsonLinesFormatter().format(record))["track_id"])
+
+
+class TestRemoveOldLogs(unittest.TestCase):
+    def test_keeps_latest(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            names = ["pysync_dj_log_2024-01-01.log", "pysync_dj_log_2024-01-02.jsonl",
+                     "pysync_dj_log_2024-01-03.jsonl", "other.txt"]
+            for name in names:
+                open(os.path.join(log_directory, name), "w").close()
+
+            remove_old_logs(log_directory, keep=3)
+
+            self.assertEqual(["other.txt", "pysync_dj_log_2024-01-02.jsonl", "pysync_dj_log_2024-01-03.jsonl"],
+                             sorted(os.listdir(log_directory)))
+
+
+if __name__ == '__main__':
+    unittest.main()
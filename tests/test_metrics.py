@@ -0,0 +1,96 @@
+import json
+import queue
+import threading
+import unittest
+import urllib.request
+
+from event_queue import EventQueueHandler, EventQueueLogger
+from metrics import MetricsServer, SyncMetrics
+
+
+class TestSyncMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = SyncMetrics(lambda: 7)
+
+    def test_stage_counts(self):
+        for state in ("queued", "queued", "queued", "started", "started", "completed"):
+            self.metrics.record("stage", "download", state)
+        self.metrics.record("stage", "download", "dropped")
+        self.metrics.record("limits", {"download": 4})
+
+        download = self.metrics.status()["stages"]["download"]
+        self.assertEqual(0, download["queued"])
+        self.assertEqual(1, download["in_flight"])
+        self.assertEqual(1, download["completed"])
+        self.assertEqual(0.25, download["utilisation"])
+
+    def test_caches_bytes_and_throttling(self):
+        self.metrics.record("cache", "search", 3, 1)
+        self.metrics.record("bytes", "download", 1000)
+        self.metrics.record("throttle")
+
+        status = self.metrics.status()
+        self.assertEqual(0.75, status["caches"]["search"]["hit_ratio"])
+        self.assertEqual(1000, status["bytes"]["download"]["total"])
+        self.assertGreater(status["bytes"]["download"]["per_second"], 0)
+        self.assertEqual(1, status["throttle_errors"])
+        self.assertEqual(7, status["event_queue_depth"])
+
+    def test_prometheus(self):
+        self.metrics.record("stage", "track", "started")
+        self.metrics.record("stage", "track", "failed")
+        self.metrics.record("cache", "spotify", 1, 0)
+        self.metrics.record("bytes", "download", 123456789)
+
+        lines = self.metrics.prometheus().splitlines()
+        self.assertIn('pysync_dj_stage_tracks_total{stage="track",outcome="failed"} 1', lines)
+        self.assertIn('pysync_dj_cache_hit_ratio{cache="spotify"} 1.0', lines)
+        self.assertIn("pysync_dj_event_queue_depth 7", lines)
+        self.assertIn('pysync_dj_bytes_total{stage="download"} 123456789', lines)
+        self.assertIn("# TYPE pysync_dj_stage_tracks_total counter", lines)
+        # Stages without a limit have no utilisation
+        self.assertFalse(any(line.startswith("pysync_dj_stage_utilisation{") for line in lines))
+
+
+class TestMetricsServer(unittest.TestCase):
+    def test_serves_metrics(self):
+        metrics = SyncMetrics()
+        metrics.record("stage", "search", "queued")
+        server = MetricsServer(metrics, 0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+                self.assertIn('pysync_dj_stage_queued{stage="search"} 1', response.read().decode())
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/status") as response:
+                self.assertEqual(1, json.load(response)["stages"]["search"]["queued"])
+        finally:
+            server.shutdown()
+
+
+class TestMetricEvents(unittest.TestCase):
+    def test_disabled_sends_nothing(self):
+        event_queue = queue.Queue()
+        EventQueueLogger(event_queue).metric("throttle")
+
+        self.assertTrue(event_queue.empty())
+
+    def test_headless_collects_metric_events(self):
+        handler = EventQueueHandler.__new__(EventQueueHandler)
+        handler.event_queue = queue.Queue()
+        handler.metrics = SyncMetrics()
+        event_logger = EventQueueLogger(handler.event_queue, metrics=True)
+        event_logger.info("Downloading track")
+        event_logger.metric("throttle")
+
+        stop_event = threading.Event()
+        thread = threading.Thread(target=handler.process_queue_headless, args=(stop_event,))
+        thread.start()
+        while not handler.event_queue.empty():
+            pass
+        stop_event.set()
+        thread.join()
+
+        self.assertEqual(1, handler.metrics.status()["throttle_errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import concurrent.futures
+import os
+import tempfile
+import unittest
+
+from profiling import Profiler, run_profiled, merge_profiles, summarize_profile, MERGED_PROFILE_NAME, MEMORY_SUFFIX
+
+
+def busy_function(n):
+    return sum(i * i for i in range(n))
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profile_directory = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_profiler_writes_profile_and_memory(self):
+        with Profiler(self.profile_directory, "stage", trace_memory=True):
+            busy_function(1000)
+
+        self.assertTrue(os.path.exists(os.path.join(self.profile_directory, "stage.prof")))
+        self.assertTrue(os.path.exists(os.path.join(self.profile_directory, "stage" + MEMORY_SUFFIX)))
+
+    def test_run_profiled_without_directory(self):
+        self.assertEqual(5, run_profiled(None, "track", False, busy_function, 3))
+        self.assertEqual([], os.listdir(self.profile_directory))
+
+    def test_worker_threads_profiled_separately_and_merged(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(lambda n: run_profiled(self.profile_directory, "track", False,
+                                                               busy_function, n), [1000] * 6))
+
+        self.assertEqual([busy_function(1000)] * 6, results)
+        worker_profiles = [name for name in os.listdir(self.profile_directory) if name.startswith("track_")]
+        self.assertEqual(2, len(worker_profiles))
+
+        stats = merge_profiles(self.profile_directory)
+
+        self.assertTrue(os.path.exists(os.path.join(self.profile_directory, MERGED_PROFILE_NAME)))
+        busy_calls = [calls for (_, _, function_name), (_, calls, *_) in stats.stats.items()
+                      if function_name == "busy_function"]
+        self.assertEqual([6], busy_calls)
+
+        summary = summarize_profile(stats, top_n=5)
+        self.assertTrue(any("function calls" in line for line in summary))
+        self.assertFalse(any(line.strip().endswith(".prof") for line in summary))
+
+    def test_merge_with_no_profiles(self):
+        self.assertIsNone(merge_profiles(self.profile_directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
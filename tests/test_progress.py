@@ -0,0 +1,101 @@
+import unittest
+from array import array
+from unittest.mock import MagicMock, patch
+
+from progress import ProgressTracker, estimate_playlist_work, format_duration, DOWNLOAD_BYTES_PER_SECOND, \
+    TRANSCODE_WORK_PER_SECOND
+
+
+def create_track(track_id, duration_ms=None):
+    return {"track": {"id": track_id, "name": f"Track {track_id}", "duration_ms": duration_ms}}
+
+
+class TestEstimatePlaylistWork(unittest.TestCase):
+    def test_downloaded_tracks_cost_nothing(self):
+        playlist = [create_track("a", 100000), create_track("b", 100000), create_track("c", 100000)]
+        id_to_video_map = {"a": "\\tracks\\a.mp3", "b": "https://www.youtube.com/watch?v=abc"}
+
+        track_work = estimate_playlist_work(playlist, id_to_video_map)
+
+        work_per_track = 100 * (DOWNLOAD_BYTES_PER_SECOND + TRANSCODE_WORK_PER_SECOND)
+        self.assertEqual([0, work_per_track, work_per_track], list(track_work))
+
+    def test_longer_tracks_cost_more(self):
+        track_work = estimate_playlist_work([create_track("a", 120000), create_track("b", 600000)], {})
+
+        self.assertAlmostEqual(5, track_work[1] / track_work[0])
+
+    def test_missing_duration_uses_default(self):
+        track_work = estimate_playlist_work([create_track("a")], {})
+
+        self.assertGreater(track_work[0], 0)
+
+
+class TestProgressTracker(unittest.TestCase):
+    def setUp(self):
+        self.event_logger = MagicMock()
+        self.tracker = ProgressTracker(self.event_logger, min_update_interval=0)
+
+    def reported_progress(self):
+        return [call.args[0] for call in self.event_logger.update_progress.call_args_list]
+
+    def test_playlists_weighted_by_work(self):
+        self.tracker.start_playlist("Small", array("d", [10] * 5))
+        self.tracker.start_playlist("Large", array("d", [10] * 95))
+
+        for _ in range(5):
+            self.tracker.complete_track(10)
+
+        self.assertAlmostEqual(0.05, self.reported_progress()[-1])
+
+    def test_cache_hits_dont_move_bar(self):
+        self.tracker.start_playlist("Playlist", array("d", [0, 100]))
+
+        self.tracker.complete_track(0)
+        self.assertEqual(0, self.reported_progress()[-1])
+
+        self.tracker.complete_track(100)
+        self.assertEqual(1, self.reported_progress()[-1])
+
+    def test_progress_never_goes_backwards(self):
+        self.tracker.add_playlist_estimate("Later", 1)
+        self.tracker.start_playlist("First", array("d", [100, 100]))
+        self.tracker.complete_track(100)
+        before = self.reported_progress()[-1]
+
+        # The later playlist turns out to be much bigger than its estimate
+        self.tracker.start_playlist("Later", array("d", [1e9]))
+        self.tracker.complete_track(100)
+
+        self.assertGreaterEqual(self.reported_progress()[-1], before)
+        self.assertEqual(3, self.tracker.total_tracks)
+
+    def test_updates_rate_limited(self):
+        tracker = ProgressTracker(self.event_logger, min_update_interval=60)
+        tracker.start_playlist("Playlist", array("d", [1] * 100))
+
+        for _ in range(100):
+            tracker.complete_track(1)
+
+        self.assertEqual(1, self.event_logger.update_progress.call_count)
+        tracker.update(force=True)
+        self.assertEqual([0.01, 1], self.reported_progress())
+
+    def test_status_shows_throughput_and_eta(self):
+        with patch("progress.time.monotonic", side_effect=[0, 60, 60]):
+            self.tracker.start_playlist("Playlist", array("d", [60000] * 4))
+            self.tracker.complete_track(60000)
+
+        status = self.event_logger.update_status.call_args.args[0]
+        self.assertEqual("1/4 tracks | 1.0 tracks/min | 1 KB/s | 3m 00s left", status)
+
+
+class TestFormatDuration(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual("45s", format_duration(45))
+        self.assertEqual("3m 20s", format_duration(200))
+        self.assertEqual("1h 05m", format_duration(3900))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import concurrent.futures
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cancellation import CancellationToken
+from drive_writer import DriveSpace
+from progress import ProgressTracker
+from pysync_dj_download import PySyncDJDownload
+from track_processor import TrackResult
+
+
+class FakeWorkerPool:
+    """Worker pool that runs tracks in threads, finishing them in reverse order of submission within each batch."""
+
+    def __init__(self, workers=4):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.id_to_video_map = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.processed = 0
+        self.lock = threading.Lock()
+
+    def create_context(self, *args):
+        return None
+
+    def submit(self, track_data, context):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return self.executor.submit(self.process, track_data)
+
+    def process(self, track_data):
+        position = int(track_data["track"]["id"])
+        time.sleep(0.01 * (3 - position % 4))
+        with self.lock:
+            self.in_flight -= 1
+            self.processed += 1
+        if position == 5:
+            raise RuntimeError("download failed")
+        # Odd tracks were already on the drive
+        return TrackResult(f"track{position}.mp3", position % 2 == 0)
+
+
+def create_download(worker_pool, tracks_in_flight=4):
+    download = PySyncDJDownload.__new__(PySyncDJDownload)
+    download.worker_pool = worker_pool
+    download.settings = MagicMock(tracks_in_flight=tracks_in_flight)
+    download.event_queue = None
+    download.event_logger = MagicMock()
+    download.stage_limiters = {}
+    download.cancel_token = CancellationToken(threading.Event(), threading.Event())
+    download.adaptive_concurrency = None
+    download.failure_ledger = MagicMock(entries={})
+    download.progress_tracker = ProgressTracker(download.event_logger)
+    download.drive_space = DriveSpace(".", 0)
+    download.drive_writer = None
+    return download
+
+
+def create_playlist(size):
+    return [{"track": {"id": str(position), "name": f"Track {position}", "artists": [{"name": "Artist"}]}}
+            for position in range(size)]
+
+
+class TestDownloadPlaylist(unittest.TestCase):
+    def setUp(self):
+        self.worker_pool = FakeWorkerPool()
+
+    def tearDown(self):
+        self.worker_pool.executor.shutdown()
+
+    def test_keeps_playlist_order_and_bounds_window(self):
+        download = create_download(self.worker_pool, tracks_in_flight=3)
+        playlist = create_playlist(12)
+
+        downloaded_tracks = download.download_playlist(playlist, "Playlist")
+
+        self.assertEqual([f"track{position}.mp3" for position in range(12) if position != 5], downloaded_tracks)
+        self.assertLessEqual(self.worker_pool.max_in_flight, 3)
+        download.failure_ledger.record_failure.assert_called_once()
+
+    def test_adaptive_concurrency_only_counts_downloads(self):
+        download = create_download(self.worker_pool)
+        download.adaptive_concurrency = MagicMock()
+        download.reported_stage_limits = None
+
+        download.download_playlist(create_playlist(8), "Playlist")
+
+        self.assertEqual(4, download.adaptive_concurrency.record_success.call_count)
+        self.assertEqual(7, download.failure_ledger.record_success.call_count)
+
+    def test_releases_track_data(self):
+        download = create_download(self.worker_pool)
+        playlist = create_playlist(8)
+
+        download.download_playlist(playlist, "Playlist")
+
+        self.assertEqual([None] * 8, playlist)
+
+    def test_progress_reaches_one(self):
+        download = create_download(self.worker_pool)
+
+        download.download_playlist(create_playlist(8), "Playlist")
+
+        progress = [call.args[0] for call in download.event_logger.update_progress.call_args_list]
+        self.assertEqual(sorted(progress), progress)
+        self.assertEqual(1, progress[-1])
+
+    def test_paused_submits_nothing(self):
+        download = create_download(self.worker_pool)
+        download.cancel_token.pause()
+        threading.Timer(0.2, download.cancel_token.cancel).start()
+
+        downloaded_tracks = download.download_playlist(create_playlist(8), "Playlist")
+
+        self.assertEqual([], downloaded_tracks)
+        self.assertEqual(0, self.worker_pool.max_in_flight)
+
+    def test_drive_full_stops_submitting(self):
+        download = create_download(self.worker_pool, tracks_in_flight=2)
+        download.drive_space = DriveSpace(".", 0)
+
+        # Room for three and a half default length tracks, which fills up as each written track releases its
+        # reservation, so the free space doesn't depend on when the worker threads finish
+        track_size = 210 * 16000
+        release = download.drive_space.release
+        released = []
+        download.drive_space.release = lambda size: (released.append(size), release(size))
+        with patch.object(DriveSpace, "free_space", side_effect=lambda: (3.5 - len(released)) * track_size):
+            downloaded_tracks = download.download_playlist(create_playlist(8), "Playlist")
+
+        self.assertEqual(["track0.mp3", "track1.mp3", "track2.mp3"], downloaded_tracks)
+        self.assertTrue(download.drive_space.full)
+        self.assertEqual(0, download.drive_space.reserved)
+
+    def test_drive_full_keeps_cached_tracks(self):
+        download = create_download(self.worker_pool, tracks_in_flight=2)
+        self.worker_pool.id_to_video_map["6"] = "track6.mp3"
+
+        with patch.object(DriveSpace, "free_space", return_value=1.5 * 210 * 16000):
+            downloaded_tracks = download.download_playlist(create_playlist(8), "Playlist")
+
+        # Track 6 is already on the drive, so is kept in the playlist after the drive fills
+        self.assertEqual(["track0.mp3", "track6.mp3"], downloaded_tracks)
+        self.assertTrue(download.drive_space.full)
+        self.assertEqual(0, download.drive_space.reserved)
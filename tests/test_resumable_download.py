@@ -0,0 +1,182 @@
+import os
+import re
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from cancellation import CancellationToken, SyncCancelled
+from resumable_download import download_file, part_file_path, IncompleteDownloadError
+
+PAYLOAD = bytes(range(256)) * 4096  # 1MB
+
+
+class FlakyRangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves PAYLOAD with range support. The first `drops` responses are cut off half way through, closing the
+    connection mid-transfer.
+    """
+    payload = PAYLOAD
+    drops = 0
+    support_ranges = True
+    range_starts = []
+
+    def do_GET(self):
+        start, end = 0, len(self.payload) - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.support_ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.payload)}")
+        else:
+            self.send_response(200)
+        type(self).range_starts.append(start)
+
+        body = self.payload[start:end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if type(self).drops > 0:
+            type(self).drops -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        FlakyRangeHandler.drops = 0
+        FlakyRangeHandler.support_ranges = True
+        FlakyRangeHandler.range_starts = []
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyRangeHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/audio.mp4?id=test"
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "track.mp4")
+
+        # Retries wait without slowing the tests down
+        sleep_patcher = patch("resumable_download.time.sleep")
+        self.mock_sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def read_file(self):
+        with open(self.file_path, "rb") as file:
+            return file.read()
+
+    def test_download_in_chunks(self):
+        download_file(self.url, self.file_path, len(PAYLOAD), chunk_size=300000)
+
+        self.assertEqual(PAYLOAD, self.read_file())
+        self.assertEqual([0, 300000, 600000, 900000], FlakyRangeHandler.range_starts)
+        self.assertFalse(os.path.exists(part_file_path(self.file_path)))
+
+    def test_resumes_after_dropped_connection(self):
+        FlakyRangeHandler.drops = 2
+
+        download_file(self.url, self.file_path, len(PAYLOAD), chunk_size=400000)
+
+        self.assertEqual(PAYLOAD, self.read_file())
+        # Each dropped response should be resumed from near where it was cut off, not from the start of its range
+        first_resume, second_resume = FlakyRangeHandler.range_starts[1:3]
+        self.assertTrue(0 < first_resume <= 200000)
+        self.assertTrue(first_resume < second_resume <= first_resume + 200000)
+
+    def test_retries_back_off(self):
+        FlakyRangeHandler.drops = 7
+
+        download_file(self.url, self.file_path, len(PAYLOAD), chunk_size=len(PAYLOAD), max_retries=7)
+
+        self.assertEqual([1, 2, 4, 8, 16, 30, 30], [call.args[0] for call in self.mock_sleep.call_args_list])
+
+    def test_cancel_while_waiting_to_retry(self):
+        FlakyRangeHandler.drops = 1
+        cancel_token = CancellationToken(threading.Event(), threading.Event())
+        threading.Timer(0.1, cancel_token.cancel).start()
+
+        with self.assertRaises(SyncCancelled):
+            download_file(self.url, self.file_path, len(PAYLOAD), cancel_token=cancel_token)
+
+        self.assertTrue(os.path.isfile(part_file_path(self.file_path)))
+
+    def test_resumes_from_existing_part_file(self):
+        with open(part_file_path(self.file_path), "wb") as part_file:
+            part_file.write(PAYLOAD[:500000])
+
+        download_file(self.url, self.file_path, len(PAYLOAD))
+
+        self.assertEqual(PAYLOAD, self.read_file())
+        self.assertEqual([500000], FlakyRangeHandler.range_starts)
+
+    def test_restarts_when_server_ignores_ranges(self):
+        FlakyRangeHandler.support_ranges = False
+        with open(part_file_path(self.file_path), "wb") as part_file:
+            part_file.write(b"stale data")
+
+        download_file(self.url, self.file_path, len(PAYLOAD))
+
+        self.assertEqual(PAYLOAD, self.read_file())
+
+    def test_unknown_size(self):
+        download_file(self.url, self.file_path, chunk_size=300000)
+
+        self.assertEqual(PAYLOAD, self.read_file())
+
+    def test_gives_up_after_max_retries_and_keeps_part_file(self):
+        FlakyRangeHandler.drops = 10
+
+        with self.assertRaises(IncompleteDownloadError):
+            download_file(self.url, self.file_path, len(PAYLOAD), max_retries=2)
+
+        self.assertFalse(os.path.exists(self.file_path))
+        self.assertTrue(os.path.getsize(part_file_path(self.file_path)) > 0)
+
+    def test_size_mismatch(self):
+        with self.assertRaises(IncompleteDownloadError):
+            download_file(self.url, self.file_path, len(PAYLOAD) + 10)
+
+        self.assertFalse(os.path.exists(self.file_path))
+
+    def test_skips_complete_file(self):
+        with open(self.file_path, "wb") as file:
+            file.write(PAYLOAD)
+
+        download_file(self.url, self.file_path, len(PAYLOAD))
+
+        self.assertEqual([], FlakyRangeHandler.range_starts)
+
+    def test_cancel_stops_download_and_keeps_part_file(self):
+        cancel_token = CancellationToken(threading.Event(), threading.Event())
+        session = requests.Session()
+        original_get = session.get
+
+        def get_then_cancel(*args, **kwargs):
+            # Cancel once the second range request is under way
+            if FlakyRangeHandler.range_starts:
+                cancel_token.cancel()
+            return original_get(*args, **kwargs)
+
+        session.get = get_then_cancel
+
+        with self.assertRaises(SyncCancelled):
+            download_file(self.url, self.file_path, len(PAYLOAD), chunk_size=300000, session=session,
+                          cancel_token=cancel_token)
+
+        self.assertFalse(os.path.exists(self.file_path))
+        self.assertEqual(300000, os.path.getsize(part_file_path(self.file_path)))
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, TBPM
+
+import parse_serato_crates
+from dj_libraries.serato_database import SeratoDatabase, BACKUP_SUFFIX, format_length, path_key, read_track_fields
+
+FIXTURE_DATABASE = os.path.join(os.path.dirname(__file__), "fixtures", "database V2")
+
+# MPEG-1 Layer III, 128kbps, 44.1kHz, stereo: 417 byte frames
+FRAME_HEADER = b"\xff\xfb\x90\x00"
+FRAME_LENGTH = 417
+
+
+class TestSeratoDatabase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.drive = self.temp_dir.name
+        os.makedirs(os.path.join(self.drive, "_Serato_", "Subcrates"))
+        os.makedirs(os.path.join(self.drive, "PySync DJ Tracks"))
+        self.database_path = os.path.join(self.drive, "_Serato_", "database V2")
+        shutil.copyfile(FIXTURE_DATABASE, self.database_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_track(self, name, bpm=None):
+        file_path = os.path.join(self.drive, "PySync DJ Tracks", f"{name}.mp3")
+        with open(file_path, "wb") as file:
+            file.write((FRAME_HEADER + bytes(FRAME_LENGTH - 4)) * 100)
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=name))
+        tags.add(TPE1(encoding=3, text="Artist"))
+        tags.add(TALB(encoding=3, text="Album"))
+        if bpm:
+            tags.add(TBPM(encoding=3, text=bpm))
+        tags.save(file_path)
+        return file_path
+
+    def load_database(self):
+        with open(self.database_path, "rb") as file:
+            return parse_serato_crates.decode_struct(file.read())
+
+    def open_database(self):
+        return SeratoDatabase(self.drive, "_Serato_\\Subcrates")
+
+    def test_round_trip(self):
+        with open(FIXTURE_DATABASE, "rb") as file:
+            data = file.read()
+
+        self.assertEqual(data, parse_serato_crates.encode_struct(parse_serato_crates.decode_struct(data)))
+
+    def test_unchanged_database_not_rewritten(self):
+        database = self.open_database()
+
+        self.assertEqual(0, database.add_tracks([os.path.join(self.drive, "PySync DJ Tracks", "Existing - Track.mp3")]))
+        self.assertFalse(database.save())
+
+    def test_add_tracks(self):
+        fixture_entries = self.load_database()
+        track = self.create_track("New Track", bpm="126")
+        database = self.open_database()
+
+        self.assertEqual(1, database.add_tracks([track, track]))
+        self.assertTrue(database.save())
+
+        entries = self.load_database()
+        # Every existing entry, with fields of unknown types, is kept as it was
+        self.assertEqual(fixture_entries, entries[:3])
+        self.assertEqual(4, len(entries))
+        fields = dict(entries[3][1])
+        self.assertEqual("PySync DJ Tracks/New Track.mp3", fields["pfil"])
+        self.assertEqual("New Track", fields["tsng"])
+        self.assertEqual("Artist", fields["tart"])
+        self.assertEqual("Album", fields["talb"])
+        self.assertEqual("126.00", fields["tbpm"])
+        self.assertEqual("128.0kbps", fields["tbit"])
+        self.assertEqual(format_length(100 * 1152 / 44100), fields["tlen"])
+        self.assertEqual(str(fields["uadd"]), fields["tadd"])
+
+        with open(self.database_path + BACKUP_SUFFIX, "rb") as backup, open(FIXTURE_DATABASE, "rb") as fixture:
+            self.assertEqual(fixture.read(), backup.read())
+
+    def test_track_without_bpm(self):
+        database = self.open_database()
+        database.add_tracks([self.create_track("No Tempo")])
+
+        self.assertNotIn("tbpm", dict(database.entries[-1][1]))
+
+    def test_existing_tracks_not_read(self):
+        track = self.create_track("New Track")
+        database = self.open_database()
+
+        with patch("dj_libraries.serato_database.read_track_fields", wraps=read_track_fields) as mock_read:
+            database.add_tracks([os.path.join(self.drive, "PySync DJ Tracks", "Existing - Track.mp3"), track])
+
+        mock_read.assert_called_once_with(track)
+
+    def test_unreadable_track_skipped(self):
+        database = self.open_database()
+
+        self.assertEqual(0, database.add_tracks([os.path.join(self.drive, "PySync DJ Tracks", "Missing.mp3")]))
+        self.assertFalse(database.save())
+
+    def test_new_database(self):
+        os.remove(self.database_path)
+        database = self.open_database()
+        database.add_tracks([self.create_track("New Track")])
+        database.save()
+
+        entries = self.load_database()
+        self.assertEqual(("vrsn", "2.0/Serato Scratch LIVE Database"), entries[0])
+        self.assertEqual(["otrk"], [tag for tag, _ in entries[1:]])
+        self.assertFalse(os.path.exists(self.database_path + BACKUP_SUFFIX))
+
+    def test_path_key(self):
+        self.assertEqual(path_key("Music/Bought/User Track.mp3"), path_key("\\Music\\Bought\\user track.mp3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
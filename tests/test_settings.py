@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+
+from settings import Settings
+
+
+class TestSettings(unittest.TestCase):
+    def test_instances_are_independent(self):
+        settings = Settings({"dj_library_drive": "E:\\", "mirror_drives": ["F:\\"]})
+        other = Settings({"dj_library_drive": "G:\\"})
+        copy = settings.copy()
+        copy.update_setting("dj_library_drive", "H:\\")
+        copy.mirror_drives.append("I:\\")
+
+        self.assertEqual("E:\\", settings.dj_library_drive)
+        self.assertEqual(["F:\\"], settings.mirror_drives)
+        self.assertEqual("G:\\", other.dj_library_drive)
+        self.assertEqual("H:\\", copy.dj_library_drive)
+
+    def test_from_file_and_reload(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "profile.yaml")
+            with open(file_path, "w") as file:
+                file.write("tracks_folder: Tracks\nmirror_link_mode: hardlink\n")
+
+            settings = Settings.from_file(file_path)
+            settings.update_setting("tracks_folder", "Other")
+            settings.reload_settings()
+
+        self.assertEqual("Tracks", settings.tracks_folder)
+        self.assertEqual("hardlink", settings.mirror_link_mode)
+        self.assertEqual("flat", settings.track_layout)
+
+
+if __name__ == "__main__":
+    unittest.main()
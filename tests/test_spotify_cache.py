@@ -0,0 +1,156 @@
+import io
+import itertools
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from spotify_cache import HTTPCache, create_cached_session, freshness_lifetime
+
+URL = "https://api.spotify.com/v1/playlists/abc/tracks?offset=0&limit=100"
+
+
+def create_response(request, status_code, headers=None, body=b""):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response._content = body
+    response.raw = io.BytesIO()
+    response.request = request
+    response.url = request.url
+    return response
+
+
+class FakeServer:
+    """Answers requests like Spotify, with a 304 when the If-None-Match matches the current ETag."""
+
+    def __init__(self, body=b'{"items": []}', etag='"v1"', cache_control="private, max-age=0"):
+        self.body = body
+        self.etag = etag
+        self.cache_control = cache_control
+        self.requests = []
+
+    def send(self, adapter, request, **kwargs):
+        self.requests.append(request)
+        headers = {"Cache-Control": self.cache_control, "Content-Type": "application/json"}
+        if self.etag:
+            headers["ETag"] = self.etag
+        if self.etag and request.headers.get("If-None-Match") == self.etag:
+            return create_response(request, 304, headers)
+        return create_response(request, 200, headers, self.body)
+
+
+class TestCachingSession(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = HTTPCache(self.temp_dir.name, max_size_mb=1)
+        self.session = create_cached_session(self.cache)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get(self, server, token="token1"):
+        with patch.object(HTTPAdapter, "send", autospec=True, side_effect=server.send):
+            return self.session.get(URL, headers={"Authorization": f"Bearer {token}"})
+
+    def test_unchanged_response_revalidated(self):
+        server = FakeServer()
+
+        first = self.get(server)
+        second = self.get(server)
+
+        self.assertEqual({"items": []}, first.json())
+        self.assertEqual({"items": []}, second.json())
+        self.assertEqual(200, second.status_code)
+        self.assertEqual('"v1"', server.requests[1].headers["If-None-Match"])
+        self.assertEqual({"fresh": 0, "revalidated": 1, "downloaded": 1},
+                         self.session.get_adapter("https://").stats)
+
+    def test_changed_response_downloaded(self):
+        server = FakeServer()
+        self.get(server)
+        server.body, server.etag = b'{"items": [1]}', '"v2"'
+
+        self.assertEqual({"items": [1]}, self.get(server).json())
+        self.assertEqual({"items": [1]}, self.get(server).json())
+        self.assertEqual(3, len(server.requests))
+
+    def test_fresh_response_not_requested(self):
+        server = FakeServer(etag=None, cache_control="max-age=3600")
+
+        self.get(server)
+        response = self.get(server)
+
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual({"items": []}, response.json())
+
+    def test_private_response_not_shared_between_users(self):
+        self.get(FakeServer(body=b'{"items": ["first"]}', etag=None, cache_control="private, max-age=3600"))
+        server = FakeServer(body=b'{"items": ["second"]}', etag=None, cache_control="private, max-age=3600")
+
+        response = self.get(server, token="token2")
+
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual({"items": ["second"]}, response.json())
+        self.assertEqual({"items": ["first"]}, self.get(server).json())
+
+    def test_public_response_shared_between_users(self):
+        self.get(FakeServer(etag=None, cache_control="max-age=3600"))
+        server = FakeServer(etag=None, cache_control="max-age=3600")
+
+        self.get(server, token="token2")
+
+        self.assertEqual(0, len(server.requests))
+
+    def test_no_store_not_cached(self):
+        server = FakeServer(cache_control="no-store")
+
+        self.get(server)
+        self.get(server)
+
+        self.assertNotIn("If-None-Match", server.requests[1].headers)
+        self.assertEqual([], os.listdir(self.temp_dir.name))
+
+    def test_cache_kept_between_sessions(self):
+        self.get(FakeServer())
+        session = create_cached_session(HTTPCache(self.temp_dir.name, max_size_mb=1))
+        server = FakeServer()
+
+        with patch.object(HTTPAdapter, "send", autospec=True, side_effect=server.send):
+            self.assertEqual({"items": []}, session.get(URL, headers={"Authorization": "Bearer token1"}).json())
+        self.assertEqual('"v1"', server.requests[0].headers["If-None-Match"])
+
+
+class TestHTTPCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                patch("spotify_cache.time.time", side_effect=itertools.count()):
+            cache = HTTPCache(directory, max_size_mb=2.5 / 1024)
+            body = b"x" * 700
+
+            cache.put("https://example.com/0", 200, {}, body, 0)
+            cache.put("https://example.com/1", 200, {}, body, 0)
+            cache.get("https://example.com/0")
+            cache.put("https://example.com/2", 200, {}, body, 0)
+
+            self.assertIsNotNone(cache.get("https://example.com/0"))
+            self.assertIsNone(cache.get("https://example.com/1"))
+            self.assertIsNotNone(cache.get("https://example.com/2"))
+            self.assertEqual(2, len(os.listdir(directory)))
+            self.assertLessEqual(cache.size, cache.max_size)
+
+
+class TestFreshnessLifetime(unittest.TestCase):
+    def test_directives(self):
+        self.assertEqual(0, freshness_lifetime({"Cache-Control": "private, max-age=0"}))
+        self.assertEqual(60, freshness_lifetime({"Cache-Control": "public, max-age=60"}))
+        self.assertEqual(0, freshness_lifetime({"Cache-Control": "no-cache, max-age=60"}))
+        self.assertIsNone(freshness_lifetime({"Cache-Control": "no-store"}))
+        self.assertEqual(0, freshness_lifetime({}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import patch
-from spotify_helper import SpotifyHelper
+from spotify_helper import SpotifyHelper, compact_track
 
 class TestSpotifyHelperTrackLimit(unittest.TestCase):
 
@@ -65,3 +65,40 @@ class TestSpotifyHelperTrackLimit(unittest.TestCase):
         track_outside_date_limit = {"added_at": "2019-12-31T00:00:00Z"}
 
         self.assertFalse(self.spotify_helper._is_track_within_date_and_track_limit(liked_songs, track_outside_date_limit))
+
+
+class TestCompactTrack(unittest.TestCase):
+    def test_keeps_only_used_fields(self):
+        item = {
+            "added_at": "2024-01-01T00:00:00Z",
+            "is_local": False,
+            "track": {
+                "id": "track1",
+                "name": "Solar System",
+                "artists": [{"name": "Sub Focus", "id": "artist1", "uri": "spotify:artist:artist1"}],
+                "album": {"name": "Torus", "available_markets": ["GB"] * 180,
+                          "images": [{"url": "640.jpg", "height": 640}, {"url": "300.jpg", "height": 300},
+                                     {"url": "64.jpg", "height": 64}]},
+                "available_markets": ["GB"] * 180,
+                "popularity": 50,
+                "duration_ms": 215000,
+                "external_ids": {"isrc": "GB0000000001"},
+            },
+        }
+
+        self.assertEqual({
+            "added_at": "2024-01-01T00:00:00Z",
+            "track": {
+                "id": "track1",
+                "name": "Solar System",
+                "artists": [{"name": "Sub Focus"}],
+                "album": {"name": "Torus", "images": [{"url": "640.jpg"}, {"url": "300.jpg"}]},
+                "popularity": 50,
+                "duration_ms": 215000,
+                "external_ids": {"isrc": "GB0000000001"},
+            },
+        }, compact_track(item))
+
+    def test_skips_local_and_removed_tracks(self):
+        self.assertIsNone(compact_track({"track": None}))
+        self.assertIsNone(compact_track({"track": {"id": None, "name": "Local file"}}))
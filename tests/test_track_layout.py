@@ -0,0 +1,177 @@
+import json
+import os
+import tempfile
+import unittest
+import urllib.parse
+
+from mutagen.id3 import ID3, TIT2, TPE1
+
+import parse_serato_crates
+from dj_libraries.serato_database import SeratoDatabase
+from garbage_collector import PlaylistMembership
+from track_layout import TrackLayout, LayoutMigration, MIGRATION_JOURNAL_FILE
+
+
+class TestTrackLayout(unittest.TestCase):
+    def test_sharded(self):
+        layout = TrackLayout("sharded")
+        path = layout.track_path("4uLU6hMCjMI75M1A2tKUQC", "Sub Focus", "Solar System")
+
+        shard, file_name = os.path.split(path)
+        self.assertEqual(2, len(shard))
+        self.assertEqual(shard, shard.lower())
+        self.assertEqual("Sub Focus - Solar System [4uLU6hMCjMI75M1A2tKUQC]", file_name)
+        self.assertEqual(path, layout.track_path("4uLU6hMCjMI75M1A2tKUQC", "Sub Focus", "Solar System"))
+
+    def test_same_title_different_tracks(self):
+        layout = TrackLayout("sharded")
+
+        self.assertNotEqual(layout.track_path("track1", "Artist", "Intro"),
+                            layout.track_path("track2", "Artist", "Intro"))
+
+    def test_template(self):
+        layout = TrackLayout("{artist_initial}/{artist}/{title} [{spotify_id}]")
+
+        self.assertEqual(os.path.join("S", "Sub Focus", "Solar System [track1]"),
+                         layout.track_path("track1", "Sub Focus", "Solar System"))
+        self.assertEqual(os.path.join("#", "!!!", "Unknown [track1]"), layout.track_path("track1", "!!!", "?"))
+
+    def test_unsafe_names(self):
+        path = TrackLayout("sharded").track_path("track1", "AC/DC", "What? " + "x" * 300)
+
+        self.assertEqual(2, len(path.split(os.sep)))
+        self.assertLess(len(os.path.basename(path)), 200)
+
+    def test_invalid_templates(self):
+        with self.assertRaises(ValueError):
+            TrackLayout("{artist} - {title}")
+        with self.assertRaises(ValueError):
+            TrackLayout("{album}/{spotify_id}")
+
+    def test_flat(self):
+        self.assertTrue(TrackLayout(None).is_flat)
+        self.assertTrue(TrackLayout("flat").is_flat)
+        self.assertFalse(TrackLayout("sharded").is_flat)
+
+
+class TestLayoutMigration(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.drive = self.temp_dir.name
+        for folder in ("Tracks", os.path.join("_Serato_", "Subcrates"), "Rekordbox"):
+            os.makedirs(os.path.join(self.drive, folder))
+
+        self.layout = TrackLayout("{artist} - {title} [{spotify_id}]")
+        self.old_path = self.create_track("Solar System.mp3", "Sub Focus, Kele", "Solar System")
+        self.new_path = os.path.join(self.drive, "Tracks", "Sub Focus - Solar System [track1].mp3")
+        self.user_track = os.path.join(self.drive, "Music", "User Track.mp3")
+
+        self.save_json("id_to_video_map.json", {"track2": self.index_path(self.old_path),
+                                                "track1": self.index_path(self.old_path),
+                                                "custom": "https://www.youtube.com/watch?v=custom"})
+        self.save_json("video_id_map.json", {"video1": self.index_path(self.old_path)})
+        membership = PlaylistMembership(self.drive)
+        membership.record_playlist("Playlist", [self.old_path])
+        membership.save()
+
+        self.save_crate("PySync DJ%%Playlist.crate", [self.old_path])
+        self.save_crate("My Crate.crate", [self.user_track, self.old_path])
+        serato_database = SeratoDatabase(self.drive, "_Serato_\\Subcrates")
+        serato_database.entries += [("otrk", [("pfil", serato_database.serato_path(path)), ("tsng", "Track")])
+                                    for path in (self.user_track, self.old_path)]
+        serato_database.save()
+
+        with open(os.path.join(self.drive, "Rekordbox", "Playlist.m3u"), "w") as file:
+            file.write(f"#EXTM3U\n{self.old_path}\n")
+        with open(os.path.join(self.drive, "Rekordbox", "PySyncLibrary.xml"), "w") as file:
+            file.write(f"<string>file://localhost/{urllib.parse.quote(self.old_path)}</string>\n")
+
+        self.migration = LayoutMigration(self.drive, "Tracks", self.layout, "_Serato_\\Subcrates", "Rekordbox")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def index_path(file_path):
+        return os.path.splitdrive(file_path)[1]
+
+    def create_track(self, name, artist, title):
+        file_path = os.path.join(self.drive, "Tracks", name)
+        with open(file_path, "wb") as file:
+            file.write(b"\xff\xfb\x90\x00" + bytes(413))
+        tags = ID3()
+        tags.add(TPE1(encoding=3, text=artist))
+        tags.add(TIT2(encoding=3, text=title))
+        tags.save(file_path)
+        return file_path
+
+    def save_json(self, file_name, data):
+        with open(os.path.join(self.drive, file_name), "w") as file:
+            json.dump(data, file)
+
+    def load_json(self, file_name):
+        with open(os.path.join(self.drive, file_name), "r") as file:
+            return json.load(file)
+
+    def save_crate(self, file_name, file_paths):
+        crate = [("vrsn", "1.0/Serato ScratchLive Crate")]
+        crate += [("otrk", [("ptrk", self.index_path(file_path))]) for file_path in file_paths]
+        with open(os.path.join(self.drive, "_Serato_", "Subcrates", file_name), "wb") as file:
+            file.write(parse_serato_crates.encode_struct(crate))
+
+    def load_crate_tracks(self, file_name):
+        with open(os.path.join(self.drive, "_Serato_", "Subcrates", file_name), "rb") as file:
+            crate = parse_serato_crates.decode_struct(file.read())
+        return [dict(fields)["ptrk"] for tag, fields in crate if tag == "otrk"]
+
+    def test_plan(self):
+        self.assertEqual({self.index_path(self.old_path): self.index_path(self.new_path)}, self.migration.plan())
+
+    def test_dry_run_changes_nothing(self):
+        self.migration.apply(self.migration.plan())
+
+        self.assertTrue(os.path.isfile(self.old_path))
+        self.assertFalse(os.path.exists(os.path.join(self.drive, MIGRATION_JOURNAL_FILE)))
+
+    def test_apply(self):
+        self.assertEqual(1, self.migration.apply(self.migration.plan(), dry_run=False))
+
+        self.assertFalse(os.path.exists(self.old_path))
+        self.assertTrue(os.path.isfile(self.new_path))
+        self.assertEqual({"track1": self.index_path(self.new_path), "track2": self.index_path(self.new_path),
+                          "custom": "https://www.youtube.com/watch?v=custom"}, self.load_json("id_to_video_map.json"))
+        self.assertEqual({"video1": self.index_path(self.new_path)}, self.load_json("video_id_map.json"))
+        self.assertEqual({"Playlist": [self.index_path(self.new_path)]}, PlaylistMembership(self.drive).playlists)
+        self.assertEqual([self.index_path(self.new_path)], self.load_crate_tracks("PySync DJ%%Playlist.crate"))
+        self.assertEqual([self.index_path(self.user_track), self.index_path(self.new_path)],
+                         self.load_crate_tracks("My Crate.crate"))
+
+        serato_database = SeratoDatabase(self.drive, "_Serato_\\Subcrates")
+        self.assertEqual([serato_database.serato_path(self.user_track), serato_database.serato_path(self.new_path)],
+                         [dict(fields)["pfil"] for tag, fields in serato_database.entries if tag == "otrk"])
+
+        with open(os.path.join(self.drive, "Rekordbox", "Playlist.m3u"), "r") as file:
+            self.assertEqual(["#EXTM3U", self.new_path], file.read().splitlines())
+        with open(os.path.join(self.drive, "Rekordbox", "PySyncLibrary.xml"), "r") as file:
+            self.assertIn(urllib.parse.quote(self.new_path), file.read())
+        self.assertFalse(os.path.exists(os.path.join(self.drive, MIGRATION_JOURNAL_FILE)))
+
+        self.assertEqual({}, LayoutMigration(self.drive, "Tracks", self.layout, "_Serato_\\Subcrates",
+                                             "Rekordbox").plan())
+
+    def test_resumes_interrupted_migration(self):
+        moves = self.migration.plan()
+        self.save_json(MIGRATION_JOURNAL_FILE, moves)
+        # Cut short after moving the file, before anything was rewritten
+        os.replace(self.old_path, self.new_path)
+
+        migration = LayoutMigration(self.drive, "Tracks", self.layout, "_Serato_\\Subcrates", "Rekordbox")
+        migration.apply(migration.plan(), dry_run=False)
+
+        self.assertEqual(self.index_path(self.new_path), self.load_json("id_to_video_map.json")["track1"])
+        self.assertEqual([self.index_path(self.new_path)], self.load_crate_tracks("PySync DJ%%Playlist.crate"))
+        self.assertFalse(os.path.exists(os.path.join(self.drive, MIGRATION_JOURNAL_FILE)))
+
+
+if __name__ == "__main__":
+    unittest.main()
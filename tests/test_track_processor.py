@@ -0,0 +1,190 @@
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cancellation import CancellationToken, SyncCancelled
+from candidate_ranking import VideoCandidate
+from concurrency import create_stage_limiters
+from event_queue import EventQueueLogger
+from track_layout import TrackLayout
+from track_processor import TrackProcessor, WorkerContext, process_track
+from yt_download_helper import StreamRejectedError
+
+TRACK = {"track": {"id": "track1", "name": "Solar System", "artists": [{"name": "Sub Focus"}],
+                   "duration_ms": 215000}}
+
+
+class TestTrackProcessorCandidates(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.drive = self.temp_dir.name
+        settings = {"dj_library_drive": self.drive, "tracks_folder": "tracks", "max_duration_ratio": 2}
+        stage_limiters = create_stage_limiters({"search": 1, "download": 1, "transcode": 1})
+        self.search_cache = {}
+        self.context = WorkerContext(settings, threading.Lock(), {}, {}, self.search_cache, queue.Queue(),
+                                     stage_limiters, CancellationToken(threading.Event(), threading.Event()))
+        self.processor = TrackProcessor(TRACK, self.context, EventQueueLogger(self.context.event_queue))
+
+        self.ytd_helper = self.processor.ytd_helper = MagicMock(max_duration_ratio=2)
+        self.ytd_helper.video_from_id.side_effect = lambda video_id: MagicMock(video_id=video_id)
+        self.ytd_helper.search_candidates.return_value = [
+            VideoCandidate("mix", "Sub Focus - Solar System (1 Hour)", "Mixes", 3600, 0),
+            VideoCandidate("rejected", "Sub Focus - Solar System", "Sub Focus", 215, 1),
+            VideoCandidate("accepted", "Sub Focus - Solar System", "Sub Focus - Topic", 215, 2),
+        ]
+        self.context.convert_to_mp3 = MagicMock(side_effect=lambda path: os.path.splitext(path)[0] + ".mp3")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def download_audio_stream(self, video, expected_duration, cancel_token=None, file_name=None):
+        if video.video_id == "rejected":
+            raise StreamRejectedError("too large")
+        return os.path.join(self.drive, "tracks", f"{video.video_id}.mp4")
+
+    @patch("track_processor.set_track_metadata")
+    def test_moves_to_next_candidate_when_rejected(self, set_track_metadata):
+        self.ytd_helper.download_audio_stream.side_effect = self.download_audio_stream
+        # Rank the verified "- Topic" upload below the rejected one
+        self.ytd_helper.search_candidates.return_value[2] = self.ytd_helper.search_candidates.return_value[2]._replace(
+            channel="Uploader", title="Solar System")
+
+        track_file_path = self.processor.download_track(TRACK)
+
+        downloaded_videos = [call.args[0].video_id for call in self.ytd_helper.download_audio_stream.call_args_list]
+        self.assertEqual(["rejected", "accepted"], downloaded_videos)
+        self.assertTrue(self.processor.downloaded)
+        self.assertEqual(os.path.join(self.drive, "tracks", "accepted.mp3"), track_file_path)
+        self.assertEqual({"track1": "accepted"}, self.search_cache)
+        set_track_metadata.assert_called_once_with(TRACK, track_file_path, "accepted", None)
+
+    @patch("track_processor.set_track_metadata")
+    def test_analysis_written_with_tags(self, set_track_metadata):
+        self.ytd_helper.download_audio_stream.side_effect = self.download_audio_stream
+        self.context.settings["analyse_audio"] = True
+        self.context.analyse_audio = MagicMock(return_value="analysis")
+
+        track_file_path = self.processor.download_track(TRACK)
+
+        self.context.analyse_audio.assert_called_once_with(track_file_path)
+        set_track_metadata.assert_called_once_with(TRACK, track_file_path, "accepted", "analysis")
+
+    @patch("track_processor.set_track_metadata")
+    def test_failed_analysis_keeps_track(self, set_track_metadata):
+        self.ytd_helper.download_audio_stream.side_effect = self.download_audio_stream
+        self.context.settings["analyse_audio"] = True
+        self.context.analyse_audio = MagicMock(side_effect=RuntimeError("ffmpeg failed"))
+
+        track_file_path = self.processor.download_track(TRACK)
+
+        set_track_metadata.assert_called_once_with(TRACK, track_file_path, "accepted", None)
+
+    def test_every_candidate_rejected(self):
+        self.ytd_helper.download_audio_stream.side_effect = StreamRejectedError("too large")
+
+        with self.assertRaises(StreamRejectedError):
+            self.processor.download_track(TRACK)
+
+        # The hour long mix is dropped on its listed duration without being loaded
+        self.assertNotIn("mix", [call.args[0] for call in self.ytd_helper.video_from_id.call_args_list])
+        self.assertEqual({}, self.search_cache)
+
+    @patch("track_processor.set_track_metadata")
+    def test_cached_result_tried_before_searching(self, set_track_metadata):
+        self.search_cache["track1"] = "cached"
+        self.ytd_helper.download_audio_stream.side_effect = self.download_audio_stream
+
+        self.processor.download_track(TRACK)
+
+        self.ytd_helper.search_candidates.assert_not_called()
+
+    @patch("track_processor.set_track_metadata")
+    def test_track_layout_names_file(self, set_track_metadata):
+        self.processor.track_layout = TrackLayout("{artist} - {title} [{spotify_id}]")
+        self.ytd_helper.download_audio_stream.side_effect = self.download_audio_stream
+
+        self.processor.download_track(TRACK)
+
+        self.assertEqual("Sub Focus - Solar System [track1]",
+                         self.ytd_helper.download_audio_stream.call_args.args[3])
+
+    @patch("track_processor.set_track_metadata")
+    def test_sends_stage_metrics(self, set_track_metadata):
+        self.processor.event_logger.metrics = True
+        self.ytd_helper.download_audio_stream.side_effect = self.download_audio_stream
+
+        self.processor.download_track(TRACK)
+
+        events = []
+        while not self.context.event_queue.empty():
+            event_type, data = self.context.event_queue.get()
+            if event_type == "metric" and data[0] == "stage":
+                events.append(data[1:])
+        self.assertEqual([("search", "queued"), ("search", "started"), ("search", "completed"),
+                          ("download", "queued"), ("download", "started"), ("download", "failed"),
+                          ("download", "queued"), ("download", "started"), ("download", "completed"),
+                          ("transcode", "queued"), ("transcode", "started"), ("transcode", "completed")], events)
+
+    @patch("track_processor.set_track_metadata")
+    def test_linked_video_is_not_a_download(self, set_track_metadata):
+        existing_file_path = os.path.join(self.drive, "tracks", "accepted.mp3")
+        os.makedirs(os.path.dirname(existing_file_path))
+        open(existing_file_path, "wb").close()
+        self.context.video_to_file_map["accepted"] = existing_file_path
+        self.ytd_helper.search_candidates.return_value = self.ytd_helper.search_candidates.return_value[2:]
+
+        self.assertEqual(existing_file_path, self.processor.download_track(TRACK))
+        self.assertFalse(self.processor.downloaded)
+        self.ytd_helper.download_audio_stream.assert_not_called()
+
+    @patch("track_processor.set_track_metadata")
+    def test_links_video_waiting_in_staging_directory(self, set_track_metadata):
+        staging_dir = os.path.join(self.drive, "staging")
+        self.processor.staging_dir = staging_dir
+        drive_file_path = os.path.join(self.drive, "tracks", "accepted.mp3")
+        staged_file_path = os.path.join(staging_dir, "tracks", "accepted.mp3")
+        os.makedirs(os.path.dirname(staged_file_path))
+        open(staged_file_path, "wb").close()
+        self.context.video_to_file_map["accepted"] = os.path.splitdrive(drive_file_path)[1]
+        self.ytd_helper.search_candidates.return_value = self.ytd_helper.search_candidates.return_value[2:]
+
+        self.assertEqual(drive_file_path, self.processor.download_track(TRACK))
+        self.assertFalse(self.processor.downloaded)
+        self.ytd_helper.download_audio_stream.assert_not_called()
+
+    def test_cancelled_track_returns_none(self):
+        self.context.cancel_token.cancel()
+
+        self.assertIsNone(process_track(TRACK, self.context))
+        self.ytd_helper.search_candidates.assert_not_called()
+
+    @patch("track_processor.set_track_metadata")
+    def test_cancel_before_transcode(self, set_track_metadata):
+        def download_then_cancel(video, expected_duration, cancel_token, file_name):
+            cancel_token.cancel()
+            return self.download_audio_stream(video, expected_duration)
+
+        self.ytd_helper.download_audio_stream.side_effect = download_then_cancel
+
+        with self.assertRaises(SyncCancelled):
+            self.processor.download_track(TRACK)
+
+        self.context.convert_to_mp3.assert_not_called()
+        self.assertEqual({}, self.context.id_to_video_map)
+
+
+class TestWorkerContextAnalysis(unittest.TestCase):
+    def test_analyses_in_worker_profiler(self):
+        settings = {"profile_directory": "profiles", "profile_memory": False}
+        context = WorkerContext(settings, threading.Lock(), {}, {}, {}, queue.Queue(), {},
+                                CancellationToken(threading.Event(), threading.Event()))
+
+        with patch("audio_analysis.analyse_file", return_value="analysis") as mock_analyse, \
+                patch("track_processor.run_profiled") as mock_run_profiled:
+            self.assertEqual("analysis", context.analyse_audio("track.mp3"))
+
+        mock_analyse.assert_called_once_with("track.mp3")
+        mock_run_profiled.assert_not_called()
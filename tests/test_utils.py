@@ -1,8 +1,10 @@
 import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
 
-from utils import extract_spotify_playlist_id, load_hashmap_from_json
+from utils import extract_spotify_playlist_id, load_hashmap_from_json, write_file_if_changed
 
 
 class TestExtractSpotifyPlaylistID(unittest.TestCase):
@@ -71,4 +73,36 @@ class TestLoadHashmapFromJson(unittest.TestCase):
         mock_exists.return_value = True  # Simulate the file exists
         result = load_hashmap_from_json("/fake/drive", "test.json")
         self.assertEqual(result, {})  # Verify the empty dictionary is loaded
-        mock_file.assert_called_once_with("/fake/drive\\test.json", 'r')
\ No newline at end of file
+        mock_file.assert_called_once_with("/fake/drive\\test.json", 'r')
+
+
+class TestWriteFileIfChanged(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "sub", "test.crate")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_writes_new_file(self):
+        self.assertTrue(write_file_if_changed(self.file_path, b"crate data"))
+        with open(self.file_path, "rb") as file:
+            self.assertEqual(b"crate data", file.read())
+
+    def test_skips_unchanged_file(self):
+        write_file_if_changed(self.file_path, b"crate data")
+        mtime = os.path.getmtime(self.file_path)
+
+        self.assertFalse(write_file_if_changed(self.file_path, b"crate data"))
+        self.assertEqual(mtime, os.path.getmtime(self.file_path))
+
+    def test_rewrites_changed_file(self):
+        write_file_if_changed(self.file_path, b"crate data")
+
+        self.assertTrue(write_file_if_changed(self.file_path, b"other data"))
+        with open(self.file_path, "rb") as file:
+            self.assertEqual(b"other data", file.read())
+
+    def test_no_temp_file_left_behind(self):
+        write_file_if_changed(self.file_path, b"crate data")
+        self.assertEqual(["test.crate"], os.listdir(os.path.dirname(self.file_path)))
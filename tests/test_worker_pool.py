@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from worker_pool import WorkerPool
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.drive = self.temp_dir.name
+        self.worker_pool = WorkerPool(None, max_workers=2, execution_mode="thread", transcode_workers=1)
+
+    def tearDown(self):
+        self.worker_pool.shutdown()
+        self.temp_dir.cleanup()
+
+    def write_index(self, index, mtime):
+        index_path = os.path.join(self.drive, "id_to_video_map.json")
+        with open(index_path, "w") as file:
+            json.dump(index, file)
+        os.utime(index_path, (mtime, mtime))
+
+    def test_reused_across_syncs(self):
+        executor = self.worker_pool.executor
+
+        self.worker_pool.configure(2, "thread", 1)
+        self.assertIs(executor, self.worker_pool.executor)
+
+        with patch.object(WorkerPool, "warm_up"):
+            self.worker_pool.configure(3, "thread", 1)
+        self.assertIsNot(executor, self.worker_pool.executor)
+        self.assertEqual(3, self.worker_pool.max_workers)
+
+    def test_reloads_index_when_file_changes(self):
+        self.write_index({"track1": "tracks/a.mp3"}, mtime=1000)
+        self.worker_pool.load_track_index(self.drive)
+        self.worker_pool.id_to_video_map["track2"] = "tracks/b.mp3"
+
+        # Unchanged, so the index from the last sync is kept
+        self.worker_pool.load_track_index(self.drive)
+        self.assertIn("track2", self.worker_pool.id_to_video_map)
+
+        # A custom URL added between syncs
+        self.write_index({"track1": "https://www.youtube.com/watch?v=custom"}, mtime=2000)
+        self.worker_pool.load_track_index(self.drive)
+        self.assertEqual({"track1": "https://www.youtube.com/watch?v=custom"}, self.worker_pool.id_to_video_map)
+
+    def test_loads_drive_without_index(self):
+        self.worker_pool.load_track_index(self.drive)
+
+        self.assertEqual({}, self.worker_pool.id_to_video_map)
+        self.assertEqual(self.drive, self.worker_pool.loaded_drive)
+
+    def test_submit_and_shutdown(self):
+        with patch("worker_pool.process_track", return_value="tracks/a.mp3"):
+            self.assertEqual("tracks/a.mp3", self.worker_pool.submit({}, None).result())
+
+        self.worker_pool.shutdown()
+
+        with self.assertRaises(RuntimeError):
+            self.worker_pool.submit({}, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import MagicMock
+
+from yt_download_helper import YouTubeDownloadHelper, StreamRejectedError
+
+
+def create_video(length=215, filesize=3_500_000, bitrate=130_000):
+    video = MagicMock(video_id="video1", length=length)
+    audio_stream = MagicMock(_filesize=filesize, bitrate=bitrate)
+    return video, audio_stream
+
+
+class TestCheckStream(unittest.TestCase):
+    def setUp(self):
+        self.helper = YouTubeDownloadHelper("drive", "tracks", max_duration_ratio=2, max_file_size_mb=50)
+
+    def test_accepts_matching_stream(self):
+        self.helper.check_stream(*create_video(), expected_duration=215)
+
+    def test_rejects_long_video(self):
+        with self.assertRaises(StreamRejectedError):
+            self.helper.check_stream(*create_video(length=3 * 60 * 60), expected_duration=215)
+
+    def test_rejects_short_video(self):
+        with self.assertRaises(StreamRejectedError):
+            self.helper.check_stream(*create_video(length=30), expected_duration=215)
+
+    def test_no_expected_duration_skips_duration_check(self):
+        self.helper.check_stream(*create_video(length=3 * 60 * 60, filesize=1000), expected_duration=None)
+
+    def test_rejects_large_file(self):
+        with self.assertRaises(StreamRejectedError):
+            self.helper.check_stream(*create_video(filesize=200 * 1024 * 1024), expected_duration=None)
+
+    def test_estimates_size_from_bitrate(self):
+        # 2 hours at 160kbps is about 144MB
+        with self.assertRaises(StreamRejectedError):
+            self.helper.check_stream(*create_video(length=2 * 60 * 60, filesize=0, bitrate=160_000),
+                                     expected_duration=None)
+
+    def test_long_track_allows_larger_file(self):
+        # An hour long mix at 160kbps is about 69MB, within what an hour needs at the highest bitrate
+        self.helper.check_stream(*create_video(length=60 * 60, filesize=0, bitrate=160_000), expected_duration=60 * 60)
+        with self.assertRaises(StreamRejectedError):
+            self.helper.check_stream(*create_video(length=60 * 60, filesize=200 * 1024 * 1024),
+                                     expected_duration=60 * 60)
+
+    def test_no_limits(self):
+        helper = YouTubeDownloadHelper("drive", "tracks")
+        helper.check_stream(*create_video(length=3 * 60 * 60, filesize=200 * 1024 * 1024), expected_duration=215)